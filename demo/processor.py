@@ -13,6 +13,7 @@ from hivision.creator.layout_calculator import (
     generate_layout_image,
 )
 from hivision.creator.choose_handler import choose_handler
+from hivision.inference_cache import cached_matting_handler, cached_detection_handler
 from hivision.plugin.template.template_calculator import generte_template_photo
 from demo.utils import range_check
 import gradio as gr
@@ -134,6 +135,9 @@ class IDPhotoProcessor:
         # 创建IDCreator实例并设置处理器
         creator = IDCreator()
         choose_handler(creator, matting_model_option, face_detect_option)
+        # 同一张图只调整参数时复用抠图与人脸检测结果
+        creator.matting_handler = cached_matting_handler(creator.matting_handler)
+        creator.detection_handler = cached_detection_handler(creator.detection_handler)
 
         # 生成证件照
         try:
@@ -1,22 +1,56 @@
-from fastapi import FastAPI, UploadFile, Form, File
+from fastapi import FastAPI, UploadFile, Form, File, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from hivision import IDCreator
-from hivision.error import FaceError
+from hivision.creator.context import Params
+from hivision.error import FaceError, APIError
 from hivision.creator.layout_calculator import (
     generate_layout_array,
     generate_layout_image,
 )
-from hivision.creator.choose_handler import choose_handler
+from hivision.creator.choose_handler import (
+    get_matting_handler,
+    get_detection_handler,
+    warmup_models,
+)
+from hivision.executor import BoundedExecutor
+from hivision.plugin.beauty.handler import BEAUTY_REGIONS
+from hivision.metrics import METRICS
+from hivision.responses import (
+    negotiate_format,
+    negotiate_image_format,
+    failure_response,
+    image_result,
+    idphoto_result,
+    outputs_result,
+)
+from hivision.creator import handler_name
+from hivision.inference_cache import (
+    INFERENCE_CACHE,
+    image_hash,
+    cached_matting_handler,
+    cached_detection_handler,
+)
+from hivision.session_store import Session, SessionStore
+from hivision.batch_scheduler import (
+    create_schedulers,
+    prepare_image,
+    precomputed_matting_handler,
+    precomputed_detection_handler,
+)
 from hivision.utils import (
     add_background,
     resize_image_to_kb,
-    bytes_2_base64,
     base64_2_numpy,
     hex_to_rgb,
     add_watermark,
-    save_image_dpi_to_bytes,
+    encode_image,
 )
 import numpy as np
 import cv2
+import os
+import time
+import json
+import asyncio
 from starlette.middleware.cors import CORSMiddleware
 from starlette.formparsers import MultiPartParser
 
@@ -25,8 +59,30 @@ MultiPartParser.max_part_size = 10 * 1024 * 1024  # 10MB
 # 设置Starlette文件上传大小限制
 MultiPartParser.max_file_size = 20 * 1024 * 1024   # 20MB
 
+# 多尺寸输出时一次请求最多的额外尺寸数
+MAX_SIZES = 8
+
+# 编码耗时记录在 encode 阶段
+encode_image = METRICS.timed("encode", encode_image)
+resize_image_to_kb = METRICS.timed("encode", resize_image_to_kb)
+
 app = FastAPI()
+# 所有请求共享一个 creator，处理者在每次调用时单独传入，creator 本身不保存请求状态
 creator = IDCreator()
+# CPU 密集的解码、推理、编码放到有界线程池中执行，避免阻塞事件循环
+# 通过 HIVISION_MAX_WORKERS、HIVISION_MAX_QUEUE 配置，队列已满时返回 429
+api_executor = BoundedExecutor.from_env()
+# 抠图与人脸检测的微批调度器，短时间内到达的请求合并为一次推理
+# 通过 HIVISION_BATCH_MAX_SIZE、HIVISION_BATCH_MAX_WAIT_MS 配置，等待中的请求计入 api_executor 的排队深度
+matting_scheduler, detection_scheduler = create_schedulers(api_executor)
+# 编辑会话，通过 HIVISION_SESSION_TTL、HIVISION_SESSION_MAX 配置
+session_store = SessionStore()
+# 会话中可以引用的证件照
+SESSION_IMAGES = ("standard", "hd")
+# 一站式接口可以返回的图像
+PIPELINE_OUTPUTS = ("standard", "hd", "layout")
+# 背景渲染模式，与 render 参数的取值一一对应
+RENDER_MODES = ("pure_color", "updown_gradient", "center_gradient")
 
 # 添加 CORS 中间件 解决跨域问题
 app.add_middleware(
@@ -40,9 +96,342 @@ app.add_middleware(
 )
 
 
+@app.exception_handler(APIError)
+async def api_error_handler(request: Request, exc: APIError):
+    headers = {"Retry-After": "1"} if exc.status_code in (429, 503) else None
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"status": False, "error": str(exc)},
+        headers=headers,
+    )
+
+
+async def read_input_image(input_image, input_image_base64, flags=cv2.IMREAD_COLOR):
+    """
+    读取上传的图像，base64 优先，解码在执行器中进行
+    """
+    if input_image_base64:
+        return await api_executor.run(
+            METRICS.timed("decode", base64_2_numpy), input_image_base64
+        )
+    image_bytes = await input_image.read()
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    return await api_executor.run(METRICS.timed("decode", cv2.imdecode), nparr, flags)
+
+
+async def cached_matting(matting_handler, img, image_key):
+    """
+    抠图，命中推理缓存时直接返回缓存结果（只读），否则进入调度器
+    :param image_key: img 的内容哈希，为 None 时不使用缓存
+    """
+    if image_key is None:
+        return await matting_scheduler.submit(matting_handler, img)
+    model = handler_name(matting_handler)
+    matting_image = await api_executor.run(INFERENCE_CACHE.get_matting, image_key, model)
+    if matting_image is None:
+        matting_image = await matting_scheduler.submit(matting_handler, img)
+        await api_executor.run(
+            INFERENCE_CACHE.put_matting, image_key, model, matting_image
+        )
+    return matting_image
+
+
+async def cached_detection(detection_handler, img, image_key):
+    """
+    人脸检测，命中推理缓存时直接返回缓存结果，否则进入调度器
+    :param image_key: img 的内容哈希，为 None 时不使用缓存
+    """
+    if image_key is None:
+        return await detection_scheduler.submit(detection_handler, img)
+    detector = handler_name(detection_handler)
+    face = INFERENCE_CACHE.get_face(image_key, detector)
+    if face is None:
+        face = await detection_scheduler.submit(detection_handler, img)
+        INFERENCE_CACHE.put_face(image_key, detector, face)
+    return face
+
+
+async def prepare_inference_image(img):
+    """
+    与 IDCreator 相同地 resize 图像，并在开启推理缓存时计算内容哈希
+    :return: (img, image_key)
+    """
+    img = await api_executor.run(prepare_image, img)
+    if not INFERENCE_CACHE.enabled:
+        return img, None
+    return img, await api_executor.run(image_hash, img)
+
+
+async def read_rgb_image(input_image, input_image_base64):
+    """
+    读取上传的图像并转换为 RGB 三通道，上传文件与 base64 的处理一致
+    """
+    img = await read_input_image(input_image, input_image_base64)
+    if img.ndim == 3 and img.shape[2] == 4:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+async def idphoto_handlers(img, human_matting_model, face_detect_model, crop_first):
+    """
+    resize 图像并完成抠图与人脸检测，人脸数量不为 1 时抛出 FaceError
+    :return: (img, matting_handler, detection_handler)，处理者可直接交给 IDCreator
+    """
+    # ------------------- 选择抠图与人脸检测模型 -------------------
+    matting_handler = get_matting_handler(human_matting_model)
+    detection_handler = get_detection_handler(face_detect_model)
+
+    img, image_key = await prepare_inference_image(img)
+    # 同一张图已推理过时直接使用缓存，否则抠图与人脸检测分别进入调度器排队，
+    # 与其他请求合并推理；先裁剪时只对裁剪区域抠图，抠图在 IDCreator 中进行
+    if crop_first:
+        face = await cached_detection(detection_handler, img, image_key)
+        matting_handler = cached_matting_handler(matting_handler)
+    else:
+        matting_image, face = await asyncio.gather(
+            cached_matting(matting_handler, img, image_key),
+            cached_detection(detection_handler, img, image_key),
+        )
+        matting_handler = precomputed_matting_handler(matting_image)
+    # 人脸矫正后在旋转后的图像上重新检测
+    redetect_handler = cached_detection_handler(detection_handler)
+    return (
+        img,
+        matting_handler,
+        precomputed_detection_handler(face, redetect_handler),
+    )
+
+
+def get_session(session_id: str) -> Session:
+    """
+    按 ID 取得会话，不存在或已过期时返回 404
+    """
+    session = session_store.get(session_id)
+    if session is None:
+        raise APIError("session 不存在或已过期", 404)
+    return session
+
+
+def session_input(session_id: str, session_image: str, stage: str) -> np.ndarray:
+    """
+    取得会话中的证件照作为接口输入
+    :param session_image: standard / hd
+    :param stage: photos 为透明证件照，backgrounds 为添加背景后的证件照
+    """
+    if session_image not in SESSION_IMAGES:
+        raise APIError(f"session_image 可选值为 {', '.join(SESSION_IMAGES)}", 400)
+    images = getattr(get_session(session_id), stage)
+    if session_image not in images:
+        previous = "/idphoto 或 /human_matting" if stage == "photos" else "/add_background"
+        raise APIError(f"会话中还没有该图像，请先调用 {previous}", 409)
+    return images[session_image]
+
+
+def parse_sizes(sizes: str, head_top_range):
+    """
+    解析多尺寸参数，sizes 为 JSON 数组，每项包含 height、width 与可选的
+    head_measure_ratio、head_height_ratio、top_distance_max、top_distance_min
+    :param head_top_range: 本次请求的 (top_distance_max, top_distance_min)，未指定时沿用
+    :return: IDCreator 的 variants 参数
+    """
+    if not sizes:
+        return None
+    try:
+        items = json.loads(sizes)
+        if not isinstance(items, list) or len(items) > MAX_SIZES:
+            raise ValueError
+        variants = []
+        for item in items:
+            variant = {"size": (int(item["height"]), int(item["width"]))}
+            for key in ("head_measure_ratio", "head_height_ratio"):
+                if key in item:
+                    variant[key] = float(item[key])
+            if "top_distance_max" in item or "top_distance_min" in item:
+                variant["head_top_range"] = (
+                    float(item.get("top_distance_max", head_top_range[0])),
+                    float(item.get("top_distance_min", head_top_range[1])),
+                )
+            variants.append(variant)
+        # 尺寸与参数名的检查与 IDCreator 一致
+        Params(variants=variants)
+    except (ValueError, KeyError, TypeError):
+        raise APIError(
+            f"sizes 应为最多 {MAX_SIZES} 项的 JSON 数组，每项包含正整数 height、width", 400
+        )
+    return variants
+
+
+def parse_outputs(outputs: str):
+    """
+    解析一站式接口的 outputs 参数，逗号分隔，保持顺序并去重
+    """
+    names = []
+    for name in (outputs or "").split(","):
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+    if not names or any(name not in PIPELINE_OUTPUTS for name in names):
+        raise APIError(
+            f"outputs 应为逗号分隔的 {', '.join(PIPELINE_OUTPUTS)}", 400
+        )
+    return names
+
+
+def render_photo(image, color, render_mode, watermark=None):
+    """
+    为透明证件照添加背景色与水印
+    :param image: RGBA 证件照
+    :param color: 背景色，与 image 的通道顺序一致（RGB）
+    :param watermark: add_watermark 的关键字参数，为 None 时不加水印
+    :return: RGB 图像
+    """
+    result_image = add_background(image, bgr=color, mode=render_mode).astype(np.uint8)
+    if watermark:
+        result_image = add_watermark(result_image, **watermark)
+    return result_image
+
+
+def encode_later(image, image_format, dpi):
+    """
+    返回在执行器中编码 image 的协程函数，供响应按需调用
+    """
+
+    async def encode():
+        return await api_executor.run(encode_image, image, image_format, dpi)
+
+    return encode
+
+
+def variant_results(result, hd, image_format, dpi, color_code=None):
+    """
+    把 Result.variants 转换为 idphoto_result 的 variants 参数
+    :param color_code: 编码前的颜色转换，如 cv2.COLOR_RGBA2BGRA
+    """
+    variants = []
+    for variant in result.variants or []:
+        standard, hd_image = variant.standard, variant.hd
+        if color_code is not None:
+            standard = cv2.cvtColor(standard, color_code)
+            hd_image = cv2.cvtColor(hd_image, color_code) if hd else None
+        variants.append(
+            {
+                "height": standard.shape[0],
+                "width": standard.shape[1],
+                "encode_standard": encode_later(standard, image_format, dpi),
+                "encode_hd": encode_later(hd_image, image_format, dpi) if hd else None,
+            }
+        )
+    return variants
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start_time = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # 使用路由模板作为标签，避免未匹配的路径产生大量时间序列
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        METRICS.inc("hivision_requests_total", path=path, status=status_code)
+        METRICS.observe(
+            "hivision_request_seconds", time.perf_counter() - start_time, path=path
+        )
+
+
+# Prometheus 指标接口
+@app.get("/metrics")
+async def metrics():
+    METRICS.set_gauge("hivision_executor_in_flight", api_executor.in_flight)
+    METRICS.set_gauge("hivision_executor_queue_depth", api_executor.queue_depth)
+    return PlainTextResponse(
+        METRICS.render_prometheus(), media_type="text/plain; version=0.0.4"
+    )
+
+
+# 健康检查接口，不经过执行器，服务繁忙时也能及时响应
+@app.get("/health")
+async def health():
+    return {
+        "status": True,
+        "in_flight": api_executor.in_flight,
+        "queue_depth": api_executor.queue_depth,
+        "max_workers": api_executor.max_workers,
+        "max_queue": api_executor.max_queue,
+    }
+
+
+@app.on_event("shutdown")
+def shutdown():
+    api_executor.shutdown(wait=False)
+
+
+# 启动时预热模型，例如 HIVISION_WARMUP_MODELS=hivision_modnet,retinaface-resnet50
+@app.on_event("startup")
+def warmup():
+    model_names = os.getenv("HIVISION_WARMUP_MODELS")
+    if model_names:
+        warmup_models([name.strip() for name in model_names.split(",") if name.strip()])
+
+
+# 创建编辑会话接口
+@app.post("/session")
+async def create_session(
+    input_image: UploadFile = File(None),
+    input_image_base64: str = Form(None),
+    human_matting_model: str = Form("modnet_photographic_portrait_matting"),
+    face_detect_model: str = Form("mtcnn"),
+):
+    img = await read_rgb_image(input_image, input_image_base64)
+
+    matting_handler = get_matting_handler(human_matting_model)
+    detection_handler = get_detection_handler(face_detect_model)
+
+    img, image_key = await prepare_inference_image(img)
+    matting_image, face = await asyncio.gather(
+        cached_matting(matting_handler, img, image_key),
+        cached_detection(detection_handler, img, image_key),
+        return_exceptions=True,
+    )
+    if isinstance(matting_image, BaseException):
+        raise matting_image
+    # 人脸数量不为 1 时仍然创建会话，可用于人像抠图与换底
+    face_error = face if isinstance(face, FaceError) else None
+    if isinstance(face, BaseException) and face_error is None:
+        raise face
+
+    session_id = session_store.create(
+        Session(
+            image=img,
+            matting_image=matting_image,
+            face=None if face_error else face,
+            face_error=face_error,
+            detection_handler=cached_detection_handler(detection_handler),
+        )
+    )
+    return {
+        "status": True,
+        "session_id": session_id,
+        "expires_in": session_store.ttl,
+        "face_detected": face_error is None,
+    }
+
+
+# 删除编辑会话接口
+@app.delete("/session/{session_id}")
+async def delete_session(session_id: str):
+    if not session_store.delete(session_id):
+        raise APIError("session 不存在或已过期", 404)
+    return {"status": True}
+
+
 # 证件照智能制作接口
 @app.post("/idphoto")
 async def idphoto_inference(
+    request: Request,
     input_image: UploadFile = File(None),
     input_image_base64: str = Form(None),
     height: int = Form(413),
@@ -61,25 +450,49 @@ async def idphoto_inference(
     contrast_strength: float = Form(0),
     sharpen_strength: float = Form(0),
     saturation_strength: float = Form(0),
+    beauty_region: str = Form("full"),
+    crop_first: bool = Form(False),
+    sizes: str = Form(None),
+    session_id: str = Form(None),
 ):  
-    # 如果传入了base64，则直接使用base64解码
-    if input_image_base64:
-        img = base64_2_numpy(input_image_base64)
-    # 否则使用上传的图片
-    else:
-        image_bytes = await input_image.read()
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        # 将BGR转换为RGB
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-    # ------------------- 选择抠图与人脸检测模型 -------------------
-    choose_handler(creator, human_matting_model, face_detect_model)
+    if beauty_region not in BEAUTY_REGIONS:
+        raise APIError(f"beauty_region 可选值为 {', '.join(BEAUTY_REGIONS)}", 400)
+    variants = parse_sizes(sizes, (top_distance_max, top_distance_min))
+    accept = request.headers.get("accept")
+    response_format = negotiate_format(accept)
+    image_format = negotiate_image_format(accept, response_format)
 
     # 将字符串转为元组
     size = (int(height), int(width))
+    if session_id:
+        # 使用会话中保存的图像、抠图与人脸检测结果，不再推理
+        session = get_session(session_id)
+        if session.face is None:
+            return failure_response(response_format, {"status": False})
+        img = session.image
+        matting_handler = precomputed_matting_handler(session.matting_image)
+        detection_handler = precomputed_detection_handler(
+            session.face, session.detection_handler
+        )
+        crop_first = False
+    else:
+        session = None
+        # 如果传入了base64，则直接使用base64解码，否则使用上传的图片
+        img = await read_input_image(input_image, input_image_base64)
+        if not input_image_base64:
+            # 将BGR转换为RGB
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+        try:
+            img, matting_handler, detection_handler = await idphoto_handlers(
+                img, human_matting_model, face_detect_model, crop_first
+            )
+        except FaceError:
+            return failure_response(response_format, {"status": False})
+
     try:
-        result = creator(
+        result = await api_executor.run(
+            creator,
             img,
             size=size,
             head_measure_ratio=head_measure_ratio,
@@ -91,120 +504,157 @@ async def idphoto_inference(
             contrast_strength=contrast_strength,
             sharpen_strength=sharpen_strength,
             saturation_strength=saturation_strength,
+            beauty_region=beauty_region,
+            crop_first=crop_first,
+            variants=variants,
+            matting_handler=matting_handler,
+            detection_handler=detection_handler,
         )
     except FaceError:
-        result_message = {"status": False}
-    # 如果检测到人脸数量等于1, 则返回标准证和高清照结果（png 4通道图像）
-    else:
-        result_image_standard_bytes = save_image_dpi_to_bytes(result.standard, None, dpi)
-        
-        result_message = {
-            "status": True,
-            "image_base64_standard": bytes_2_base64(result_image_standard_bytes),
-        }
+        return failure_response(response_format, {"status": False})
+
+    if session is not None:
+        # 与客户端解码返回的 PNG 得到的图像一致，可直接作为 /add_background 的输入
+        session.set_photos(
+            cv2.cvtColor(result.standard, cv2.COLOR_RGBA2BGRA),
+            cv2.cvtColor(result.hd, cv2.COLOR_RGBA2BGRA),
+        )
 
-        # 如果hd为True, 则增加高清照结果（png 4通道图像）
-        if hd:
-            result_image_hd_bytes = save_image_dpi_to_bytes(result.hd, None, dpi)
-            result_message["image_base64_hd"] = bytes_2_base64(result_image_hd_bytes)
+    # 如果检测到人脸数量等于1, 则返回标准证和高清照结果（png 4通道图像）
+    result_image_standard_bytes = await api_executor.run(
+        encode_image, result.standard, image_format, dpi
+    )
 
-    return result_message
+    # 如果hd为True, 则增加高清照结果（png 4通道图像）
+    return await idphoto_result(
+        response_format,
+        result_image_standard_bytes,
+        encode_later(result.hd, image_format, dpi) if hd else None,
+        variant_results(result, hd, image_format, dpi),
+        executor=api_executor,
+    )
 
 
 # 人像抠图接口
 @app.post("/human_matting")
 async def human_matting_inference(
+    request: Request,
     input_image: UploadFile = File(None),
     input_image_base64: str = Form(None),
     human_matting_model: str = Form("hivision_modnet"),
     dpi: int = Form(300),
+    session_id: str = Form(None),
 ):
-    if input_image_base64:
-        img = base64_2_numpy(input_image_base64)
+    accept = request.headers.get("accept")
+    response_format = negotiate_format(accept)
+    image_format = negotiate_image_format(accept, response_format)
+    if session_id:
+        # 会话中的图像为 RGB，转换为本接口使用的 BGR
+        session = get_session(session_id)
+        img = cv2.cvtColor(session.image, cv2.COLOR_RGB2BGR)
+        matting_image = cv2.cvtColor(session.matting_image, cv2.COLOR_RGBA2BGRA)
     else:
-        image_bytes = await input_image.read()
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        session = None
+        img = await read_input_image(input_image, input_image_base64)
 
-    # ------------------- 选择抠图与人脸检测模型 -------------------
-    choose_handler(creator, human_matting_model, None)
+        # ------------------- 选择抠图与人脸检测模型 -------------------
+        matting_handler = get_matting_handler(human_matting_model)
 
+        img, image_key = await prepare_inference_image(img)
+        matting_image = await cached_matting(matting_handler, img, image_key)
     try:
-        result = creator(
+        result = await api_executor.run(
+            creator,
             img,
             change_bg_only=True,
+            matting_handler=precomputed_matting_handler(matting_image),
         )
     except FaceError:
-        result_message = {"status": False}
+        return failure_response(response_format, {"status": False})
 
-    else:
-        result_image_standard_bytes = save_image_dpi_to_bytes(cv2.cvtColor(result.standard, cv2.COLOR_RGBA2BGRA), None, dpi)
-        result_message = {
-            "status": True,
-            "image_base64": bytes_2_base64(result_image_standard_bytes),
-        }
-    return result_message
+    if session is not None:
+        session.set_photos(result.standard, result.standard)
+
+    result_image_standard_bytes = await api_executor.run(
+        encode_image,
+        cv2.cvtColor(result.standard, cv2.COLOR_RGBA2BGRA),
+        image_format,
+        dpi,
+    )
+    return await image_result(response_format, result_image_standard_bytes)
 
 
 # 透明图像添加纯色背景接口
 @app.post("/add_background")
 async def photo_add_background(
+    request: Request,
     input_image: UploadFile = File(None),
     input_image_base64: str = Form(None),
     color: str = Form("000000"),
     kb: int = Form(None),
     dpi: int = Form(300),
     render: int = Form(0),
+    session_id: str = Form(None),
+    session_image: str = Form("standard"),
 ):
-    render_choice = ["pure_color", "updown_gradient", "center_gradient"]
+    accept = request.headers.get("accept")
+    response_format = negotiate_format(accept)
+    image_format = negotiate_image_format(accept, response_format)
 
-    if input_image_base64:
-        img = base64_2_numpy(input_image_base64)
+    if session_id:
+        img = session_input(session_id, session_image, "photos")
     else:
-        image_bytes = await input_image.read()
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_UNCHANGED)
+        img = await read_input_image(
+            input_image, input_image_base64, cv2.IMREAD_UNCHANGED
+        )
 
     color = hex_to_rgb(color)
     color = (color[2], color[1], color[0])
 
-    result_image = add_background(
-        img,
-        bgr=color,
-        mode=render_choice[render],
+    result_image = (
+        await api_executor.run(
+            add_background,
+            img,
+            bgr=color,
+            mode=RENDER_MODES[render],
+        )
     ).astype(np.uint8)
+    if session_id:
+        # 供后续 /generate_layout_photos、/watermark、/set_kb 引用
+        get_session(session_id).backgrounds[session_image] = result_image
 
     result_image = cv2.cvtColor(result_image, cv2.COLOR_RGB2BGR)
     if kb:
-        result_image_bytes = resize_image_to_kb(result_image, None, int(kb), dpi=dpi)
+        result_image_bytes = await api_executor.run(
+            resize_image_to_kb, result_image, None, int(kb), dpi=dpi, return_info=True
+        )
     else:
-        result_image_bytes = save_image_dpi_to_bytes(result_image, None, dpi=dpi)
-
-    result_messgae = {
-        "status": True,
-        "image_base64": bytes_2_base64(result_image_bytes),
-    }
+        result_image_bytes = await api_executor.run(
+            encode_image, result_image, image_format, dpi=dpi
+        )
 
-    return result_messgae
+    return await image_result(response_format, result_image_bytes)
 
 
 # 六寸排版照生成接口
 @app.post("/generate_layout_photos")
 async def generate_layout_photos(
+    request: Request,
     input_image: UploadFile = File(None),
     input_image_base64: str = Form(None),
     height: int = Form(413),
     width: int = Form(295),
     kb: int = Form(None),
     dpi: int = Form(300),
+    session_id: str = Form(None),
 ):
-    # try:
-    if input_image_base64:
-        img = base64_2_numpy(input_image_base64)
+    accept = request.headers.get("accept")
+    response_format = negotiate_format(accept)
+    image_format = negotiate_image_format(accept, response_format)
+    if session_id:
+        img = session_input(session_id, "standard", "backgrounds")
     else:
-        image_bytes = await input_image.read()
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        img = await read_input_image(input_image, input_image_base64)
 
     size = (int(height), int(width))
 
@@ -212,31 +662,34 @@ async def generate_layout_photos(
         input_height=size[0], input_width=size[1]
     )
 
-    result_layout_image = generate_layout_image(
-        img, typography_arr, typography_rotate, height=size[0], width=size[1]
+    result_layout_image = (
+        await api_executor.run(
+            generate_layout_image,
+            img,
+            typography_arr,
+            typography_rotate,
+            height=size[0],
+            width=size[1],
+        )
     ).astype(np.uint8)
 
     result_layout_image = cv2.cvtColor(result_layout_image, cv2.COLOR_RGB2BGR)
     if kb:
-        result_layout_image_bytes = resize_image_to_kb(
-            result_layout_image, None, int(kb), dpi=dpi
+        result_layout_image_bytes = await api_executor.run(
+            resize_image_to_kb, result_layout_image, None, int(kb), dpi=dpi, return_info=True
         )
     else:
-        result_layout_image_bytes = save_image_dpi_to_bytes(result_layout_image, None, dpi=dpi)
+        result_layout_image_bytes = await api_executor.run(
+            encode_image, result_layout_image, image_format, dpi=dpi
+        )
         
-    result_layout_image_base64 = bytes_2_base64(result_layout_image_bytes)
-
-    result_messgae = {
-        "status": True,
-        "image_base64": result_layout_image_base64,
-    }
-
-    return result_messgae
+    return await image_result(response_format, result_layout_image_bytes, "layout")
 
 
 # 透明图像添加水印接口
 @app.post("/watermark")
 async def watermark(
+    request: Request,
     input_image: UploadFile = File(None),
     input_image_base64: str = Form(None),
     text: str = Form("Hello"),
@@ -247,73 +700,76 @@ async def watermark(
     space: int = 25,
     kb: int = Form(None),
     dpi: int = Form(300),
+    session_id: str = Form(None),
+    session_image: str = Form("standard"),
 ):
-    if input_image_base64:
-        img = base64_2_numpy(input_image_base64)
+    accept = request.headers.get("accept")
+    response_format = negotiate_format(accept)
+    image_format = negotiate_image_format(accept, response_format)
+    if session_id:
+        img = session_input(session_id, session_image, "backgrounds")
     else:
-        image_bytes = await input_image.read()
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        img = await read_input_image(input_image, input_image_base64)
 
     try:
-        result_image = add_watermark(img, text, size, opacity, angle, color, space)
+        # add_watermark 按 RGB 绘制文字颜色，先转换输入的 BGR 图像，结果与 /idphoto_pipeline 一致
+        result_image = await api_executor.run(
+            add_watermark,
+            cv2.cvtColor(img, cv2.COLOR_BGR2RGB),
+            text,
+            size,
+            opacity,
+            angle,
+            color,
+            space,
+        )
 
-        result_image = cv2.cvtColor(result_image, cv2.COLOR_RGB2BGR)
         if kb:
-            result_image_bytes = resize_image_to_kb(result_image, None, int(kb), dpi=dpi)
+            result_image_bytes = await api_executor.run(
+                resize_image_to_kb, result_image, None, int(kb), dpi=dpi, return_info=True
+            )
         else:
-            result_image_bytes = save_image_dpi_to_bytes(result_image, None, dpi=dpi)
-        result_image_base64 = bytes_2_base64(result_image_bytes)
-
-        result_messgae = {
-            "status": True,
-            "image_base64": result_image_base64,
-        }
+            result_image_bytes = await api_executor.run(
+                encode_image, result_image, image_format, dpi=dpi
+            )
     except Exception as e:
-        result_messgae = {
-            "status": False,
-            "error": str(e),
-        }
+        return failure_response(response_format, {"status": False, "error": str(e)})
 
-    return result_messgae
+    return await image_result(response_format, result_image_bytes)
 
 
 # 设置照片KB值接口(RGB图)
 @app.post("/set_kb")
 async def set_kb(
+    request: Request,
     input_image: UploadFile = File(None),
     input_image_base64: str = Form(None),
     dpi: int = Form(300),
     kb: int = Form(50),
+    session_id: str = Form(None),
+    session_image: str = Form("standard"),
 ):
-    if input_image_base64:
-        img = base64_2_numpy(input_image_base64)
+    response_format = negotiate_format(request.headers.get("accept"))
+    if session_id:
+        img = session_input(session_id, session_image, "backgrounds")
     else:
-        image_bytes = await input_image.read()
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        img = await read_input_image(input_image, input_image_base64)
 
     try:
         result_image = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-        result_image_bytes = resize_image_to_kb(result_image, None, int(kb), dpi=dpi)
-        result_image_base64 = bytes_2_base64(result_image_bytes)
-
-        result_messgae = {
-            "status": True,
-            "image_base64": result_image_base64,
-        }
+        result_image_bytes = await api_executor.run(
+            resize_image_to_kb, result_image, None, int(kb), dpi=dpi, return_info=True
+        )
     except Exception as e:
-        result_messgae = {
-            "status": False,
-            "error": e,
-        }
+        return failure_response(response_format, {"status": False, "error": str(e)})
 
-    return result_messgae
+    return await image_result(response_format, result_image_bytes)
 
 
 # 证件照智能裁剪接口
 @app.post("/idphoto_crop")
 async def idphoto_crop_inference(
+    request: Request,
     input_image: UploadFile = File(None),
     input_image_base64: str = Form(None),
     height: int = Form(413),
@@ -325,45 +781,191 @@ async def idphoto_crop_inference(
     head_height_ratio: float = Form(0.45),
     top_distance_max: float = Form(0.12),
     top_distance_min: float = Form(0.10),
+    sizes: str = Form(None),
 ):
-    if input_image_base64:
-        img = base64_2_numpy(input_image_base64)
-    else:
-        image_bytes = await input_image.read()
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_UNCHANGED)  # 读取图像(4通道)
+    accept = request.headers.get("accept")
+    response_format = negotiate_format(accept)
+    image_format = negotiate_image_format(accept, response_format)
+    variants = parse_sizes(sizes, (top_distance_max, top_distance_min))
+    # 读取图像(4通道)
+    img = await read_input_image(input_image, input_image_base64, cv2.IMREAD_UNCHANGED)
 
     # ------------------- 选择抠图与人脸检测模型 -------------------
-    choose_handler(creator, face_detect_option=face_detect_model)
+    detection_handler = get_detection_handler(face_detect_model)
 
     # 将字符串转为元组
     size = (int(height), int(width))
     try:
-        result = creator(
+        result = await api_executor.run(
+            creator,
             img,
             size=size,
             head_measure_ratio=head_measure_ratio,
             head_height_ratio=head_height_ratio,
             head_top_range=(top_distance_max, top_distance_min),
             crop_only=True,
+            variants=variants,
+            detection_handler=detection_handler,
         )
     except FaceError:
-        result_message = {"status": False}
+        return failure_response(response_format, {"status": False})
+
     # 如果检测到人脸数量等于1, 则返回标准证和高清照结果（png 4通道图像）
-    else:
-        result_image_standard_bytes = save_image_dpi_to_bytes(cv2.cvtColor(result.standard, cv2.COLOR_RGBA2BGRA), None, dpi)
-        
-        result_message = {
-            "status": True,
-            "image_base64_standard": bytes_2_base64(result_image_standard_bytes),
+    result_image_standard_bytes = await api_executor.run(
+        encode_image,
+        cv2.cvtColor(result.standard, cv2.COLOR_RGBA2BGRA),
+        image_format,
+        dpi,
+    )
+
+    # 如果hd为True, 则增加高清照结果（png 4通道图像）
+    return await idphoto_result(
+        response_format,
+        result_image_standard_bytes,
+        (
+            encode_later(cv2.cvtColor(result.hd, cv2.COLOR_RGBA2BGRA), image_format, dpi)
+            if hd
+            else None
+        ),
+        variant_results(result, hd, image_format, dpi, cv2.COLOR_RGBA2BGRA),
+        executor=api_executor,
+    )
+
+
+# 证件照一站式制作接口：抠图、换底、加水印、排版与 KB 调整在一次请求中完成，
+# 中间结果不经过编码与传输
+@app.post("/idphoto_pipeline")
+async def idphoto_pipeline(
+    request: Request,
+    input_image: UploadFile = File(None),
+    input_image_base64: str = Form(None),
+    height: int = Form(413),
+    width: int = Form(295),
+    human_matting_model: str = Form("modnet_photographic_portrait_matting"),
+    face_detect_model: str = Form("mtcnn"),
+    dpi: int = Form(300),
+    face_align: bool = Form(False),
+    whitening_strength: int = Form(0),
+    head_measure_ratio: float = Form(0.2),
+    head_height_ratio: float = Form(0.45),
+    top_distance_max: float = Form(0.12),
+    top_distance_min: float = Form(0.10),
+    brightness_strength: float = Form(0),
+    contrast_strength: float = Form(0),
+    sharpen_strength: float = Form(0),
+    saturation_strength: float = Form(0),
+    beauty_region: str = Form("full"),
+    crop_first: bool = Form(False),
+    color: str = Form("000000"),
+    render: int = Form(0),
+    watermark_text: str = Form(None),
+    watermark_size: int = Form(20),
+    watermark_opacity: float = Form(0.5),
+    watermark_angle: int = Form(30),
+    watermark_color: str = Form("#000000"),
+    watermark_space: int = Form(25),
+    kb: int = Form(None),
+    layout_kb: int = Form(None),
+    outputs: str = Form("standard,layout"),
+):
+    if beauty_region not in BEAUTY_REGIONS:
+        raise APIError(f"beauty_region 可选值为 {', '.join(BEAUTY_REGIONS)}", 400)
+    if not 0 <= render < len(RENDER_MODES):
+        raise APIError(f"render 可选值为 0-{len(RENDER_MODES) - 1}", 400)
+    output_names = parse_outputs(outputs)
+    accept = request.headers.get("accept")
+    response_format = negotiate_format(accept)
+    image_format = negotiate_image_format(accept, response_format)
+
+    size = (int(height), int(width))
+    img = await read_rgb_image(input_image, input_image_base64)
+    try:
+        img, matting_handler, detection_handler = await idphoto_handlers(
+            img, human_matting_model, face_detect_model, crop_first
+        )
+        result = await api_executor.run(
+            creator,
+            img,
+            size=size,
+            head_measure_ratio=head_measure_ratio,
+            head_height_ratio=head_height_ratio,
+            head_top_range=(top_distance_max, top_distance_min),
+            face_alignment=face_align,
+            whitening_strength=whitening_strength,
+            brightness_strength=brightness_strength,
+            contrast_strength=contrast_strength,
+            sharpen_strength=sharpen_strength,
+            saturation_strength=saturation_strength,
+            beauty_region=beauty_region,
+            crop_first=crop_first,
+            matting_handler=matting_handler,
+            detection_handler=detection_handler,
+        )
+    except FaceError:
+        return failure_response(response_format, {"status": False})
+
+    # 证件照为 RGBA，背景色直接按 RGB 传入
+    color = hex_to_rgb(color)
+    watermark = None
+    if watermark_text:
+        watermark = {
+            "text": watermark_text,
+            "size": watermark_size,
+            "opacity": watermark_opacity,
+            "angle": watermark_angle,
+            "color": watermark_color,
+            "space": watermark_space,
         }
+    # 标准照也是排版照的输入，先完成背景与水印，出错时还未开始响应
+    standard = None
+    try:
+        if "standard" in output_names or "layout" in output_names:
+            standard = await api_executor.run(
+                render_photo, result.standard, color, RENDER_MODES[render], watermark
+            )
+    except Exception as e:
+        return failure_response(response_format, {"status": False, "error": str(e)})
+
+    async def encode(image, target_kb):
+        if target_kb:
+            return await api_executor.run(
+                resize_image_to_kb, image, None, int(target_kb), dpi=dpi, return_info=True
+            )
+        return await api_executor.run(encode_image, image, image_format, dpi=dpi)
+
+    async def encode_standard():
+        return await encode(standard, kb)
+
+    async def encode_hd():
+        hd = await api_executor.run(
+            render_photo, result.hd, color, RENDER_MODES[render], watermark
+        )
+        return await encode(hd, kb)
 
-        # 如果hd为True, 则增加高清照结果（png 4通道图像）
-        if hd:
-            result_image_hd_bytes = save_image_dpi_to_bytes(cv2.cvtColor(result.hd, cv2.COLOR_RGBA2BGRA), None, dpi)
-            result_message["image_base64_hd"] = bytes_2_base64(result_image_hd_bytes)
+    async def encode_layout():
+        typography_arr, typography_rotate = generate_layout_array(
+            input_height=size[0], input_width=size[1]
+        )
+        layout = await api_executor.run(
+            generate_layout_image,
+            standard,
+            typography_arr,
+            typography_rotate,
+            height=size[0],
+            width=size[1],
+        )
+        return await encode(layout.astype(np.uint8), layout_kb)
 
-    return result_message
+    encoders = {
+        "standard": encode_standard,
+        "hd": encode_hd,
+        "layout": encode_layout,
+    }
+    return await outputs_result(
+        response_format,
+        [(name, encoders[name]) for name in output_names],
+        executor=api_executor,
+    )
 
 
 if __name__ == "__main__":
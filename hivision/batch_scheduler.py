@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+r"""
+@DATE: 2026/10/18 14:05
+@File: batch_scheduler.py
+@IDE: pycharm
+@Description:
+    asyncio 侧的动态微批调度器：把短时间窗口内到达的抠图/人脸检测请求合并为一次批量推理，
+    再把每张图的结果分发回各自的请求
+"""
+import asyncio
+import os
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+from hivision.creator.context import Context, ContextHandler, Params
+from hivision.creator.human_matting import (
+    MATTING_BATCH_PIPELINES,
+    extract_human,
+    extract_human_batch,
+    extract_human_birefnet_lite,
+    extract_human_modnet_photographic_portrait_matting,
+    extract_human_rmbg,
+)
+from hivision.creator.utils import resize_image_esp
+from hivision.error import FaceError
+from hivision.executor import BoundedExecutor
+from hivision.metrics import METRICS
+
+# 处理者与批量抠图模型名称的对应关系，不在其中的处理者逐张执行
+MATTING_HANDLER_MODELS = {
+    extract_human: "hivision_modnet",
+    extract_human_modnet_photographic_portrait_matting: "modnet_photographic_portrait_matting",
+    extract_human_rmbg: "rmbg-1.4",
+    extract_human_birefnet_lite: "birefnet-v1-lite",
+}
+
+
+class MicroBatcher:
+    """
+    动态微批调度器，按 key（例如模型名称）分别排队。
+    队列达到 max_batch_size 时立即执行，否则最早的请求最多等待 max_wait_ms 后执行，
+    从而在提升吞吐的同时限制尾延迟。
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[Any, List[Any]], List[Any]],
+        max_batch_size: int = 4,
+        max_wait_ms: float = 10,
+        executor: Optional[BoundedExecutor] = None,
+    ):
+        """
+        :param batch_fn: 批处理函数 batch_fn(key, items) -> results，results 与 items 一一对应，
+                         某一项失败时可以在对应位置返回异常对象，只影响该请求
+        :param max_batch_size: 单批最大请求数
+        :param max_wait_ms: 单批最长等待时间（毫秒）
+        :param executor: 执行 batch_fn 的有界执行器。每个等待中的请求占用它的一个名额，
+                         计入排队深度，名额不足时 submit 抛出 APIError(429)。
+                         为 None 时使用事件循环默认的线程池且不限制排队
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max_wait_ms
+        self.executor = executor
+        self._queues: Dict[Any, list] = {}
+        self._timers: Dict[Any, asyncio.TimerHandle] = {}
+
+    async def submit(self, key, item):
+        """
+        提交一项任务并等待其结果
+        """
+        with self.executor.slot() if self.executor else nullcontext():
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            queue = self._queues.setdefault(key, [])
+            queue.append((item, future))
+
+            if len(queue) >= self.max_batch_size or self.max_wait_ms <= 0:
+                self._flush(key)
+            elif key not in self._timers:
+                self._timers[key] = loop.call_later(
+                    self.max_wait_ms / 1000, self._flush, key
+                )
+            return await future
+
+    def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._queues.pop(key, [])
+        if batch:
+            asyncio.get_running_loop().create_task(self._run(key, batch))
+
+    async def _run(self, key, batch):
+        loop = asyncio.get_running_loop()
+        items = [item for item, _ in batch]
+        # 批内各请求已在 submit 中占用名额，这里直接使用底层线程池
+        thread_pool = self.executor.executor if self.executor else None
+        try:
+            results = await loop.run_in_executor(
+                thread_pool, self.batch_fn, key, items
+            )
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, future), result in zip(batch, results):
+            # 请求可能已被取消（例如客户端断开）
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+def matting_batch_fn(matting_handler: ContextHandler, images: List[np.ndarray]):
+    """
+    抠图批处理函数，支持批量推理的模型合并为一次推理，其余模型逐张调用处理者
+    :param matting_handler: 抠图处理者，作为队列 key
+    :param images: 已 resize 到最大边长 2000 的图像列表
+    """
+    METRICS.observe("hivision_batch_size", len(images), queue="matting")
+    matting_model = MATTING_HANDLER_MODELS.get(matting_handler)
+    with METRICS.span("matting_batch", handler=matting_handler.__name__):
+        if matting_model in MATTING_BATCH_PIPELINES:
+            return extract_human_batch(images, matting_model, batch_size=len(images))
+
+        results = []
+        for image in images:
+            ctx = Context(Params())
+            ctx.processing_image = image
+            try:
+                matting_handler(ctx)
+                results.append(ctx.matting_image)
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+def detection_batch_fn(detection_handler: ContextHandler, images: List[np.ndarray]):
+    """
+    人脸检测批处理函数，MTCNN、Face++ 等检测器无法合并输入，
+    因此在同一次执行器调度中依次检测，节省线程切换与排队开销
+    :param detection_handler: 人脸检测处理者，作为队列 key
+    :param images: 已 resize 到最大边长 2000 的图像列表
+    """
+    METRICS.observe("hivision_batch_size", len(images), queue="detection")
+    results = []
+    with METRICS.span("detection_batch", handler=detection_handler.__name__):
+        for image in images:
+            ctx = Context(Params())
+            ctx.origin_image = image
+            try:
+                detection_handler(ctx)
+                results.append(dict(ctx.face))
+            except FaceError as e:
+                METRICS.inc("hivision_face_errors_total", face_num=e.face_num)
+                results.append(e)
+            except Exception as e:
+                results.append(e)
+    return results
+
+
+def precomputed_matting_handler(matting_image: np.ndarray) -> ContextHandler:
+    """
+    返回直接使用调度器抠图结果的处理者，供 IDCreator 调用。
+    结果不复制，需要原地修改时由修改方复制（见 beauty_face）
+    """
+
+    def precomputed_matting(ctx: Context):
+        ctx.processing_image = ctx.matting_image = matting_image
+
+    return precomputed_matting
+
+
+def precomputed_detection_handler(
+    face: dict, fallback: ContextHandler
+) -> ContextHandler:
+    """
+    返回首次调用时直接使用调度器检测结果的处理者。
+    人脸矫正后需要在旋转后的图像上重新检测，此时调用 fallback
+    """
+    state = {"used": False}
+
+    def precomputed_detection(ctx: Context):
+        if state["used"]:
+            return fallback(ctx)
+        state["used"] = True
+        ctx.face.update(face)
+
+    return precomputed_detection
+
+
+def prepare_image(image: np.ndarray) -> np.ndarray:
+    """
+    与 IDCreator 相同地将图像 resize 到最大边长 2000，保证调度器的推理结果与 IDCreator 内部坐标一致
+    """
+    return resize_image_esp(image, 2000)
+
+
+def create_schedulers(
+    executor: Optional[BoundedExecutor] = None,
+    max_batch_size: Optional[int] = None,
+    max_wait_ms: Optional[float] = None,
+):
+    """
+    根据环境变量创建抠图与人脸检测调度器：
+    HIVISION_BATCH_MAX_SIZE: 单批最大请求数，默认 4
+    HIVISION_BATCH_MAX_WAIT_MS: 单批最长等待时间（毫秒），默认 10，为 0 时不等待
+    """
+    if max_batch_size is None:
+        max_batch_size = int(os.getenv("HIVISION_BATCH_MAX_SIZE", 4))
+    if max_wait_ms is None:
+        max_wait_ms = float(os.getenv("HIVISION_BATCH_MAX_WAIT_MS", 10))
+    matting_scheduler = MicroBatcher(
+        matting_batch_fn, max_batch_size, max_wait_ms, executor
+    )
+    detection_scheduler = MicroBatcher(
+        detection_batch_fn, max_batch_size, max_wait_ms, executor
+    )
+    return matting_scheduler, detection_scheduler
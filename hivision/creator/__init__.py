@@ -7,16 +7,22 @@ r"""
 @Description:
     创建证件照
 """
+import copy
 import numpy as np
-from typing import Tuple
+from typing import List, Tuple
 import hivision.creator.utils as U
 from .context import Context, ContextHandler, Params, Result
 from .human_matting import extract_human
 from .face_detector import detect_face_mtcnn
 from hivision.plugin.beauty.handler import beauty_face
-from .photo_adjuster import adjust_photo
+from .photo_adjuster import adjust_photo, crop_first_region
+from hivision.error import FaceError
+from hivision.metrics import METRICS
 import cv2
-import time
+
+
+def handler_name(handler: ContextHandler) -> str:
+    return getattr(handler, "__name__", type(handler).__name__)
 
 
 class IDCreator:
@@ -46,8 +52,10 @@ class IDCreator:
         self.matting_handler: ContextHandler = extract_human
         self.detection_handler: ContextHandler = detect_face_mtcnn
         self.beauty_handler: ContextHandler = beauty_face
-        # 上下文
-        self.ctx = None
+        """
+        以上处理者仅作为默认值，调用时可通过参数单独指定，实例本身不保存任何单次调用的状态，
+        因此同一个 IDCreator 可以被多个线程同时调用
+        """
 
     def __call__(
         self,
@@ -66,6 +74,12 @@ class IDCreator:
         saturation_strength: int = 0,
         face_alignment: bool = False,
         horizontal_flip: bool = False,
+        beauty_region: str = "full",
+        crop_first: bool = False,
+        variants: List[dict] = None,
+        matting_handler: ContextHandler = None,
+        detection_handler: ContextHandler = None,
+        beauty_handler: ContextHandler = None,
     ) -> Result:
         """
         证件照处理函数
@@ -83,6 +97,14 @@ class IDCreator:
         :param sharpen_strength: 锐化强度
         :param face_alignment: 是否需要人脸矫正
         :param horizontal_flip: 是否需要水平翻转
+        :param beauty_region: 美颜区域，full 为整张图，matte 为人像抠图的外接矩形，face 为人脸及周边区域（在人脸检测之后进行）
+        :param crop_first: 是否先检测人脸、确定裁剪区域，再只对裁剪区域抠图与美颜，仅换底时无效
+        :param variants: 额外输出的尺寸，每项为包含 size 与可选的 head_measure_ratio、head_height_ratio、
+            head_top_range 的字典，未指定的比例沿用本次调用的参数。抠图、人脸检测与美颜只进行一次，
+            每个尺寸只重新裁剪缩放，结果在 Result.variants 中；仅换底时无效
+        :param matting_handler: 本次调用使用的抠图处理者，为 None 时使用 self.matting_handler
+        :param detection_handler: 本次调用使用的人脸检测处理者，为 None 时使用 self.detection_handler
+        :param beauty_handler: 本次调用使用的美颜处理者，为 None 时使用 self.beauty_handler
 
         :return: 返回处理后的证件照和一系列参数
         """
@@ -102,30 +124,52 @@ class IDCreator:
             saturation_strength=saturation_strength,
             face_alignment=face_alignment,
             horizontal_flip=horizontal_flip,
+            beauty_region=beauty_region,
+            crop_first=crop_first,
+            variants=variants,
         )
+        # 处理者只在本次调用内生效，不写回实例
+        matting_handler = matting_handler or self.matting_handler
+        detection_handler = detection_handler or self.detection_handler
+        beauty_handler = beauty_handler or self.beauty_handler
 
+        # 各阶段耗时记录到 hivision.metrics.METRICS
+        with METRICS.span("total"), METRICS.peak_memory("total"):
+            return self._run(
+                params, image, matting_handler, detection_handler, beauty_handler
+            )
 
-        # 总的开始时间
-        total_start_time = time.time()
-        
-        self.ctx = Context(params)
-        ctx = self.ctx
-        ctx.processing_image = image
-        ctx.processing_image = U.resize_image_esp(
-            ctx.processing_image, 2000
-        )  # 将输入图片 resize 到最大边长为 2000
-        ctx.origin_image = ctx.processing_image.copy()
+    def _run(
+        self,
+        params: Params,
+        image: np.ndarray,
+        matting_handler: ContextHandler,
+        detection_handler: ContextHandler,
+        beauty_handler: ContextHandler,
+    ) -> Result:
+        # 上下文为局部变量，避免并发调用之间互相覆盖
+        ctx = Context(params)
+        with METRICS.span("resize"):
+            ctx.processing_image = image
+            ctx.processing_image = U.resize_image_esp(
+                ctx.processing_image, 2000
+            )  # 将输入图片 resize 到最大边长为 2000
+            # 流水线只读取 origin_image，与 processing_image 共用同一个数组，不复制
+            ctx.origin_image = ctx.processing_image
         self.before_all and self.before_all(ctx)
 
+        # 仅换底时不需要人脸检测与裁剪，始终对整张图处理
+        if ctx.params.crop_first and not ctx.params.change_bg_only:
+            return self._run_crop_first(
+                ctx, matting_handler, detection_handler, beauty_handler
+            )
+
         # 1. ------------------人像抠图------------------
         # 如果仅裁剪，则不进行抠图
         if not ctx.params.crop_only:
             # 调用抠图工作流
-            print("[1]  Start Human Matting...")
-            start_matting_time = time.time()
-            self.matting_handler(ctx)
-            end_matting_time = time.time()
-            print(f"[1]  Human Matting Time: {end_matting_time - start_matting_time:.3f}s")
+            with METRICS.span("matting", handler=handler_name(matting_handler)):
+                matting_handler(ctx)
             self.after_matting and self.after_matting(ctx)
         # 如果进行抠图
         else:
@@ -133,11 +177,13 @@ class IDCreator:
 
 
         # 2. ------------------美颜------------------
-        print("[2]  Start Beauty...")
-        start_beauty_time = time.time()
-        self.beauty_handler(ctx)
-        end_beauty_time = time.time()
-        print(f"[2]  Beauty Time: {end_beauty_time - start_beauty_time:.3f}s")
+        # 仅对人脸区域美颜时需要人脸框，推迟到人脸检测之后；仅换底时不检测人脸，照常进行
+        beauty_after_detect = (
+            ctx.params.beauty_region == "face" and not ctx.params.change_bg_only
+        )
+        if not beauty_after_detect:
+            with METRICS.span("beauty"):
+                beauty_handler(ctx)
 
         # 如果仅换底，则直接返回抠图结果
         if ctx.params.change_bg_only:
@@ -153,41 +199,45 @@ class IDCreator:
             return ctx.result
 
         # 3. ------------------人脸检测------------------
-        print("[3]  Start Face Detection...")
-        start_detection_time = time.time()
-        self.detection_handler(ctx)
-        end_detection_time = time.time()
-        print(f"[3]  Face Detection Time: {end_detection_time - start_detection_time:.3f}s")
+        self._detect(ctx, detection_handler)
         self.after_detect and self.after_detect(ctx)
 
         # 3.1 ------------------人脸对齐------------------
         if ctx.params.face_alignment and abs(ctx.face["roll_angle"]) > 2:
-            print("[3.1]  Start Face Alignment...")
-            start_alignment_time = time.time()
-            from hivision.creator.rotation_adjust import rotate_bound_4channels
-
-            # 根据角度旋转原图和抠图
-            b, g, r, a = cv2.split(ctx.matting_image)
-            ctx.origin_image, ctx.matting_image, _, _, _, _ = rotate_bound_4channels(
-                cv2.merge((b, g, r)),
-                a,
-                -1 * ctx.face["roll_angle"],
-            )
+            from hivision.creator.rotation_adjust import rotate_bound
+
+            with METRICS.span("alignment"):
+                # 根据角度旋转抠图，四个通道一次旋转，结果与分别旋转颜色与 alpha 通道一致
+                ctx.matting_image, _, _, _, _ = rotate_bound(
+                    ctx.matting_image, -1 * ctx.face["roll_angle"]
+                )
+                ctx.origin_image = cv2.cvtColor(ctx.matting_image, cv2.COLOR_BGRA2BGR)
 
             # 旋转后再执行一遍人脸检测
-            self.detection_handler(ctx)
+            self._detect(ctx, detection_handler)
             self.after_detect and self.after_detect(ctx)
-            end_alignment_time = time.time()
-            print(f"[3.1]  Face Alignment Time: {end_alignment_time - start_alignment_time:.3f}s")
+
+        # 3.2 ------------------人脸区域美颜------------------
+        if beauty_after_detect:
+            with METRICS.span("beauty"):
+                beauty_handler(ctx)
 
         # 4. ------------------图像调整------------------
-        print("[4]  Start Image Post-Adjustment...")
-        start_adjust_time = time.time()
-        result_image_hd, result_image_standard, clothing_params, typography_params = (
-            adjust_photo(ctx)
-        )
-        end_adjust_time = time.time()
-        print(f"[4]  Image Post-Adjustment Time: {end_adjust_time - start_adjust_time:.3f}s")
+        return self._adjust(ctx)
+
+    def _adjust(self, ctx: Context, offset: Tuple[int, int] = (0, 0)) -> Result:
+        """
+        根据人脸位置裁剪、缩放得到标准照与高清照，并返回结果
+        :param offset: ctx.matting_image 左上角在整张图中的坐标，返回前把人脸坐标换回整张图坐标
+        """
+        with METRICS.span("adjust"):
+            result_image_hd, result_image_standard, clothing_params, typography_params = (
+                adjust_photo(ctx)
+            )
+        variants = self._adjust_variants(ctx) if ctx.params.variants else None
+        if offset != (0, 0):
+            left, top, width, height = ctx.face["rectangle"]
+            ctx.face["rectangle"] = (left + offset[0], top + offset[1], width, height)
 
         # 5. ------------------返回结果------------------
         ctx.result = Result(
@@ -197,11 +247,105 @@ class IDCreator:
             clothing_params=clothing_params,
             typography_params=typography_params,
             face=ctx.face,
+            variants=variants,
         )
         self.after_all and self.after_all(ctx)
 
-        # 总的结束时间
-        total_end_time = time.time()
-        print(f"[Total]  Total Time: {total_end_time - total_start_time:.3f}s")
-
         return ctx.result
+
+    @staticmethod
+    def _adjust_variants(ctx: Context) -> List[Result]:
+        """
+        用同一份抠图与人脸检测结果，按每个额外尺寸的参数裁剪缩放
+        """
+        variants = []
+        for params in ctx.params.variant_params():
+            variant_ctx = copy.copy(ctx)
+            variant_ctx.params = params
+            with METRICS.span("adjust"):
+                hd, standard, clothing_params, typography_params = adjust_photo(
+                    variant_ctx
+                )
+            variants.append(
+                Result(
+                    standard=standard,
+                    hd=hd,
+                    matting=ctx.matting_image,
+                    clothing_params=clothing_params,
+                    typography_params=typography_params,
+                    face=ctx.face,
+                )
+            )
+        return variants
+
+    def _run_crop_first(
+        self,
+        ctx: Context,
+        matting_handler: ContextHandler,
+        detection_handler: ContextHandler,
+        beauty_handler: ContextHandler,
+    ) -> Result:
+        """
+        先检测人脸，由人脸框计算最终裁剪可能用到的区域，只对该区域抠图与美颜。
+        人像在画面中占比越小，节省的计算越多；抠图模型看到的是裁剪区域，结果与整张图抠图略有不同。
+        ctx.face 与 Result.face 仍为整张图（resize 后）中的坐标，Result.matting 为裁剪区域的抠图结果
+        """
+        # 1. ------------------人脸检测------------------
+        # 检测器内部会在缩小后的图像上检测
+        self._detect(ctx, detection_handler)
+        self.after_detect and self.after_detect(ctx)
+
+        # 1.1 ------------------人脸对齐------------------
+        # 此时尚未抠图，只需旋转原图
+        if ctx.params.face_alignment and abs(ctx.face["roll_angle"]) > 2:
+            from hivision.creator.rotation_adjust import rotate_bound
+
+            with METRICS.span("alignment"):
+                ctx.processing_image, _, _, _, _ = rotate_bound(
+                    ctx.processing_image, -1 * ctx.face["roll_angle"]
+                )
+                ctx.origin_image = ctx.processing_image
+
+            # 旋转后再执行一遍人脸检测
+            self._detect(ctx, detection_handler)
+            self.after_detect and self.after_detect(ctx)
+
+        # 2. ------------------裁剪区域------------------
+        # 多尺寸输出时取所有尺寸裁剪区域的并集
+        regions = [
+            crop_first_region(ctx.face["rectangle"], params, ctx.processing_image.shape)
+            for params in [ctx.params, *ctx.params.variant_params()]
+        ]
+        x1, y1 = min(r[0] for r in regions), min(r[1] for r in regions)
+        x2, y2 = max(r[2] for r in regions), max(r[3] for r in regions)
+        ctx.processing_image = ctx.processing_image[y1:y2, x1:x2]
+        ctx.origin_image = ctx.processing_image
+        left, top, face_width, face_height = ctx.face["rectangle"]
+        ctx.face["rectangle"] = (left - x1, top - y1, face_width, face_height)
+
+        # 3. ------------------人像抠图------------------
+        if not ctx.params.crop_only:
+            with METRICS.span("matting", handler=handler_name(matting_handler)):
+                matting_handler(ctx)
+            self.after_matting and self.after_matting(ctx)
+        else:
+            ctx.matting_image = ctx.processing_image
+
+        # 4. ------------------美颜------------------
+        with METRICS.span("beauty"):
+            beauty_handler(ctx)
+
+        # 5. ------------------图像调整------------------
+        return self._adjust(ctx, offset=(x1, y1))
+
+    @staticmethod
+    def _detect(ctx: Context, detection_handler: ContextHandler):
+        """
+        执行人脸检测并记录耗时，人脸数量不为 1 时计数
+        """
+        try:
+            with METRICS.span("detection", handler=handler_name(detection_handler)):
+                detection_handler(ctx)
+        except FaceError as e:
+            METRICS.inc("hivision_face_errors_total", face_num=e.face_num)
+            raise
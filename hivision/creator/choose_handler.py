@@ -12,24 +12,64 @@ HUMAN_MATTING_MODELS = [
 FACE_DETECT_MODELS = ["face++ (联网Online API)", "mtcnn", "retinaface-resnet50"]
 
 
-def choose_handler(creator, matting_model_option=None, face_detect_option=None):
+def get_matting_handler(matting_model_option=None):
+    """
+    根据模型名称返回对应的抠图处理者，不修改任何对象，可在并发场景下按请求调用
+    """
     if matting_model_option == "modnet_photographic_portrait_matting":
-        creator.matting_handler = extract_human_modnet_photographic_portrait_matting
+        return extract_human_modnet_photographic_portrait_matting
     elif matting_model_option == "mnn_hivision_modnet":
-        creator.matting_handler = extract_human_mnn_modnet
+        return extract_human_mnn_modnet
     elif matting_model_option == "rmbg-1.4":
-        creator.matting_handler = extract_human_rmbg
+        return extract_human_rmbg
     elif matting_model_option == "birefnet-v1-lite":
-        creator.matting_handler = extract_human_birefnet_lite
+        return extract_human_birefnet_lite
     else:
-        creator.matting_handler = extract_human
+        return extract_human
+
 
+def get_detection_handler(face_detect_option=None):
+    """
+    根据模型名称返回对应的人脸检测处理者，不修改任何对象，可在并发场景下按请求调用
+    """
     if (
         face_detect_option == "face_plusplus"
         or face_detect_option == "face++ (联网Online API)"
     ):
-        creator.detection_handler = detect_face_face_plusplus
+        return detect_face_face_plusplus
     elif face_detect_option == "retinaface-resnet50":
-        creator.detection_handler = detect_face_retinaface
+        return detect_face_retinaface
     else:
-        creator.detection_handler = detect_face_mtcnn
+        return detect_face_mtcnn
+
+
+def choose_handler(creator, matting_model_option=None, face_detect_option=None):
+    """
+    为 creator 设置默认的抠图与人脸检测处理者。
+    注意该函数会修改 creator，多线程共享同一个 creator 时请改用
+    get_matting_handler / get_detection_handler 并在调用时传入处理者
+    """
+    creator.matting_handler = get_matting_handler(matting_model_option)
+    creator.detection_handler = get_detection_handler(face_detect_option)
+
+
+def warmup_models(model_names):
+    """
+    预加载并预热模型，通常在服务启动时调用，使首个请求不再承担加载开销
+    :param model_names: 模型名称列表，支持 HUMAN_MATTING_MODELS 中的 ONNX 抠图模型与 retinaface-resnet50
+    """
+    for model_name in model_names:
+        if model_name == "retinaface-resnet50":
+            checkpoint_path, set_cpu, input_size = RETINAFACE_WEIGHTS, False, (640, 640)
+        elif model_name in WEIGHTS and WEIGHTS[model_name].endswith(".onnx"):
+            # 与推理时保持一致，仅 birefnet 在 GPU 可用时使用 CUDA
+            checkpoint_path = WEIGHTS[model_name]
+            set_cpu = model_name != "birefnet-v1-lite" or ONNX_DEVICE != "GPU"
+            input_size = None
+        else:
+            raise ValueError(f"Unknown or non-ONNX model: {model_name}")
+
+        if not os.path.exists(checkpoint_path):
+            print(f"Checkpoint file not found: {checkpoint_path}")
+            continue
+        SESSION_REGISTRY.warmup(checkpoint_path, set_cpu=set_cpu, input_size=input_size)
@@ -7,9 +7,13 @@ r"""
 @Description:
     证件照创建上下文类，用于同步信息
 """
-from typing import Optional, Callable, Tuple
+import inspect
+from typing import Optional, Callable, Tuple, List
 import numpy as np
 
+# 多尺寸输出时每个尺寸可以单独指定的参数
+VARIANT_KEYS = ("size", "head_measure_ratio", "head_height_ratio", "head_top_range")
+
 
 class Params:
     def __init__(
@@ -28,6 +32,9 @@ class Params:
         saturation_strength: int = 0,
         face_alignment: bool = False,
         horizontal_flip: bool = False,
+        beauty_region: str = "full",
+        crop_first: bool = False,
+        variants: List[dict] = None,
     ):
         self.__size = size
         self.__change_bg_only = change_bg_only
@@ -43,6 +50,42 @@ class Params:
         self.__saturation_strength = saturation_strength
         self.__face_alignment = face_alignment
         self.__horizontal_flip = horizontal_flip
+        self.__beauty_region = beauty_region
+        self.__crop_first = crop_first
+        self.__variants = self._check_variants(variants)
+
+    @staticmethod
+    def _check_variants(variants):
+        if not variants:
+            return ()
+        for variant in variants:
+            unknown = set(variant) - set(VARIANT_KEYS)
+            if unknown:
+                raise ValueError(
+                    f"Unknown variant keys {sorted(unknown)}, expected {VARIANT_KEYS}"
+                )
+            size = variant.get("size")
+            if size is None or len(size) != 2 or min(size) <= 0:
+                raise ValueError(
+                    f"Variant size must be a positive (height, width), got {size}"
+                )
+        return tuple(dict(variant) for variant in variants)
+
+    def replace(self, **changes) -> "Params":
+        """
+        返回修改了部分参数的副本
+        """
+        names = list(inspect.signature(Params.__init__).parameters)[1:]
+        kwargs = {name: getattr(self, name) for name in names}
+        kwargs.update(changes)
+        return Params(**kwargs)
+
+    def variant_params(self) -> List["Params"]:
+        """
+        每个额外尺寸对应的参数，未指定的比例沿用当前参数
+        """
+        return [self.replace(variants=None, **variant) for variant in self.__variants]
+
     @property
     def size(self):
         return self.__size
@@ -99,6 +142,18 @@ class Params:
     def horizontal_flip(self):
         return self.__horizontal_flip
 
+    @property
+    def beauty_region(self):
+        return self.__beauty_region
+
+    @property
+    def crop_first(self):
+        return self.__crop_first
+
+    @property
+    def variants(self):
+        return self.__variants
+
 
 class Result:
     def __init__(
@@ -109,6 +164,7 @@ class Result:
         clothing_params: Optional[dict],
         typography_params: Optional[dict],
         face: Optional[Tuple[int, int, int, int, float]],
+        variants: Optional[List["Result"]] = None,
     ):
         self.standard = standard
         self.hd = hd
@@ -122,6 +178,10 @@ class Result:
         排版参数，仅换底时为 None
         """
         self.face = face
+        self.variants = variants
+        """
+        额外尺寸的结果，与 Params.variants 顺序一致，未指定额外尺寸时为 None
+        """
 
     def __iter__(self):
         return iter(
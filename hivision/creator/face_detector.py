@@ -17,15 +17,23 @@ from .context import Context
 from hivision.error import FaceError, APIError
 from hivision.utils import resize_image_to_kb_base64
 from hivision.creator.retinaface import retinaface_detect_faces
+from hivision.creator.session_registry import SESSION_REGISTRY
 import requests
 import cv2
 import os
+import threading
 import numpy as np
 
 
 mtcnn = None
+# 并发请求下只初始化一次 MTCNN
+mtcnn_lock = threading.Lock()
 base_dir = os.path.dirname(os.path.abspath(__file__))
-RETINAFCE_SESS = None
+RETINAFACE_WEIGHTS = os.path.join(
+    base_dir, "retinaface/weights/retinaface-resnet50.onnx"
+)
+# RetinaFace 检测分辨率的最大边长，默认与训练尺寸 840 一致，0 表示使用原图检测
+RETINAFACE_MAX_SIDE = int(os.getenv("HIVISION_RETINAFACE_MAX_SIDE", 840))
 
 
 def detect_face_mtcnn(ctx: Context, scale: int = 2):
@@ -37,7 +45,9 @@ def detect_face_mtcnn(ctx: Context, scale: int = 2):
     """
     global mtcnn
     if mtcnn is None:
-        mtcnn = MTCNN()
+        with mtcnn_lock:
+            if mtcnn is None:
+                mtcnn = MTCNN()
     image = cv2.resize(
         ctx.origin_image,
         (ctx.origin_image.shape[1] // scale, ctx.origin_image.shape[0] // scale),
@@ -162,31 +172,30 @@ def detect_face_face_plusplus(ctx: Context):
         )
 
 
-def detect_face_retinaface(ctx: Context):
+def detect_face_retinaface(ctx: Context, max_side: int = None):
     """
     基于RetinaFace模型的人脸检测处理器，只进行人脸数量的检测
     :param ctx: 上下文，此时已获取到原始图和抠图结果，但是我们只需要原始图
+    :param max_side: 检测分辨率的最大边长，为 None 时使用 RETINAFACE_MAX_SIDE，0 表示使用原图
     :raise FaceError: 人脸检测错误，多个人脸或者没有人脸
     """
-    from time import time
+    if max_side is None:
+        max_side = RETINAFACE_MAX_SIDE
 
-    global RETINAFCE_SESS
-
-    if RETINAFCE_SESS is None:
-        # 计算用时
-        tic = time()
-        faces_dets, sess = retinaface_detect_faces(
-            ctx.origin_image,
-            os.path.join(base_dir, "retinaface/weights/retinaface-resnet50.onnx"),
-            sess=None,
-        )
-        RETINAFCE_SESS = sess
-    else:
-        tic = time()
+    # 会话由注册表统一常驻与淘汰
+    sess = SESSION_REGISTRY.get(RETINAFACE_WEIGHTS)
+    # 只需判断是否恰好一个人脸，多个人脸时 NMS 提前结束
+    faces_dets, _ = retinaface_detect_faces(
+        ctx.origin_image,
+        RETINAFACE_WEIGHTS,
+        sess=sess,
+        max_side=max_side,
+        single_face=True,
+    )
+    if len(faces_dets) != 1 and max_side and max(ctx.origin_image.shape[:2]) > max_side:
+        # 保险措施，如果缩小后检测到多个人脸或者没有人脸，用原图再检测一次
         faces_dets, _ = retinaface_detect_faces(
-            ctx.origin_image,
-            os.path.join(base_dir, "retinaface/weights/retinaface-resnet50.onnx"),
-            sess=RETINAFCE_SESS,
+            ctx.origin_image, RETINAFACE_WEIGHTS, sess=sess, single_face=True
         )
 
     faces_num = len(faces_dets)
@@ -195,7 +204,9 @@ def detect_face_retinaface(ctx: Context):
         faces_landmarks.append(face_det[5:])
 
     if faces_num != 1:
-        raise FaceError("Expected 1 face, but got {}".format(faces_num), faces_num)
+        # NMS 保留两个框后提前结束，多个人脸时只能确定至少有 2 个
+        face_num = faces_num if faces_num < 2 else ">=2"
+        raise FaceError("Expected 1 face, but got {}".format(face_num), face_num)
     face_det = faces_dets[0]
     ctx.face["rectangle"] = (
         face_det[0],
@@ -213,7 +224,3 @@ def detect_face_retinaface(ctx: Context):
     dx = right_eye[0] - left_eye[0]
     roll_angle = np.degrees(np.arctan2(dy, dx))
     ctx.face["roll_angle"] = roll_angle
-
-    # 如果RUN_MODE不是野兽模式，则释放模型
-    if os.getenv("RUN_MODE") == "beast":
-        RETINAFCE_SESS = None
\ No newline at end of file
@@ -12,9 +12,9 @@ from PIL import Image
 import onnxruntime
 from .tensor2numpy import NNormalize, NTo_Tensor, NUnsqueeze
 from .context import Context
+from .session_registry import SESSION_REGISTRY, load_onnx_model
 import cv2
 import os
-from time import time
 
 
 WEIGHTS = {
@@ -38,42 +38,6 @@ WEIGHTS = {
 }
 
 ONNX_DEVICE = onnxruntime.get_device()
-ONNX_PROVIDER = (
-    "CUDAExecutionProvider" if ONNX_DEVICE == "GPU" else "CPUExecutionProvider"
-)
-
-HIVISION_MODNET_SESS = None
-MODNET_PHOTOGRAPHIC_PORTRAIT_MATTING_SESS = None
-RMBG_SESS = None
-BIREFNET_V1_LITE_SESS = None
-
-
-def load_onnx_model(checkpoint_path, set_cpu=False):
-    providers = (
-        ["CUDAExecutionProvider", "CPUExecutionProvider"]
-        if ONNX_PROVIDER == "CUDAExecutionProvider"
-        else ["CPUExecutionProvider"]
-    )
-
-    if set_cpu:
-        sess = onnxruntime.InferenceSession(
-            checkpoint_path, providers=["CPUExecutionProvider"]
-        )
-    else:
-        try:
-            sess = onnxruntime.InferenceSession(checkpoint_path, providers=providers)
-        except Exception as e:
-            if ONNX_DEVICE == "CUDAExecutionProvider":
-                print(f"Failed to load model with CUDAExecutionProvider: {e}")
-                print("Falling back to CPUExecutionProvider")
-                # 尝试使用CPU加载模型
-                sess = onnxruntime.InferenceSession(
-                    checkpoint_path, providers=["CPUExecutionProvider"]
-                )
-            else:
-                raise e  # 如果是CPU执行失败，重新抛出异常
-
-    return sess
 
 
 def extract_human(ctx: Context):
@@ -84,8 +48,7 @@ def extract_human(ctx: Context):
     # 抠图
     matting_image = get_modnet_matting(ctx.processing_image, WEIGHTS["hivision_modnet"])
     # 修复抠图
-    ctx.processing_image = hollow_out_fix(matting_image)
-    ctx.matting_image = ctx.processing_image.copy()
+    ctx.processing_image = ctx.matting_image = hollow_out_fix(matting_image)
 
 
 def extract_human_modnet_photographic_portrait_matting(ctx: Context):
@@ -97,76 +60,85 @@ def extract_human_modnet_photographic_portrait_matting(ctx: Context):
     matting_image = get_modnet_matting_photographic_portrait_matting(
         ctx.processing_image, WEIGHTS["modnet_photographic_portrait_matting"]
     )
-    # 修复抠图
-    ctx.processing_image = matting_image
-    ctx.matting_image = ctx.processing_image.copy()
+    ctx.processing_image = ctx.matting_image = matting_image
 
 
 def extract_human_mnn_modnet(ctx: Context):
     matting_image = get_mnn_modnet_matting(
         ctx.processing_image, WEIGHTS["mnn_hivision_modnet"]
     )
-    ctx.processing_image = hollow_out_fix(matting_image)
-    ctx.matting_image = ctx.processing_image.copy()
+    ctx.processing_image = ctx.matting_image = hollow_out_fix(matting_image)
 
 
 def extract_human_rmbg(ctx: Context):
     matting_image = get_rmbg_matting(ctx.processing_image, WEIGHTS["rmbg-1.4"])
-    ctx.processing_image = matting_image
-    ctx.matting_image = ctx.processing_image.copy()
+    ctx.processing_image = ctx.matting_image = matting_image
 
 
 # def extract_human_birefnet_portrait(ctx: Context):
 #     matting_image = get_birefnet_portrait_matting(
 #         ctx.processing_image, WEIGHTS["birefnet-portrait"]
 #     )
-#     ctx.processing_image = matting_image
-#     ctx.matting_image = ctx.processing_image.copy()
+#     ctx.processing_image = ctx.matting_image = matting_image
 
 
 def extract_human_birefnet_lite(ctx: Context):
     matting_image = get_birefnet_portrait_matting(
         ctx.processing_image, WEIGHTS["birefnet-v1-lite"]
     )
-    ctx.processing_image = matting_image
-    ctx.matting_image = ctx.processing_image.copy()
+    ctx.processing_image = ctx.matting_image = matting_image
+
+
+# 5x5 矩形腐蚀 3 次等价于 13x13 矩形腐蚀 1 次
+HOLLOW_OUT_ERODE_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (13, 13))
+# 轮廓外接矩形向外扩展的像素数，需大于轮廓线宽，保证矩形边缘与外部连通
+HOLLOW_OUT_MARGIN = 4
 
 
 def hollow_out_fix(src: np.ndarray) -> np.ndarray:
     """
-    修补抠图区域，作为抠图模型精度不够的补充
-    :param src:
-    :return:
+    修补抠图区域，作为抠图模型精度不够的补充：把最大人像轮廓内部的透明度置为 255。
+    直接修改 src 的透明度通道，不拆分合并通道、不填充边缘，泛洪填充只在轮廓的外接矩形内进行
+    :param src: BGRA 抠图结果，会被原地修改
+    :return: src
     """
-    b, g, r, a = cv2.split(src)
-    src_bgr = cv2.merge((b, g, r))
-    # -----------padding---------- #
-    add_area = np.zeros((10, a.shape[1]), np.uint8)
-    a = np.vstack((add_area, a, add_area))
-    add_area = np.zeros((a.shape[0], 10), np.uint8)
-    a = np.hstack((add_area, a, add_area))
-    # -------------end------------ #
-    _, a_threshold = cv2.threshold(a, 127, 255, 0)
+    alpha = src[:, :, 3]
+    _, a_threshold = cv2.threshold(cv2.extractChannel(src, 3), 127, 255, 0)
+    # 图像外按 0 处理，与四周补 0 后再腐蚀一致，轮廓因此距图像边缘至少 6 个像素
     a_erode = cv2.erode(
         a_threshold,
-        kernel=cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5)),
-        iterations=3,
+        HOLLOW_OUT_ERODE_KERNEL,
+        borderType=cv2.BORDER_CONSTANT,
+        borderValue=0,
     )
-    contours, hierarchy = cv2.findContours(
-        a_erode, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE
+    contours, _ = cv2.findContours(a_erode, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    if not contours:
+        return src
+    contour = max(contours, key=cv2.contourArea)
+
+    x, y, w, h = cv2.boundingRect(contour)
+    x0, y0 = x - HOLLOW_OUT_MARGIN, y - HOLLOW_OUT_MARGIN
+    x1, y1 = x + w + HOLLOW_OUT_MARGIN, y + h + HOLLOW_OUT_MARGIN
+    # 逐点绘制轮廓（线宽 2），从外接矩形的角点泛洪填充，未被填充的即轮廓内部
+    a_contour = np.zeros((y1 - y0, x1 - x0), np.uint8)
+    cv2.drawContours(a_contour, contour, -1, 255, 2, offset=(-x0, -y0))
+    cv2.floodFill(a_contour, None, seedPoint=(0, 0), newVal=255)
+    alpha[y0:y1, x0:x1][a_contour == 0] = 255
+    return src
+
+
+def merge_alpha(input_image: np.ndarray, alpha: np.ndarray) -> np.ndarray:
+    """
+    把三通道原图与 alpha 写入新分配的四通道图像，代替 split + merge 产生的中间数组
+    :param input_image: 三通道原图
+    :param alpha: 与原图同尺寸的单通道 alpha
+    :return: 四通道图像
+    """
+    output_image = cv2.cvtColor(
+        input_image.astype(np.uint8, copy=False), cv2.COLOR_BGR2BGRA
     )
-    contours = [x for x in contours]
-    # contours = np.squeeze(contours)
-    contours.sort(key=lambda c: cv2.contourArea(c), reverse=True)
-    a_contour = cv2.drawContours(np.zeros(a.shape, np.uint8), contours[0], -1, 255, 2)
-    # a_base = a_contour[1:-1, 1:-1]
-    h, w = a.shape[:2]
-    mask = np.zeros(
-        [h + 2, w + 2], np.uint8
-    )  # mask 必须行和列都加 2，且必须为 uint8 单通道阵列
-    cv2.floodFill(a_contour, mask=mask, seedPoint=(0, 0), newVal=255)
-    a = cv2.add(a, 255 - a_contour)
-    return cv2.merge((src_bgr, a[10:-10, 10:-10]))
+    output_image[:, :, 3] = alpha
+    return output_image
 
 
 def image2bgr(input_image):
@@ -183,10 +155,9 @@ def image2bgr(input_image):
 
 
 def read_modnet_image(input_image, ref_size=512):
-    im = Image.fromarray(np.uint8(input_image))
-    width, length = im.size[0], im.size[1]
-    im = np.asarray(im)
-    im = image2bgr(im)
+    # 与经 PIL 转换一次的结果相同，uint8 输入不复制整图
+    im = image2bgr(np.asarray(input_image, dtype=np.uint8))
+    width, length = im.shape[1], im.shape[0]
     im = cv2.resize(im, (ref_size, ref_size), interpolation=cv2.INTER_AREA)
     im = NNormalize(im, mean=np.array([0.5, 0.5, 0.5]), std=np.array([0.5, 0.5, 0.5]))
     im = NUnsqueeze(NTo_Tensor(im))
@@ -194,109 +165,77 @@ def read_modnet_image(input_image, ref_size=512):
     return im, width, length
 
 
-def get_modnet_matting(input_image, checkpoint_path, ref_size=512):
-    global HIVISION_MODNET_SESS
+def modnet_postprocess(matte, input_image):
+    """
+    MODNet 输出转换为四通道抠图结果
+    :param matte: 单张图像的模型输出，形如 (1, 1, h, w)
+    :param input_image: 原图
+    """
+    matte = (matte * 255).astype("uint8")
+    matte = np.squeeze(matte)
+    mask = cv2.resize(
+        matte,
+        (input_image.shape[1], input_image.shape[0]),
+        interpolation=cv2.INTER_AREA,
+    )
+    return merge_alpha(input_image, mask)
 
+
+def get_modnet_matting(input_image, checkpoint_path, ref_size=512):
     if not os.path.exists(checkpoint_path):
         print(f"Checkpoint file not found: {checkpoint_path}")
         return None
 
-    # 如果RUN_MODE不是野兽模式，则不加载模型
-    if HIVISION_MODNET_SESS is None:
-        HIVISION_MODNET_SESS = load_onnx_model(checkpoint_path, set_cpu=True)
+    # 会话由注册表统一常驻与淘汰
+    sess = SESSION_REGISTRY.get(checkpoint_path, set_cpu=True)
 
-    input_name = HIVISION_MODNET_SESS.get_inputs()[0].name
-    output_name = HIVISION_MODNET_SESS.get_outputs()[0].name
+    input_name = sess.get_inputs()[0].name
+    output_name = sess.get_outputs()[0].name
 
-    im, width, length = read_modnet_image(input_image=input_image, ref_size=ref_size)
+    im, _, _ = read_modnet_image(input_image=input_image, ref_size=ref_size)
 
-    matte = HIVISION_MODNET_SESS.run([output_name], {input_name: im})
-    matte = (matte[0] * 255).astype("uint8")
-    matte = np.squeeze(matte)
-    mask = cv2.resize(matte, (width, length), interpolation=cv2.INTER_AREA)
-    b, g, r = cv2.split(np.uint8(input_image))
+    matte = sess.run([output_name], {input_name: im})
 
-    output_image = cv2.merge((b, g, r, mask))
-    
-    # 如果RUN_MODE不是野兽模式，则释放模型
-    if os.getenv("RUN_MODE") != "beast":
-        HIVISION_MODNET_SESS = None
-
-    return output_image
+    return modnet_postprocess(matte[0], input_image)
 
 
 def get_modnet_matting_photographic_portrait_matting(
     input_image, checkpoint_path, ref_size=512
 ):
-    global MODNET_PHOTOGRAPHIC_PORTRAIT_MATTING_SESS
-
     if not os.path.exists(checkpoint_path):
         print(f"Checkpoint file not found: {checkpoint_path}")
         return None
 
-    # 如果RUN_MODE不是野兽模式，则不加载模型
-    if MODNET_PHOTOGRAPHIC_PORTRAIT_MATTING_SESS is None:
-        MODNET_PHOTOGRAPHIC_PORTRAIT_MATTING_SESS = load_onnx_model(
-            checkpoint_path, set_cpu=True
-        )
+    # 会话由注册表统一常驻与淘汰
+    sess = SESSION_REGISTRY.get(checkpoint_path, set_cpu=True)
 
-    input_name = MODNET_PHOTOGRAPHIC_PORTRAIT_MATTING_SESS.get_inputs()[0].name
-    output_name = MODNET_PHOTOGRAPHIC_PORTRAIT_MATTING_SESS.get_outputs()[0].name
+    input_name = sess.get_inputs()[0].name
+    output_name = sess.get_outputs()[0].name
 
-    im, width, length = read_modnet_image(input_image=input_image, ref_size=ref_size)
+    im, _, _ = read_modnet_image(input_image=input_image, ref_size=ref_size)
 
-    matte = MODNET_PHOTOGRAPHIC_PORTRAIT_MATTING_SESS.run(
-        [output_name], {input_name: im}
-    )
-    matte = (matte[0] * 255).astype("uint8")
-    matte = np.squeeze(matte)
-    mask = cv2.resize(matte, (width, length), interpolation=cv2.INTER_AREA)
-    b, g, r = cv2.split(np.uint8(input_image))
-
-    output_image = cv2.merge((b, g, r, mask))
-    
-    # 如果RUN_MODE不是野兽模式，则释放模型
-    if os.getenv("RUN_MODE") != "beast":
-        MODNET_PHOTOGRAPHIC_PORTRAIT_MATTING_SESS = None
-
-    return output_image
+    matte = sess.run([output_name], {input_name: im})
 
+    return modnet_postprocess(matte[0], input_image)
 
-def get_rmbg_matting(input_image: np.ndarray, checkpoint_path, ref_size=1024):
-    global RMBG_SESS
 
-    if not os.path.exists(checkpoint_path):
-        print(f"Checkpoint file not found: {checkpoint_path}")
-        return None
-
-    def resize_rmbg_image(image):
-        image = image.convert("RGB")
-        model_input_size = (ref_size, ref_size)
-        image = image.resize(model_input_size, Image.BILINEAR)
-        return image
-
-    if RMBG_SESS is None:
-        RMBG_SESS = load_onnx_model(checkpoint_path, set_cpu=True)
-
-    orig_image = Image.fromarray(input_image)
-    image = resize_rmbg_image(orig_image)
+def read_rmbg_image(input_image, ref_size=1024):
+    image = Image.fromarray(input_image).convert("RGB")
+    model_input_size = (ref_size, ref_size)
+    image = image.resize(model_input_size, Image.BILINEAR)
     im_np = np.array(image).astype(np.float32)
     im_np = im_np.transpose(2, 0, 1)  # Change to CxHxW format
     im_np = np.expand_dims(im_np, axis=0)  # Add batch dimension
     im_np = im_np / 255.0  # Normalize to [0, 1]
     im_np = (im_np - 0.5) / 0.5  # Normalize to [-1, 1]
+    return im_np
 
-    # Inference
-    result = RMBG_SESS.run(None, {RMBG_SESS.get_inputs()[0].name: im_np})[0]
 
-    # Post process
-    result = np.squeeze(result)
-    ma = np.max(result)
-    mi = np.min(result)
-    result = (result - mi) / (ma - mi)  # Normalize to [0, 1]
-
-    # Convert to PIL image
-    im_array = (result * 255).astype(np.uint8)
+def paste_matte(input_image, im_array):
+    """
+    将单通道 matte 缩放到原图大小，并以其为蒙版把原图贴到透明底上
+    """
+    orig_image = Image.fromarray(input_image)
     pil_im = Image.fromarray(
         im_array, mode="L"
     )  # Ensure mask is single channel (L mode)
@@ -307,14 +246,42 @@ def get_rmbg_matting(input_image: np.ndarray, checkpoint_path, ref_size=1024):
     # Paste the mask on the original image
     new_im = Image.new("RGBA", orig_image.size, (0, 0, 0, 0))
     new_im.paste(orig_image, mask=pil_im)
-    
-    # 如果RUN_MODE不是野兽模式，则释放模型
-    if os.getenv("RUN_MODE") != "beast":
-        RMBG_SESS = None
 
     return np.array(new_im)
 
 
+def rmbg_postprocess(result, input_image):
+    """
+    RMBG 输出转换为四通道抠图结果
+    :param result: 单张图像的模型输出，形如 (1, 1, h, w)
+    :param input_image: 原图
+    """
+    result = np.squeeze(result)
+    ma = np.max(result)
+    mi = np.min(result)
+    result = (result - mi) / (ma - mi)  # Normalize to [0, 1]
+
+    # Convert to PIL image
+    im_array = (result * 255).astype(np.uint8)
+    return paste_matte(input_image, im_array)
+
+
+def get_rmbg_matting(input_image: np.ndarray, checkpoint_path, ref_size=1024):
+    if not os.path.exists(checkpoint_path):
+        print(f"Checkpoint file not found: {checkpoint_path}")
+        return None
+
+    # 会话由注册表统一常驻与淘汰
+    sess = SESSION_REGISTRY.get(checkpoint_path, set_cpu=True)
+
+    im_np = read_rmbg_image(input_image, ref_size=ref_size)
+
+    # Inference
+    result = sess.run(None, {sess.get_inputs()[0].name: im_np})[0]
+
+    return rmbg_postprocess(result, input_image)
+
+
 def get_mnn_modnet_matting(input_image, checkpoint_path, ref_size=512):
     if not os.path.exists(checkpoint_path):
         print(f"Checkpoint file not found: {checkpoint_path}")
@@ -344,85 +311,147 @@ def get_mnn_modnet_matting(input_image, checkpoint_path, ref_size=512):
     matte = (matte * 255).astype("uint8")
     matte = np.squeeze(matte)
     mask = cv2.resize(matte, (width, length), interpolation=cv2.INTER_AREA)
-    b, g, r = cv2.split(np.uint8(input_image))
 
-    output_image = cv2.merge((b, g, r, mask))
+    return merge_alpha(input_image, mask)
 
-    return output_image
 
+def read_birefnet_image(input_image, ref_size=1024):
+    image = Image.fromarray(input_image)
+    image = image.resize((ref_size, ref_size))  # Resize to 1024x1024
+    image = (
+        np.array(image, dtype=np.float32) / 255.0
+    )  # Convert to numpy array and normalize to [0, 1]
+    image = (image - [0.485, 0.456, 0.406]) / [0.229, 0.224, 0.225]  # Normalize
+    image = np.transpose(image, (2, 0, 1))  # Change from (H, W, C) to (C, H, W)
+    image = np.expand_dims(image, axis=0)  # Add batch dimension
+    return image.astype(np.float32)  # Ensure the output is float32
 
-def get_birefnet_portrait_matting(input_image, checkpoint_path, ref_size=512):
-    global BIREFNET_V1_LITE_SESS
 
+def birefnet_postprocess(pred_onnx, input_image):
+    """
+    BiRefNet 输出转换为四通道抠图结果
+    :param pred_onnx: 单张图像的模型输出，形如 (1, 1, h, w)
+    :param input_image: 原图
+    """
+    pred_onnx = np.squeeze(pred_onnx)  # Use numpy to squeeze
+    result = 1 / (1 + np.exp(-pred_onnx))  # Sigmoid function using numpy
+
+    # Convert to PIL image
+    im_array = (result * 255).astype(np.uint8)
+    return paste_matte(input_image, im_array)
+
+
+def get_birefnet_portrait_matting(input_image, checkpoint_path, ref_size=512):
     if not os.path.exists(checkpoint_path):
         print(f"Checkpoint file not found: {checkpoint_path}")
         return None
 
-    def transform_image(image):
-        image = image.resize((1024, 1024))  # Resize to 1024x1024
-        image = (
-            np.array(image, dtype=np.float32) / 255.0
-        )  # Convert to numpy array and normalize to [0, 1]
-        image = (image - [0.485, 0.456, 0.406]) / [0.229, 0.224, 0.225]  # Normalize
-        image = np.transpose(image, (2, 0, 1))  # Change from (H, W, C) to (C, H, W)
-        image = np.expand_dims(image, axis=0)  # Add batch dimension
-        return image.astype(np.float32)  # Ensure the output is float32
-
-    orig_image = Image.fromarray(input_image)
-    input_images = transform_image(
-        orig_image
+    input_images = read_birefnet_image(
+        input_image
     )  # This will already have the correct shape
 
-    # 记录加载onnx模型的开始时间
-    load_start_time = time()
-
-    # 如果RUN_MODE不是野兽模式，则不加载模型
-    if BIREFNET_V1_LITE_SESS is None:
-        # print("首次加载birefnet-v1-lite模型...")
-        if ONNX_DEVICE == "GPU":
-            print("onnxruntime-gpu已安装，尝试使用CUDA加载模型")
-            try:
-                import torch
-            except ImportError:
-                print(
-                    "torch未安装，尝试直接使用onnxruntime-gpu加载模型，这需要配置好CUDA和cuDNN"
-                )
-            BIREFNET_V1_LITE_SESS = load_onnx_model(checkpoint_path)
-        else:
-            BIREFNET_V1_LITE_SESS = load_onnx_model(checkpoint_path, set_cpu=True)
-
-    # 记录加载onnx模型的结束时间
-    load_end_time = time()
-
-    # 打印加载onnx模型所花的时间
-    print(f"Loading ONNX model took {load_end_time - load_start_time:.4f} seconds")
-
-    input_name = BIREFNET_V1_LITE_SESS.get_inputs()[0].name
-    print(onnxruntime.get_device(), BIREFNET_V1_LITE_SESS.get_providers())
-
-    time_st = time()
-    pred_onnx = BIREFNET_V1_LITE_SESS.run(None, {input_name: input_images})[
+    # 会话由注册表统一常驻与淘汰，加载耗时记录在 model_load 阶段
+    if ONNX_DEVICE == "GPU" and checkpoint_path not in SESSION_REGISTRY:
+        print("onnxruntime-gpu已安装，尝试使用CUDA加载模型")
+        try:
+            import torch
+        except ImportError:
+            print(
+                "torch未安装，尝试直接使用onnxruntime-gpu加载模型，这需要配置好CUDA和cuDNN"
+            )
+    sess = SESSION_REGISTRY.get(checkpoint_path, set_cpu=ONNX_DEVICE != "GPU")
+
+    input_name = sess.get_inputs()[0].name
+
+    pred_onnx = sess.run(None, {input_name: input_images})[
         -1
     ]  # Use float32 input
-    pred_onnx = np.squeeze(pred_onnx)  # Use numpy to squeeze
-    result = 1 / (1 + np.exp(-pred_onnx))  # Sigmoid function using numpy
-    print(f"Inference time: {time() - time_st:.4f} seconds")
 
-    # Convert to PIL image
-    im_array = (result * 255).astype(np.uint8)
-    pil_im = Image.fromarray(
-        im_array, mode="L"
-    )  # Ensure mask is single channel (L mode)
+    return birefnet_postprocess(pred_onnx, input_image)
+
+
+# ---------------------------- 批量抠图 ---------------------------- #
+# 各模型的预处理、后处理与输出下标，预处理输出 (1, 3, ref_size, ref_size)
+MATTING_BATCH_PIPELINES = {
+    "hivision_modnet": {
+        "preprocess": lambda image: read_modnet_image(image, ref_size=512)[0],
+        "postprocess": modnet_postprocess,
+        "output_index": 0,
+        "hollow_out_fix": True,
+    },
+    "modnet_photographic_portrait_matting": {
+        "preprocess": lambda image: read_modnet_image(image, ref_size=512)[0],
+        "postprocess": modnet_postprocess,
+        "output_index": 0,
+        "hollow_out_fix": False,
+    },
+    "rmbg-1.4": {
+        "preprocess": lambda image: read_rmbg_image(image, ref_size=1024),
+        "postprocess": rmbg_postprocess,
+        "output_index": 0,
+        "hollow_out_fix": False,
+    },
+    "birefnet-v1-lite": {
+        "preprocess": lambda image: read_birefnet_image(image, ref_size=1024),
+        "postprocess": birefnet_postprocess,
+        "output_index": -1,
+        "hollow_out_fix": False,
+    },
+}
 
-    # Resize the mask to match the original image size
-    pil_im = pil_im.resize(orig_image.size, Image.BILINEAR)
 
-    # Paste the mask on the original image
-    new_im = Image.new("RGBA", orig_image.size, (0, 0, 0, 0))
-    new_im.paste(orig_image, mask=pil_im)
-    
-    # 如果RUN_MODE不是野兽模式，则释放模型
-    if os.getenv("RUN_MODE") != "beast":
-        BIREFNET_V1_LITE_SESS = None
+def get_matting_batch(input_images, matting_model="hivision_modnet", batch_size=8):
+    """
+    批量抠图，将多张图像缩放到模型的固定分辨率后拼成一个 NCHW 张量推理，
+    再把每张 matte 缩放回各自的原始尺寸
+    :param input_images: 图像列表，尺寸可以各不相同
+    :param matting_model: 抠图模型名称，支持 MATTING_BATCH_PIPELINES 中的模型
+    :param batch_size: 单次推理的最大图像数，模型 batch 维固定时会自动降为模型允许的大小
+    :return: 与输入一一对应的四通道抠图结果列表
+    """
+    if matting_model not in MATTING_BATCH_PIPELINES:
+        raise ValueError(
+            f"Batch matting is not supported for {matting_model}, "
+            f"choose from {list(MATTING_BATCH_PIPELINES)}"
+        )
+    pipeline = MATTING_BATCH_PIPELINES[matting_model]
+    checkpoint_path = WEIGHTS[matting_model]
+    if not os.path.exists(checkpoint_path):
+        raise FileNotFoundError(f"Checkpoint file not found: {checkpoint_path}")
 
-    return np.array(new_im)
+    # 与单张推理保持一致，仅 birefnet 在 GPU 可用时使用 CUDA
+    set_cpu = matting_model != "birefnet-v1-lite" or ONNX_DEVICE != "GPU"
+    sess = SESSION_REGISTRY.get(checkpoint_path, set_cpu=set_cpu)
+    model_input = sess.get_inputs()[0]
+    # 导出时固定了 batch 维的模型只能按该大小推理
+    if isinstance(model_input.shape[0], int) and model_input.shape[0] > 0:
+        batch_size = min(batch_size, model_input.shape[0])
+
+    output_images = []
+    for start in range(0, len(input_images), batch_size):
+        chunk = input_images[start : start + batch_size]
+        first = pipeline["preprocess"](chunk[0])
+        batch = np.empty((len(chunk),) + first.shape[1:], dtype=np.float32)
+        batch[0] = first[0]
+        for i, image in enumerate(chunk[1:], start=1):
+            batch[i] = pipeline["preprocess"](image)[0]
+
+        pred = sess.run(None, {model_input.name: batch})[pipeline["output_index"]]
+        for i, image in enumerate(chunk):
+            output_images.append(pipeline["postprocess"](pred[i : i + 1], image))
+
+    return output_images
+
+
+def extract_human_batch(input_images, matting_model="hivision_modnet", batch_size=8):
+    """
+    批量人像抠图，结果与逐张调用对应的 extract_human_* 一致
+    :param input_images: 图像列表
+    :param matting_model: 抠图模型名称
+    :param batch_size: 单次推理的最大图像数
+    :return: 四通道抠图结果列表
+    """
+    matting_images = get_matting_batch(input_images, matting_model, batch_size)
+    if MATTING_BATCH_PIPELINES[matting_model]["hollow_out_fix"]:
+        matting_images = [hollow_out_fix(image) for image in matting_images]
+    return matting_images
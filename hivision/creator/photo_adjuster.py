@@ -15,16 +15,20 @@ import math
 import cv2
 
 
-def adjust_photo(ctx: Context):
-    # Step1. 准备人脸参数
-    face_rect = ctx.face["rectangle"]
-    standard_size = ctx.params.size
-    params = ctx.params
+# 先裁剪流程中裁剪区域额外向外扩展的像素数，覆盖取整误差与缩放插值
+CROP_FIRST_PADDING = 4
+
+
+def crop_box(face_rect, params):
+    """
+    根据人脸框计算第一轮裁剪框
+    :param face_rect: 人脸框 (x, y, w, h)
+    :param params: Params 对象
+    :return: (x1, y1, x2, y2)
+    """
+    standard_size = params.size
     x, y = face_rect[0], face_rect[1]
     w, h = face_rect[2], face_rect[3]
-    height, width = ctx.matting_image.shape[:2]
-    width_height_ratio = standard_size[0] / standard_size[1]
-    # Step2. 计算高级参数
     face_center = (x + w / 2, y + h / 2)  # 面部中心坐标
     face_measure = w * h  # 面部面积
     crop_measure = (
@@ -44,6 +48,40 @@ def adjust_photo(ctx: Context):
     y1 = int(face_center[1] - crop_size[0] * params.head_height_ratio)
     y2 = y1 + crop_size[0]
     x2 = x1 + crop_size[1]
+    return x1, y1, x2, y2
+
+
+def crop_first_region(face_rect, params, image_shape):
+    """
+    先裁剪流程中需要抠图与美颜的区域。
+    第二轮裁剪时裁剪框左右只会收缩；上下会移动到头顶上方 head_top_range 处，
+    头顶位于人脸中心之上，因此向上扩展 max(head_top_range) 倍、向下扩展 head_height_ratio 倍的裁剪框高度即可覆盖最终结果
+    :param face_rect: 人脸框 (x, y, w, h)
+    :param params: Params 对象
+    :param image_shape: 图像尺寸
+    :return: (x1, y1, x2, y2)，已限制在图像范围内
+    """
+    x1, y1, x2, y2 = crop_box(face_rect, params)
+    crop_height = y2 - y1
+    y1 -= int(crop_height * max(params.head_top_range)) + CROP_FIRST_PADDING
+    y2 += int(crop_height * params.head_height_ratio) + CROP_FIRST_PADDING
+    x1 -= CROP_FIRST_PADDING
+    x2 += CROP_FIRST_PADDING
+    height, width = image_shape[:2]
+    return max(x1, 0), max(y1, 0), min(x2, width), min(y2, height)
+
+
+def adjust_photo(ctx: Context):
+    # Step1. 准备人脸参数
+    face_rect = ctx.face["rectangle"]
+    standard_size = ctx.params.size
+    params = ctx.params
+    x, y = face_rect[0], face_rect[1]
+    w, h = face_rect[2], face_rect[3]
+    width_height_ratio = standard_size[0] / standard_size[1]
+    # Step2. 计算裁剪框
+    x1, y1, x2, y2 = crop_box(face_rect, params)
+    crop_size = (y2 - y1, x2 - x1)  # 裁剪框大小
 
     # Step3, 裁剪框的调整
     cut_image = IDphotos_cut(x1, y1, x2, y2, ctx.matting_image)
@@ -1,41 +1,12 @@
+import os
 import numpy as np
 import cv2
-import onnxruntime
+from hivision.creator.session_registry import load_onnx_model
+from hivision.creator.retinaface.nms import nms, py_cpu_nms
 from hivision.creator.retinaface.box_utils import decode, decode_landm
 from hivision.creator.retinaface.prior_box import PriorBox
 
 
-def py_cpu_nms(dets, thresh):
-    """Pure Python NMS baseline."""
-    x1 = dets[:, 0]
-    y1 = dets[:, 1]
-    x2 = dets[:, 2]
-    y2 = dets[:, 3]
-    scores = dets[:, 4]
-
-    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
-    order = scores.argsort()[::-1]
-
-    keep = []
-    while order.size > 0:
-        i = order[0]
-        keep.append(i)
-        xx1 = np.maximum(x1[i], x1[order[1:]])
-        yy1 = np.maximum(y1[i], y1[order[1:]])
-        xx2 = np.minimum(x2[i], x2[order[1:]])
-        yy2 = np.minimum(y2[i], y2[order[1:]])
-
-        w = np.maximum(0.0, xx2 - xx1 + 1)
-        h = np.maximum(0.0, yy2 - yy1 + 1)
-        inter = w * h
-        ovr = inter / (areas[i] + areas[order[1:]] - inter)
-
-        inds = np.where(ovr <= thresh)[0]
-        order = order[inds + 1]
-
-    return keep
-
-
 # 替换掉 argparse 的部分，直接使用普通变量
 network = "resnet50"
 use_cpu = False
@@ -45,43 +16,27 @@ nms_threshold = 0.2
 keep_top_k = 750
 save_image = True
 vis_thres = 0.6
-
-ONNX_DEVICE = (
-    "CUDAExecutionProvider"
-    if onnxruntime.get_device() == "GPU"
-    else "CPUExecutionProvider"
-)
-
-
-def load_onnx_model(checkpoint_path, set_cpu=False):
-    providers = (
-        ["CUDAExecutionProvider", "CPUExecutionProvider"]
-        if ONNX_DEVICE == "CUDAExecutionProvider"
-        else ["CPUExecutionProvider"]
-    )
-
-    if set_cpu:
-        sess = onnxruntime.InferenceSession(
-            checkpoint_path, providers=["CPUExecutionProvider"]
-        )
-    else:
-        try:
-            sess = onnxruntime.InferenceSession(checkpoint_path, providers=providers)
-        except Exception as e:
-            if ONNX_DEVICE == "CUDAExecutionProvider":
-                print(f"Failed to load model with CUDAExecutionProvider: {e}")
-                print("Falling back to CPUExecutionProvider")
-                # 尝试使用CPU加载模型
-                sess = onnxruntime.InferenceSession(
-                    checkpoint_path, providers=["CPUExecutionProvider"]
-                )
-            else:
-                raise e  # 如果是CPU执行失败，重新抛出异常
-
-    return sess
-
-
-def retinaface_detect_faces(image, model_path: str, sess=None):
+# NMS 实现，可选 numpy / opencv
+nms_backend = os.getenv("HIVISION_NMS_BACKEND", "numpy")
+
+
+def retinaface_detect_faces(
+    image,
+    model_path: str,
+    sess=None,
+    max_side: int = 0,
+    single_face: bool = False,
+):
+    """
+    RetinaFace 人脸检测
+    :param image: BGR 图像
+    :param model_path: 模型路径
+    :param sess: 已加载的模型会话，为 None 时加载 model_path
+    :param max_side: 检测分辨率的最大边长，原图更大时先缩小再检测，0 表示使用原图
+    :param single_face: 证件照模式，只关心是否恰好一个人脸，NMS 保留两个框后提前结束，
+                        此时返回的人脸数最多为 2
+    :return: 每行为 [x1, y1, x2, y2, score, 10 个关键点坐标]，坐标均为原图坐标
+    """
     cfg = {
         "name": "Resnet50",
         "min_sizes": [[16, 32], [64, 128], [256, 512]],
@@ -110,12 +65,26 @@ def retinaface_detect_faces(image, model_path: str, sess=None):
 
     resize = 1
 
+    # 解码结果是相对于输入尺寸的归一化坐标，乘以原图尺寸即可映射回原图，
+    # 因此缩小检测分辨率时按原图尺寸计算 scale
+    origin_height, origin_width = image.shape[:2]
+    if max_side and max(origin_height, origin_width) > max_side:
+        ratio = max_side / max(origin_height, origin_width)
+        image = cv2.resize(
+            image,
+            (
+                max(1, round(origin_width * ratio)),
+                max(1, round(origin_height * ratio)),
+            ),
+            interpolation=cv2.INTER_AREA,
+        )
+
     # Read and preprocess the image
     img_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
     img = np.float32(img_rgb)
 
     im_height, im_width, _ = img.shape
-    scale = np.array([img.shape[1], img.shape[0], img.shape[1], img.shape[0]])
+    scale = np.array([origin_width, origin_height, origin_width, origin_height])
     img -= (104, 117, 123)
     img = img.transpose(2, 0, 1)
     img = np.expand_dims(img, axis=0)
@@ -135,20 +104,7 @@ def retinaface_detect_faces(image, model_path: str, sess=None):
 
     landms = decode_landm(np.squeeze(landms.data, axis=0), prior_data, cfg["variance"])
 
-    scale1 = np.array(
-        [
-            img.shape[3],
-            img.shape[2],
-            img.shape[3],
-            img.shape[2],
-            img.shape[3],
-            img.shape[2],
-            img.shape[3],
-            img.shape[2],
-            img.shape[3],
-            img.shape[2],
-        ]
-    )
+    scale1 = np.array([origin_width, origin_height] * 5)
     landms = landms * scale1 / resize
 
     # ignore low scores
@@ -165,7 +121,7 @@ def retinaface_detect_faces(image, model_path: str, sess=None):
 
     # do NMS
     dets = np.hstack((boxes, scores[:, np.newaxis])).astype(np.float32, copy=False)
-    keep = py_cpu_nms(dets, nms_threshold)
+    keep = nms(dets, nms_threshold, backend=nms_backend, single_face=single_face)
     dets = dets[keep, :]
     landms = landms[keep]
 
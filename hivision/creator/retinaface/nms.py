@@ -0,0 +1,83 @@
+import cv2
+import numpy as np
+
+
+def py_cpu_nms(dets, thresh, single_face=False):
+    """
+    NumPy NMS，每次保留一个框后向量化计算它与剩余框的 IoU，循环次数等于保留的框数，
+    人脸候选框高度聚集，一次即可抑制整簇，因此比完整的 N×N IoU 矩阵更快
+    :param single_face: 证件照模式，保留两个框后提前结束（此时已确定人脸数量不为 1）
+    """
+    x1 = dets[:, 0]
+    y1 = dets[:, 1]
+    x2 = dets[:, 2]
+    y2 = dets[:, 3]
+    scores = dets[:, 4]
+
+    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
+    order = scores.argsort()[::-1]
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        if single_face and len(keep) >= 2:
+            break
+        xx1 = np.maximum(x1[i], x1[order[1:]])
+        yy1 = np.maximum(y1[i], y1[order[1:]])
+        xx2 = np.minimum(x2[i], x2[order[1:]])
+        yy2 = np.minimum(y2[i], y2[order[1:]])
+
+        w = np.maximum(0.0, xx2 - xx1 + 1)
+        h = np.maximum(0.0, yy2 - yy1 + 1)
+        inter = w * h
+        ovr = inter / (areas[i] + areas[order[1:]] - inter)
+
+        inds = np.where(ovr <= thresh)[0]
+        order = order[inds + 1]
+
+    return keep
+
+
+def cv2_nms(dets, thresh, single_face=False):
+    """
+    基于 cv2.dnn.NMSBoxes 的 NMS。OpenCV 计算 IoU 时宽高不 +1，
+    因此与 py_cpu_nms 在边界情况下可能有细微差别
+    :param dets: [N, 5]，每行为 x1, y1, x2, y2, score
+    :param thresh: IoU 阈值
+    :param single_face: 证件照模式，最多返回两个框。NMSBoxes 的 top_k 在抑制之前截断候选框，
+        同一人脸的候选框排在前面时会丢掉其他人脸，因此抑制完成后再截断
+    """
+    if len(dets) == 0:
+        return []
+    boxes = np.stack(
+        (dets[:, 0], dets[:, 1], dets[:, 2] - dets[:, 0], dets[:, 3] - dets[:, 1]),
+        axis=1,
+    )
+    keep = cv2.dnn.NMSBoxes(
+        boxes.tolist(),
+        dets[:, 4].tolist(),
+        score_threshold=float(dets[:, 4].min()),
+        nms_threshold=thresh,
+    )
+    keep = np.asarray(keep, dtype=np.int64).reshape(-1).tolist()
+    return keep[:2] if single_face else keep
+
+
+NMS_BACKENDS = {
+    "numpy": py_cpu_nms,
+    "opencv": cv2_nms,
+}
+
+
+def nms(dets, thresh, backend="numpy", single_face=False):
+    """
+    NMS 统一入口
+    :param dets: [N, 5]，每行为 x1, y1, x2, y2, score
+    :param thresh: IoU 阈值
+    :param backend: 可选 numpy / opencv
+    :param single_face: 证件照模式，只关心是否恰好一个人脸，保留两个框后提前结束
+    """
+    if backend not in NMS_BACKENDS:
+        raise ValueError(f"NMS backend must be one of {list(NMS_BACKENDS)}")
+    return NMS_BACKENDS[backend](dets, thresh, single_face=single_face)
@@ -1,8 +1,46 @@
-from itertools import product as product
+from functools import lru_cache
 import numpy as np
 from math import ceil
 
 
+@lru_cache(maxsize=32)
+def generate_priors(image_size, min_sizes, steps, clip):
+    """
+    用 meshgrid 生成先验框，结果按 (image_size, min_sizes, steps, clip) 缓存，
+    同一分辨率的图像直接复用。返回的数组为只读，调用方不要原地修改。
+    先验框的顺序与计算方式与逐点循环的实现完全一致：
+    依次遍历特征层、行、列、min_size，每个先验框为 [cx, cy, s_kx, s_ky]
+    :param image_size: (h, w)
+    :param min_sizes: 每个特征层的 min_size 元组，例如 ((16, 32), (64, 128), (256, 512))
+    :param steps: 每个特征层的步长，例如 (8, 16, 32)
+    :param clip: 是否将结果裁剪到 [0, 1]
+    """
+    height, width = image_size
+    anchors = []
+    for k, step in enumerate(steps):
+        feature_h, feature_w = ceil(height / step), ceil(width / step)
+        sizes = np.asarray(min_sizes[k], dtype=np.float64)
+
+        dense_cx = (np.arange(feature_w) + 0.5) * step / width
+        dense_cy = (np.arange(feature_h) + 0.5) * step / height
+        cx, cy = np.meshgrid(dense_cx, dense_cy)
+
+        layer = np.empty((feature_h, feature_w, len(sizes), 4), dtype=np.float64)
+        layer[..., 0] = cx[..., np.newaxis]
+        layer[..., 1] = cy[..., np.newaxis]
+        layer[..., 2] = sizes / width
+        layer[..., 3] = sizes / height
+        anchors.append(layer.reshape(-1, 4))
+
+    output = np.concatenate(anchors, axis=0)
+
+    if clip:
+        output = np.clip(output, 0, 1)
+
+    output.setflags(write=False)
+    return output
+
+
 class PriorBox(object):
     def __init__(self, cfg, image_size=None):
         super(PriorBox, self).__init__()
@@ -17,25 +55,9 @@ class PriorBox(object):
         self.name = "s"
 
     def forward(self):
-        anchors = []
-        for k, f in enumerate(self.feature_maps):
-            min_sizes = self.min_sizes[k]
-            for i, j in product(range(f[0]), range(f[1])):
-                for min_size in min_sizes:
-                    s_kx = min_size / self.image_size[1]
-                    s_ky = min_size / self.image_size[0]
-                    dense_cx = [
-                        x * self.steps[k] / self.image_size[1] for x in [j + 0.5]
-                    ]
-                    dense_cy = [
-                        y * self.steps[k] / self.image_size[0] for y in [i + 0.5]
-                    ]
-                    for cy, cx in product(dense_cy, dense_cx):
-                        anchors += [cx, cy, s_kx, s_ky]
-
-        output = np.array(anchors).reshape(-1, 4)
-
-        if self.clip:
-            output = np.clip(output, 0, 1)
-
-        return output
+        return generate_priors(
+            tuple(self.image_size),
+            tuple(tuple(sizes) for sizes in self.min_sizes),
+            tuple(self.steps),
+            bool(self.clip),
+        )
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+r"""
+@DATE: 2026/10/18 10:12
+@File: session_registry.py
+@IDE: pycharm
+@Description:
+    ONNX 推理会话注册表，按模型路径与执行后端常驻 InferenceSession，
+    支持线程数、图优化等级配置、启动预热，以及按内存预算的 LRU 淘汰
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Sequence
+import numpy as np
+import onnxruntime
+from hivision.metrics import METRICS
+
+
+ONNX_DEVICE = onnxruntime.get_device()
+ONNX_PROVIDER = (
+    "CUDAExecutionProvider" if ONNX_DEVICE == "GPU" else "CPUExecutionProvider"
+)
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def create_session_options(
+    intra_op_num_threads: int = 0,
+    inter_op_num_threads: int = 0,
+    graph_optimization_level: str = "all",
+) -> onnxruntime.SessionOptions:
+    """
+    构造 SessionOptions
+    :param intra_op_num_threads: 单个算子内部的线程数，0 表示使用 onnxruntime 默认值
+    :param inter_op_num_threads: 算子之间的并行线程数，0 表示使用 onnxruntime 默认值
+    :param graph_optimization_level: 图优化等级，可选 disable / basic / extended / all
+    """
+    if graph_optimization_level not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(
+            f"graph_optimization_level must be one of {list(GRAPH_OPTIMIZATION_LEVELS)}"
+        )
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = intra_op_num_threads
+    options.inter_op_num_threads = inter_op_num_threads
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[
+        graph_optimization_level
+    ]
+    return options
+
+
+def load_onnx_model(checkpoint_path, set_cpu=False, sess_options=None):
+    """
+    加载 ONNX 模型，GPU 可用时优先使用 CUDA，失败后回退到 CPU
+    :param checkpoint_path: 模型路径
+    :param set_cpu: 是否强制使用 CPU
+    :param sess_options: onnxruntime.SessionOptions，为 None 时使用默认配置
+    """
+    providers = (
+        ["CUDAExecutionProvider", "CPUExecutionProvider"]
+        if ONNX_PROVIDER == "CUDAExecutionProvider"
+        else ["CPUExecutionProvider"]
+    )
+
+    if set_cpu:
+        sess = onnxruntime.InferenceSession(
+            checkpoint_path,
+            sess_options=sess_options,
+            providers=["CPUExecutionProvider"],
+        )
+    else:
+        try:
+            sess = onnxruntime.InferenceSession(
+                checkpoint_path, sess_options=sess_options, providers=providers
+            )
+        except Exception as e:
+            if ONNX_PROVIDER == "CUDAExecutionProvider":
+                print(f"Failed to load model with CUDAExecutionProvider: {e}")
+                print("Falling back to CPUExecutionProvider")
+                # 尝试使用CPU加载模型
+                sess = onnxruntime.InferenceSession(
+                    checkpoint_path,
+                    sess_options=sess_options,
+                    providers=["CPUExecutionProvider"],
+                )
+            else:
+                raise e  # 如果是CPU执行失败，重新抛出异常
+
+    return sess
+
+
+class SessionRegistry:
+    """
+    InferenceSession 注册表，同一模型 + 执行后端只加载一次，所有线程共享
+    （InferenceSession.run 本身是线程安全的）。
+
+    常驻会话占用的内存按模型文件大小估算，超过 memory_budget_mb 时按最近最少使用的顺序淘汰。
+    被淘汰的会话如果仍被某个请求持有引用，会在该请求结束后自然释放。
+    """
+
+    def __init__(
+        self,
+        memory_budget_mb: int = 0,
+        intra_op_num_threads: int = 0,
+        inter_op_num_threads: int = 0,
+        graph_optimization_level: str = "all",
+    ):
+        """
+        :param memory_budget_mb: 常驻会话的内存预算（MB），0 表示不限制
+        :param intra_op_num_threads: 单个算子内部的线程数，0 表示使用 onnxruntime 默认值
+        :param inter_op_num_threads: 算子之间的并行线程数，0 表示使用 onnxruntime 默认值
+        :param graph_optimization_level: 图优化等级，可选 disable / basic / extended / all
+        """
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.sess_options = create_session_options(
+            intra_op_num_threads, inter_op_num_threads, graph_optimization_level
+        )
+        # key -> (session, 估算占用字节数)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        # 每个 key 一把锁，避免并发请求重复加载同一个模型，同时不阻塞其他模型的加载
+        self._key_locks = {}
+
+    @classmethod
+    def from_env(cls) -> "SessionRegistry":
+        """
+        根据环境变量创建注册表：
+        HIVISION_SESSION_MEMORY_MB: 内存预算，野兽模式下默认不限制，否则默认 512
+        HIVISION_ORT_INTRA_OP_THREADS / HIVISION_ORT_INTER_OP_THREADS: 线程数
+        HIVISION_ORT_GRAPH_OPT_LEVEL: 图优化等级
+        """
+        default_budget = 0 if os.getenv("RUN_MODE") == "beast" else 512
+        return cls(
+            memory_budget_mb=_env_int("HIVISION_SESSION_MEMORY_MB", default_budget),
+            intra_op_num_threads=_env_int("HIVISION_ORT_INTRA_OP_THREADS", 0),
+            inter_op_num_threads=_env_int("HIVISION_ORT_INTER_OP_THREADS", 0),
+            graph_optimization_level=os.getenv("HIVISION_ORT_GRAPH_OPT_LEVEL", "all"),
+        )
+
+    @staticmethod
+    def _make_key(checkpoint_path, set_cpu):
+        provider = "CPUExecutionProvider" if set_cpu else ONNX_PROVIDER
+        return os.path.abspath(checkpoint_path), provider
+
+    def get(self, checkpoint_path, set_cpu=False) -> onnxruntime.InferenceSession:
+        """
+        获取模型会话，不存在时加载并登记
+        :param checkpoint_path: 模型路径
+        :param set_cpu: 是否强制使用 CPU
+        """
+        key = self._make_key(checkpoint_path, set_cpu)
+        with self._lock:
+            if key in self._sessions:
+                self._sessions.move_to_end(key)
+                return self._sessions[key][0]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # 等锁期间可能已被其他线程加载
+            with self._lock:
+                if key in self._sessions:
+                    self._sessions.move_to_end(key)
+                    return self._sessions[key][0]
+
+            model_name = os.path.basename(checkpoint_path)
+            with METRICS.span("model_load", model=model_name):
+                sess = load_onnx_model(
+                    checkpoint_path, set_cpu=set_cpu, sess_options=self.sess_options
+                )
+            METRICS.inc("hivision_model_loads_total", model=model_name)
+            cost = os.path.getsize(checkpoint_path)
+
+            with self._lock:
+                self._sessions[key] = (sess, cost)
+                self._evict_locked(keep=key)
+        return sess
+
+    def _evict_locked(self, keep=None):
+        if self.memory_budget <= 0:
+            return
+        while self.memory_usage > self.memory_budget:
+            victim = next((k for k in self._sessions if k != keep), None)
+            if victim is None:
+                break
+            del self._sessions[victim]
+            METRICS.inc(
+                "hivision_model_evictions_total", model=os.path.basename(victim[0])
+            )
+
+    def warmup(
+        self,
+        checkpoint_path,
+        set_cpu=False,
+        input_size: Optional[Sequence[int]] = None,
+    ) -> onnxruntime.InferenceSession:
+        """
+        加载模型并用全零输入推理一次，使首个真实请求不再承担初始化开销
+        :param checkpoint_path: 模型路径
+        :param set_cpu: 是否强制使用 CPU
+        :param input_size: 动态尺寸模型的 (h, w)，为 None 时使用 512x512
+        """
+        sess = self.get(checkpoint_path, set_cpu=set_cpu)
+        height, width = input_size or (512, 512)
+        feeds = {}
+        for model_input in sess.get_inputs():
+            shape = list(model_input.shape)
+            # 动态维度（字符串或 None）依次按 batch、channel、h、w 填充
+            defaults = [1, 3, height, width][-len(shape):] if shape else []
+            shape = [
+                dim if isinstance(dim, int) and dim > 0 else defaults[i]
+                for i, dim in enumerate(shape)
+            ]
+            feeds[model_input.name] = np.zeros(shape, dtype=np.float32)
+        sess.run(None, feeds)
+        return sess
+
+    def evict(self, checkpoint_path=None, set_cpu=False):
+        """
+        释放会话，checkpoint_path 为 None 时释放全部
+        """
+        with self._lock:
+            if checkpoint_path is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(self._make_key(checkpoint_path, set_cpu), None)
+
+    @property
+    def memory_usage(self) -> int:
+        """
+        当前常驻会话的估算占用字节数
+        """
+        return sum(cost for _, cost in self._sessions.values())
+
+    def __contains__(self, checkpoint_path) -> bool:
+        return any(
+            key[0] == os.path.abspath(checkpoint_path) for key in self._sessions
+        )
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+SESSION_REGISTRY = SessionRegistry.from_env()
@@ -24,7 +24,6 @@ def resize_image_esp(input_image, esp=2000):
     max_num = max(width, length)
 
     if max_num > esp:
-        print("Image resizing...")
         if width == max_num:
             length = int((esp / width) * length)
             width = esp
@@ -32,7 +31,6 @@ def resize_image_esp(input_image, esp=2000):
         else:
             width = int((esp / length) * width)
             length = esp
-        print(length, width)
         im_resize = cv2.resize(
             input_image, (length, width), interpolation=cv2.INTER_AREA
         )
@@ -66,7 +64,7 @@ def get_box(
     # 输入必须为四通道
     if correction_factor is None:
         correction_factor = [0, 0, 0, 0]
-    if not isinstance(image, np.ndarray) or len(cv2.split(image)) != 4:
+    if not isinstance(image, np.ndarray) or image.ndim != 3 or image.shape[2] != 4:
         raise TypeError("输入的图像必须为四通道 np.ndarray 类型矩阵！")
     # correction_factor 规范化
     if isinstance(correction_factor, int):
@@ -75,12 +73,10 @@ def get_box(
         raise TypeError("correction_factor 必须为 int 或者 list 类型！")
     # ------------ 数据格式规范完毕 -------------- #
     # 分离 mask
-    _, _, _, mask = cv2.split(image)
+    mask = cv2.extractChannel(image, 3)
     # mask 二值化处理
     _, mask = cv2.threshold(mask, thresh=thresh, maxval=255, type=0)
     contours, hierarchy = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-    temp = np.ones(image.shape, np.uint8) * 255
-    cv2.drawContours(temp, contours, -1, (0, 0, 255), -1)
     contours_area = []
     for cnt in contours:
         contours_area.append(cv2.contourArea(cnt))
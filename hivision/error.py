@@ -15,7 +15,7 @@ class FaceError(Exception):
         证件照人脸错误，此时人脸检测失败，可能是没有检测到人脸或者检测到多个人脸
         Args:
             err: 错误描述
-            face_num: 告诉此时识别到的人像个数
+            face_num: 告诉此时识别到的人像个数，RetinaFace 检测到多个人脸时为 ">=2"
         """
         super().__init__(err)
         self.face_num = face_num
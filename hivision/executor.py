@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+r"""
+@DATE: 2026/10/18 15:20
+@File: executor.py
+@IDE: pycharm
+@Description:
+    有界执行器，把解码、推理、编码等 CPU 密集的工作移出 asyncio 事件循环，
+    并限制并发数与排队深度，队列已满时直接拒绝请求
+"""
+import asyncio
+import contextvars
+import os
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from hivision.error import APIError
+
+# 当前协程已占用名额的执行器，在其中调用 run 不再重复占用
+_reserved_executor = contextvars.ContextVar("hivision_reserved_executor", default=None)
+
+
+class BoundedExecutor:
+    """
+    线程池执行器，onnxruntime、OpenCV 在计算时会释放 GIL，因此使用线程即可并行，
+    同时所有线程可以共享已加载的模型会话。
+
+    正在执行与排队中的任务总数超过 max_workers + max_queue 时抛出 APIError(429)，
+    执行器关闭后提交任务抛出 APIError(503)。计数只在事件循环线程中修改，无需加锁。
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 32):
+        """
+        :param max_workers: 同时执行的任务数
+        :param max_queue: 允许排队等待的任务数
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="hivision"
+        )
+        self.in_flight = 0
+        self._shutdown = False
+
+    @classmethod
+    def from_env(cls) -> "BoundedExecutor":
+        """
+        根据环境变量创建执行器：
+        HIVISION_MAX_WORKERS: 同时执行的任务数，默认 min(4, CPU 核数)
+        HIVISION_MAX_QUEUE: 允许排队等待的任务数，默认 32
+        """
+        max_workers = os.getenv("HIVISION_MAX_WORKERS")
+        max_queue = os.getenv("HIVISION_MAX_QUEUE")
+        return cls(
+            max_workers=int(max_workers) if max_workers else min(4, os.cpu_count() or 1),
+            max_queue=int(max_queue) if max_queue else 32,
+        )
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        当前排队等待（尚未开始执行）的任务数
+        """
+        return max(0, self.in_flight - self.max_workers)
+
+    def _acquire(self):
+        if self._shutdown:
+            raise APIError("服务正在关闭，请稍后重试", 503)
+        if self.in_flight >= self.capacity:
+            raise APIError("服务繁忙，请稍后重试", 429)
+        self.in_flight += 1
+
+    @contextmanager
+    def slot(self):
+        """
+        占用一个执行名额直到代码块结束，名额不足时抛出 APIError(429)，关闭后抛出 APIError(503)。
+        微批调度器中等待合并的请求也通过它计入排队深度
+        """
+        self._acquire()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    def reserve(self) -> "Reservation":
+        """
+        提前占用一个名额，名额不足时立即抛出异常。用于响应头发出之后才执行的工作（如流式响应中的编码），
+        这些工作在 Reservation.use() 中调用 run 时使用预留的名额，不会再返回 429 / 503
+        """
+        self._acquire()
+        return Reservation(self)
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        在线程池中执行 fn(*args, **kwargs) 并等待结果
+        """
+        loop = asyncio.get_running_loop()
+        if _reserved_executor.get() is self:
+            return await loop.run_in_executor(self.executor, partial(fn, *args, **kwargs))
+        with self.slot():
+            return await loop.run_in_executor(
+                self.executor, partial(fn, *args, **kwargs)
+            )
+
+    def shutdown(self, wait: bool = True):
+        self._shutdown = True
+        self.executor.shutdown(wait=wait)
+
+
+class Reservation:
+    """
+    BoundedExecutor.reserve 预留的一个名额，release 可以重复调用
+    """
+
+    def __init__(self, executor: BoundedExecutor):
+        self.executor = executor
+        self._released = False
+
+    @contextmanager
+    def use(self):
+        """
+        代码块中对 executor.run 的调用依次使用预留的名额
+        """
+        token = _reserved_executor.set(self.executor)
+        try:
+            yield
+        finally:
+            _reserved_executor.reset(token)
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.executor.in_flight -= 1
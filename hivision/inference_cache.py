@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+r"""
+@DATE: 2026/10/18 22:30
+@File: inference_cache.py
+@IDE: pycharm
+@Description:
+    按图像内容哈希缓存抠图与人脸检测结果。同一张图只调整背景色、尺寸、KB 大小或美颜参数时，
+    直接复用缓存而不再进行神经网络推理。内存中按字节数做 LRU 淘汰，可选地落盘到目录中
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+from hivision.creator import handler_name
+from hivision.creator.context import Context, ContextHandler
+from hivision.metrics import METRICS
+
+# 内存缓存的大小上限（MB），为 0 时关闭缓存
+INFERENCE_CACHE_MB = float(os.getenv("HIVISION_INFERENCE_CACHE_MB", 256))
+# 磁盘缓存目录，为空时只使用内存缓存
+INFERENCE_CACHE_DIR = os.getenv("HIVISION_INFERENCE_CACHE_DIR", "")
+
+# 人脸检测结果按 1KB 计入内存占用
+FACE_ENTRY_BYTES = 1024
+
+
+def image_hash(image: np.ndarray) -> str:
+    """
+    图像内容哈希，包含尺寸与数据类型，sha256 在支持 SHA 指令的 CPU 上最快
+    """
+    image = np.ascontiguousarray(image)
+    digest = hashlib.sha256(f"{image.shape}{image.dtype}".encode())
+    digest.update(image.data)
+    return digest.hexdigest()[:32]
+
+
+def _json_default(value):
+    # 检测器返回的坐标与角度可能是 numpy 类型
+    return value.tolist() if hasattr(value, "tolist") else str(value)
+
+
+class InferenceCache:
+    """
+    (图像哈希, 模型名称) -> 抠图结果 / 人脸检测结果 的两级缓存，线程安全。
+    缓存的抠图结果为只读数组，使用方需要修改时应先复制
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, cache_dir: str = None):
+        """
+        :param max_bytes: 内存缓存的字节数上限，为 0 时关闭缓存
+        :param cache_dir: 磁盘缓存目录，为 None 时只使用内存缓存
+        """
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "InferenceCache":
+        return cls(int(INFERENCE_CACHE_MB * 1024 * 1024), INFERENCE_CACHE_DIR or None)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    # ------------------- 抠图 -------------------
+    def get_matting(self, image_key: str, model: str) -> Optional[np.ndarray]:
+        return self._get(("matting", model, image_key))
+
+    def put_matting(self, image_key: str, model: str, matting_image: np.ndarray):
+        matting_image = np.array(matting_image)
+        matting_image.setflags(write=False)
+        self._put(("matting", model, image_key), matting_image, matting_image.nbytes)
+
+    # ------------------- 人脸检测 -------------------
+    def get_face(self, image_key: str, detector: str) -> Optional[dict]:
+        face = self._get(("face", detector, image_key))
+        return None if face is None else dict(face)
+
+    def put_face(self, image_key: str, detector: str, face: dict):
+        self._put(("face", detector, image_key), dict(face), FACE_ENTRY_BYTES)
+
+    # ------------------- 内部实现 -------------------
+    def _get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        value = entry[0] if entry is not None else self._load(key)
+        METRICS.inc(
+            "hivision_inference_cache_total",
+            kind=key[0],
+            result="miss" if value is None else "hit",
+        )
+        if value is not None and entry is None:
+            self._put_memory(key, value, self._nbytes(value))
+        return value
+
+    def _put(self, key, value, nbytes):
+        if not self.enabled:
+            return
+        self._put_memory(key, value, nbytes)
+        if self.cache_dir:
+            try:
+                self._save(key, value)
+            except OSError as e:
+                print(f"Failed to write inference cache {key}: {e}")
+
+    def _put_memory(self, key, value, nbytes):
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            self._entries[key] = (value, nbytes)
+            self._size += nbytes
+            while self._size > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._size -= evicted_bytes
+
+    @staticmethod
+    def _nbytes(value):
+        return value.nbytes if isinstance(value, np.ndarray) else FACE_ENTRY_BYTES
+
+    def _path(self, key) -> str:
+        kind, model, image_key = key
+        extension = "npy" if kind == "matting" else "json"
+        return os.path.join(self.cache_dir, f"{kind}-{model}-{image_key}.{extension}")
+
+    def _save(self, key, value):
+        path = self._path(key)
+        # 先写临时文件再原子替换，避免并发读到不完整的文件
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            if key[0] == "matting":
+                np.save(f, value)
+            else:
+                f.write(json.dumps(value, default=_json_default).encode())
+        os.replace(temp_path, path)
+
+    def _load(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            if key[0] == "matting":
+                value = np.load(path)
+                value.setflags(write=False)
+                return value
+            with open(path, "rb") as f:
+                face = json.loads(f.read())
+            if face.get("rectangle") is not None:
+                face["rectangle"] = tuple(face["rectangle"])
+            return face
+        except (OSError, ValueError) as e:
+            print(f"Failed to read inference cache {path}: {e}")
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+INFERENCE_CACHE = InferenceCache.from_env()
+
+
+def cached_matting_handler(
+    handler: ContextHandler, cache: InferenceCache = None
+) -> ContextHandler:
+    """
+    返回带缓存的抠图处理者，以 ctx.processing_image 的内容哈希与处理者名称为键
+    :param cache: 为 None 时使用全局的 INFERENCE_CACHE
+    """
+    cache = cache or INFERENCE_CACHE
+    if not cache.enabled:
+        return handler
+    model = handler_name(handler)
+
+    def cached_matting(ctx: Context):
+        image_key = image_hash(ctx.processing_image)
+        matting_image = cache.get_matting(image_key, model)
+        if matting_image is None:
+            handler(ctx)
+            cache.put_matting(image_key, model, ctx.matting_image)
+        else:
+            # 缓存的结果为只读数组，需要原地修改时由修改方复制
+            ctx.processing_image = ctx.matting_image = matting_image
+
+    cached_matting.__name__ = model
+    return cached_matting
+
+
+def cached_detection_handler(
+    handler: ContextHandler, cache: InferenceCache = None
+) -> ContextHandler:
+    """
+    返回带缓存的人脸检测处理者，以 ctx.origin_image 的内容哈希与处理者名称为键。
+    人脸数量不为 1 时不缓存，照常抛出 FaceError
+    :param cache: 为 None 时使用全局的 INFERENCE_CACHE
+    """
+    cache = cache or INFERENCE_CACHE
+    if not cache.enabled:
+        return handler
+    detector = handler_name(handler)
+
+    def cached_detection(ctx: Context):
+        image_key = image_hash(ctx.origin_image)
+        face = cache.get_face(image_key, detector)
+        if face is None:
+            handler(ctx)
+            cache.put_face(image_key, detector, ctx.face)
+        else:
+            ctx.face.update(face)
+
+    cached_detection.__name__ = detector
+    return cached_detection
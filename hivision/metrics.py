@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+r"""
+@DATE: 2026/10/18 17:40
+@File: metrics.py
+@IDE: pycharm
+@Description:
+    统一的耗时与指标采集：分阶段耗时（span）、计数器、直方图与仪表盘，
+    支持导出为 Prometheus 文本格式，也可以注册回调把每个事件转发到其他监控系统
+"""
+import os
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, List, Tuple
+
+# 秒级耗时的默认分桶，覆盖几毫秒的编码到十几秒的 CPU 抠图
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+STAGE_SECONDS = "hivision_stage_seconds"
+
+# 非耗时类直方图的分桶
+HISTOGRAM_BUCKETS = {
+    "hivision_batch_size": (1, 2, 4, 8, 16, 32, 64),
+    "hivision_jpeg_encode_attempts": (1, 2, 4, 8, 16, 32),
+    "hivision_peak_memory_bytes": tuple(
+        2 ** 20 * x for x in (8, 16, 32, 64, 128, 256, 512, 1024)
+    ),
+}
+
+# 指标说明，出现在 Prometheus 的 # HELP 行
+METRIC_HELP = {
+    STAGE_SECONDS: "Duration of each processing stage in seconds",
+    "hivision_face_errors_total": "Face detection failures by detected face count",
+    "hivision_model_loads_total": "ONNX model sessions loaded",
+    "hivision_model_evictions_total": "ONNX model sessions evicted from the registry",
+    "hivision_batch_size": "Number of requests merged into one micro-batch",
+    "hivision_jpeg_encode_attempts": "JPEG encodes used to reach a target file size",
+    "hivision_inference_cache_total": "Matting and detection cache lookups by kind and result",
+    "hivision_requests_total": "HTTP requests by path and status code",
+    "hivision_request_seconds": "HTTP request duration in seconds",
+    "hivision_executor_in_flight": "Running and queued tasks in the API executor",
+    "hivision_executor_queue_depth": "Queued tasks in the API executor",
+    "hivision_sessions": "Editing sessions held in memory",
+    "hivision_peak_memory_bytes": "Peak traced memory per stage in bytes",
+}
+
+# 回调签名：callback(kind, name, value, labels)，kind 为 counter / histogram / gauge
+MetricsCallback = Callable[[str, str, float, Dict[str, str]], None]
+
+
+def _label_key(labels: Dict[str, object]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(label_key, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    items = label_key + extra
+    if not items:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in items
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metrics:
+    """
+    线程安全的指标注册表，所有指标按 (名称, 标签) 聚合
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.histogram_buckets = dict(HISTOGRAM_BUCKETS)
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        self._gauges: Dict[str, Dict[tuple, float]] = {}
+        # name -> label_key -> [各分桶计数, 总和, 总数]
+        self._histograms: Dict[str, Dict[tuple, list]] = {}
+        self._callbacks: List[MetricsCallback] = []
+        self._lock = threading.Lock()
+
+    # ------------------- 回调 -------------------
+    def add_callback(self, callback: MetricsCallback):
+        """
+        注册回调，每次记录指标时以 callback(kind, name, value, labels) 调用
+        """
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback: MetricsCallback):
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+    def _emit(self, kind, name, value, labels):
+        for callback in list(self._callbacks):
+            try:
+                callback(kind, name, value, labels)
+            except Exception as e:
+                print(f"Metrics callback {callback} failed: {e}")
+
+    # ------------------- 记录 -------------------
+    def inc(self, name: str, value: float = 1, **labels):
+        """
+        计数器加 value
+        """
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+        self._emit("counter", name, value, labels)
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """
+        设置仪表盘的当前值
+        """
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+        self._emit("gauge", name, value, labels)
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        向直方图记录一次观测值
+        """
+        key = _label_key(labels)
+        buckets = self._get_buckets(name)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = [[0] * len(buckets), 0.0, 0]
+            histogram = series[key]
+            index = bisect_left(buckets, value)
+            if index < len(buckets):
+                histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+        self._emit("histogram", name, value, labels)
+
+    def _get_buckets(self, name):
+        return self.histogram_buckets.get(name, self.buckets)
+
+    @contextmanager
+    def span(self, stage: str, **labels):
+        """
+        记录代码块耗时到 hivision_stage_seconds{stage=...}，异常时同样记录
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(
+                STAGE_SECONDS, time.perf_counter() - start_time, stage=stage, **labels
+            )
+
+    @contextmanager
+    def peak_memory(self, stage: str, **labels):
+        """
+        记录代码块新分配内存的峰值到 hivision_peak_memory_bytes{stage=...}，
+        仅在 tracemalloc 已开启时生效（HIVISION_TRACE_MEMORY=1）。
+        tracemalloc 的峰值是进程级的，并发请求时包含其他线程的分配
+        """
+        if not tracemalloc.is_tracing():
+            yield
+            return
+        start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            self.observe(
+                "hivision_peak_memory_bytes", max(peak - start, 0), stage=stage, **labels
+            )
+
+    def timed(self, stage: str, fn: Callable, **labels) -> Callable:
+        """
+        返回记录 fn 耗时的包装函数，便于交给执行器运行
+        """
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self.span(stage, **labels):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    # ------------------- 读取与导出 -------------------
+    def snapshot(self) -> dict:
+        """
+        返回当前所有指标的副本，直方图为 {"buckets": [...], "sum": x, "count": n}
+        """
+        with self._lock:
+            return {
+                "counters": {
+                    name: {key: value for key, value in series.items()}
+                    for name, series in self._counters.items()
+                },
+                "gauges": {
+                    name: {key: value for key, value in series.items()}
+                    for name, series in self._gauges.items()
+                },
+                "histograms": {
+                    name: {
+                        key: {
+                            "buckets": list(hist[0]),
+                            "sum": hist[1],
+                            "count": hist[2],
+                        }
+                        for key, hist in series.items()
+                    }
+                    for name, series in self._histograms.items()
+                },
+            }
+
+    def render_prometheus(self) -> str:
+        """
+        导出 Prometheus 文本格式（0.0.4）
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for kind, metrics in (
+            ("counter", snapshot["counters"]),
+            ("gauge", snapshot["gauges"]),
+        ):
+            for name in sorted(metrics):
+                self._render_header(lines, name, kind)
+                for key, value in sorted(metrics[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+        for name in sorted(snapshot["histograms"]):
+            self._render_header(lines, name, "histogram")
+            for key, hist in sorted(snapshot["histograms"][name].items()):
+                cumulative = 0
+                for bound, count in zip(self._get_buckets(name), hist["buckets"]):
+                    cumulative += count
+                    le = (("le", _format_value(bound)),)
+                    lines.append(f"{name}_bucket{_format_labels(key, le)} {cumulative}")
+                lines.append(
+                    f'{name}_bucket{_format_labels(key, (("le", "+Inf"),))} {hist["count"]}'
+                )
+                lines.append(f"{name}_sum{_format_labels(key)} {hist['sum']!r}")
+                lines.append(f"{name}_count{_format_labels(key)} {hist['count']}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_header(lines, name, kind):
+        if name in METRIC_HELP:
+            lines.append(f"# HELP {name} {METRIC_HELP[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+def print_span_callback(kind, name, value, labels):
+    """
+    把各阶段耗时打印到标准输出，用于本地调试
+    """
+    if name == STAGE_SECONDS:
+        extra = "".join(
+            f" {key}={value}" for key, value in labels.items() if key != "stage"
+        )
+        print(f"[{labels.get('stage')}]{extra} Time: {value:.3f}s")
+
+
+METRICS = Metrics()
+
+# HIVISION_LOG_TIMING=1 时打印各阶段耗时
+if os.getenv("HIVISION_LOG_TIMING", "").lower() in ("1", "true", "yes"):
+    METRICS.add_callback(print_span_callback)
+
+# HIVISION_TRACE_MEMORY=1 时开启 tracemalloc，记录每次生成证件照的内存峰值
+if os.getenv("HIVISION_TRACE_MEMORY", "").lower() in ("1", "true", "yes"):
+    tracemalloc.start()
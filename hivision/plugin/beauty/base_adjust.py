@@ -82,27 +82,39 @@ def sharpen_image(image, strength=0):
     返回:
     numpy.ndarray: 锐化后的图像。
     """
-    print(f"Sharpen strength: {strength}")
     if strength == 0:
         return image.copy()
 
-    strength = strength * 20
-    kernel_strength = 1 + (strength / 500)
-
-    kernel = (
-        np.array([[-0.5, -0.5, -0.5], [-0.5, 5, -0.5], [-0.5, -0.5, -0.5]])
-        * kernel_strength
-    )
+    kernel, alpha = sharpen_kernel(strength)
 
     sharpened = cv2.filter2D(image, -1, kernel)
     sharpened = np.clip(sharpened, 0, 255).astype(np.uint8)
 
-    alpha = strength / 200
     blended = cv2.addWeighted(image, 1 - alpha, sharpened, alpha, 0)
 
     return blended
 
 
+def sharpen_kernel(strength):
+    """
+    锐化卷积核及锐化结果的混合权重。
+
+    参数:
+    strength (float): 锐化强度。
+
+    返回:
+    tuple: (卷积核, 混合权重)。
+    """
+    strength = strength * 20
+    kernel_strength = 1 + (strength / 500)
+
+    kernel = (
+        np.array([[-0.5, -0.5, -0.5], [-0.5, 5, -0.5], [-0.5, -0.5, -0.5]])
+        * kernel_strength
+    )
+    return kernel, strength / 200
+
+
 # Gradio接口
 def base_adjustment(image, brightness, contrast, sharpen, saturation):
     adjusted = adjust_brightness_contrast_sharpen_saturation(
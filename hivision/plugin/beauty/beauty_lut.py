@@ -0,0 +1,173 @@
+"""
+美颜点运算融合模块
+美白、饱和度、亮度/对比度都是逐像素的颜色映射，同一组参数反复使用时依次作用于全部 256³ 种颜色，
+合成一张查找表，整张图只查一次表；其余情况直接作用于图像像素。
+锐化是唯一的邻域运算，直接在输出的 BGRA 图像上原地完成
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+import cv2
+import numpy as np
+from hivision.plugin.beauty.whitening import identity_colors, make_whiter
+from hivision.plugin.beauty.base_adjust import adjust_saturation, sharpen_kernel
+
+# 缓存的融合查找表个数，每个约 64MB，为 0 时不合成查找表
+BEAUTY_CACHE_SIZE = int(os.getenv("HIVISION_BEAUTY_CACHE_SIZE", 2))
+# 同一组参数使用到第几次时才合成查找表。合成约需 1 秒，每次查表比直接计算节省几十毫秒，
+# 拖动滑块时参数几乎每次都不同，直接计算更快
+BEAUTY_LUT_MIN_USES = int(os.getenv("HIVISION_BEAUTY_LUT_MIN_USES", 16))
+# identity_colors 的行宽，直接计算时像素按同样的行宽排列，保证结果与查表一致
+COLOR_ROW_WIDTH = 4096
+# 直接计算时每次处理的行数
+COLOR_CHUNK_ROWS = 32
+# 记录使用次数的参数组合个数上限
+_USE_COUNTS_SIZE = 256
+_use_counts: "OrderedDict[tuple, int]" = OrderedDict()
+_use_counts_lock = threading.Lock()
+
+
+def has_point_ops(
+    whitening_strength=0, brightness_strength=0, contrast_strength=0, saturation_strength=0
+):
+    return (
+        whitening_strength > 0
+        or brightness_strength != 0
+        or contrast_strength != 0
+        or saturation_strength != 0
+    )
+
+
+def point_ops(
+    colors,
+    whitening_strength=0,
+    brightness_strength=0,
+    contrast_strength=0,
+    saturation_strength=0,
+) -> np.ndarray:
+    """
+    按美白 -> 饱和度 -> 亮度/对比度的顺序处理颜色，与逐步处理一致
+    :param colors: BGR 图像
+    """
+    if whitening_strength > 0:
+        # 与 make_whitening 一致，但直接逐次查单次美白的查找表，不触发多次美白合成查找表
+        colors = cv2.cvtColor(
+            make_whiter.run_passes(
+                cv2.cvtColor(colors, cv2.COLOR_RGB2BGR), whitening_strength
+            ),
+            cv2.COLOR_BGR2RGB,
+        )
+    if saturation_strength != 0:
+        colors = adjust_saturation(colors, saturation_strength)
+    if brightness_strength != 0 or contrast_strength != 0:
+        colors = cv2.convertScaleAbs(
+            colors, alpha=1.0 + (contrast_strength / 100.0), beta=brightness_strength
+        )
+    return colors
+
+
+@lru_cache(maxsize=max(BEAUTY_CACHE_SIZE, 0))
+def fused_lut(
+    whitening_strength=0, brightness_strength=0, contrast_strength=0, saturation_strength=0
+) -> np.ndarray:
+    """
+    对全部 256³ 种颜色执行 point_ops 合成查找表。
+    OpenCV 的 HSV 转 BGR 在每行末尾不足一个向量宽度的像素上取整方式不同，
+    逐步处理时这些像素的饱和度结果可能相差 1，查表则对所有像素一致
+    :return: 长度为 256³ 的只读 uint32 数组，按 (c0 << 16) | (c1 << 8) | c2 索引，
+        每个元素在内存中依次为处理后的 c0、c1、c2 与一个占位字节，查表结果可以直接视为 BGRA 图像
+    """
+    colors = point_ops(
+        identity_colors(),
+        whitening_strength,
+        brightness_strength,
+        contrast_strength,
+        saturation_strength,
+    )
+
+    packed = np.zeros((256**3, 4), dtype=np.uint8)
+    packed[:, :3] = colors.reshape(-1, 3)
+    packed = packed.view(np.uint32).reshape(-1)
+    packed.setflags(write=False)
+    return packed
+
+
+def use_fused_lut(*point_params) -> bool:
+    """
+    记录一次参数组合的使用，使用次数达到 BEAUTY_LUT_MIN_USES 且允许缓存查找表时返回 True
+    """
+    if BEAUTY_CACHE_SIZE <= 0:
+        return False
+    with _use_counts_lock:
+        count = _use_counts.pop(point_params, 0) + 1
+        _use_counts[point_params] = count
+        while len(_use_counts) > _USE_COUNTS_SIZE:
+            _use_counts.popitem(last=False)
+    return count >= BEAUTY_LUT_MIN_USES
+
+
+def apply_point_ops(image, *point_params) -> np.ndarray:
+    """
+    直接对图像像素执行 point_ops。像素按 identity_colors 的行宽分块排列，
+    使每个像素与查表时走相同的计算路径，结果与查表逐像素一致，同时临时数组只有一个分块大小
+    :return: 新的 BGRA 图像，alpha 通道未初始化
+    """
+    height, width = image.shape[:2]
+    result = cv2.cvtColor(image[:, :, :3], cv2.COLOR_BGR2BGRA)
+    pixels = result.reshape(-1, 4)
+    chunk = COLOR_CHUNK_ROWS * COLOR_ROW_WIDTH
+    colors = np.zeros((chunk, 3), dtype=np.uint8)
+    for start in range(0, height * width, chunk):
+        count = min(chunk, height * width - start)
+        colors[:count] = pixels[start : start + count, :3]
+        rows = -(-count // COLOR_ROW_WIDTH)
+        processed = point_ops(
+            colors[: rows * COLOR_ROW_WIDTH].reshape(rows, COLOR_ROW_WIDTH, 3),
+            *point_params,
+        )
+        pixels[start : start + count, :3] = processed.reshape(-1, 3)[:count]
+    return result
+
+
+def apply_beauty(
+    image,
+    alpha,
+    whitening_strength=0,
+    brightness_strength=0,
+    contrast_strength=0,
+    sharpen_strength=0,
+    saturation_strength=0,
+):
+    """
+    对 BGR 图像做美白、亮度、对比度、锐化、饱和度调整，并合并 alpha 通道
+    :param image: BGR 图像
+    :param alpha: 与 image 同尺寸的 alpha 通道
+    :return: 新的 BGRA 图像，image 与 alpha 不会被修改
+    """
+    height, width = image.shape[:2]
+    point_params = (
+        whitening_strength, brightness_strength, contrast_strength, saturation_strength
+    )
+    if not has_point_ops(*point_params):
+        result = cv2.cvtColor(image[:, :, :3], cv2.COLOR_BGR2BGRA)
+    elif use_fused_lut(*point_params):
+        lut = fused_lut(*point_params)
+        index = image[:, :, 0].astype(np.int32)
+        index <<= 8
+        index |= image[:, :, 1]
+        index <<= 8
+        index |= image[:, :, 2]
+        result = lut[index].view(np.uint8).reshape(height, width, 4)
+    else:
+        result = apply_point_ops(image, *point_params)
+
+    if sharpen_strength != 0:
+        # 各通道独立卷积，alpha 通道随后被覆盖，因此直接对 BGRA 图像锐化
+        kernel, weight = sharpen_kernel(sharpen_strength)
+        sharpened = cv2.filter2D(result, -1, kernel)
+        cv2.addWeighted(result, 1 - weight, sharpened, weight, 0, dst=result)
+
+    result[:, :, 3] = alpha
+    return result
@@ -1,9 +1,50 @@
+from typing import Optional, Tuple
 import cv2
 from hivision.creator.context import Context
-from hivision.plugin.beauty.whitening import make_whitening
-from hivision.plugin.beauty.base_adjust import (
-    adjust_brightness_contrast_sharpen_saturation,
-)
+from hivision.plugin.beauty.beauty_lut import apply_beauty, has_point_ops
+
+# 美颜区域：full 为整张图；matte 为抠图 alpha 的外接矩形；
+# face 为人脸框向四周扩展后与 alpha 外接矩形的交集，需要在人脸检测之后进行
+BEAUTY_REGIONS = ("full", "matte", "face")
+# face 模式下人脸框向四周扩展的比例（相对人脸框的宽、高），覆盖额头、头发与脖子
+FACE_REGION_MARGIN = 0.5
+# 区域向外扩展的像素数：后续缩放插值会用到区域外紧邻的像素，扩展后 matte 模式的结果与 full 完全一致
+REGION_PADDING = 2
+
+
+def beauty_region(ctx: Context) -> Optional[Tuple[int, int, int, int]]:
+    """
+    计算美颜区域
+    :param ctx: Context对象
+    :return: (x1, y1, x2, y2)，整张图处理时返回 None，区域为空时返回 (0, 0, 0, 0)
+    """
+    region = ctx.params.beauty_region
+    if region not in BEAUTY_REGIONS:
+        raise ValueError(f"beauty_region must be one of {BEAUTY_REGIONS}")
+    if region == "full" or ctx.matting_image.shape[2] != 4:
+        return None
+
+    # alpha 为 0 的像素在换底后不可见，无需处理
+    x, y, width, height = cv2.boundingRect(ctx.matting_image[:, :, 3])
+    x1, y1, x2, y2 = x, y, x + width, y + height
+
+    # 仅换底时不进行人脸检测，退化为 matte
+    if region == "face" and ctx.face["rectangle"] is not None:
+        left, top, face_width, face_height = ctx.face["rectangle"]
+        x1 = max(x1, int(left - face_width * FACE_REGION_MARGIN))
+        y1 = max(y1, int(top - face_height * FACE_REGION_MARGIN))
+        x2 = min(x2, int(left + face_width * (1 + FACE_REGION_MARGIN)) + 1)
+        y2 = min(y2, int(top + face_height * (1 + FACE_REGION_MARGIN)) + 1)
+
+    if x2 <= x1 or y2 <= y1:
+        return 0, 0, 0, 0
+    height, width = ctx.matting_image.shape[:2]
+    return (
+        max(x1 - REGION_PADDING, 0),
+        max(y1 - REGION_PADDING, 0),
+        min(x2 + REGION_PADDING, width),
+        min(y2 + REGION_PADDING, height),
+    )
 
 
 def beauty_face(ctx: Context):
@@ -12,37 +53,56 @@ def beauty_face(ctx: Context):
     1. 美白
     2. 亮度
 
+    美白、亮度、对比度、饱和度合成为一张查找表一次完成，锐化直接写入结果图像。
+    ctx.params.beauty_region 不为 full 时只处理对应区域，区域外保持原样
+
     :param ctx: Context对象，包含处理参数和图像
     """
-    middle_image = ctx.origin_image.copy()
-    processed = False
-
-    # 如果美白强度大于0，进行美白处理
-    if ctx.params.whitening_strength > 0:
-        middle_image = make_whitening(middle_image, ctx.params.whitening_strength)
-        processed = True
-
-    # 如果亮度、对比度、锐化强度不为0，进行亮度、对比度、锐化处理
-    if (
-        ctx.params.brightness_strength != 0
-        or ctx.params.contrast_strength != 0
-        or ctx.params.sharpen_strength != 0
-        or ctx.params.saturation_strength != 0
+    params = ctx.params
+    # 美白强度大于0，或亮度、对比度、锐化、饱和度强度不为0时才进行美颜处理
+    if not (
+        has_point_ops(
+            params.whitening_strength,
+            params.brightness_strength,
+            params.contrast_strength,
+            params.saturation_strength,
+        )
+        or params.sharpen_strength != 0
     ):
-        middle_image = adjust_brightness_contrast_sharpen_saturation(
-            middle_image,
-            ctx.params.brightness_strength,
-            ctx.params.contrast_strength,
-            ctx.params.sharpen_strength,
-            ctx.params.saturation_strength,
+        return
+
+    beauty_params = dict(
+        whitening_strength=params.whitening_strength,
+        brightness_strength=params.brightness_strength,
+        contrast_strength=params.contrast_strength,
+        sharpen_strength=params.sharpen_strength,
+        saturation_strength=params.saturation_strength,
+    )
+    region = beauty_region(ctx)
+    if region is None:
+        # 处理后的BGR通道与原始matting_image的alpha通道合并，更新matting_image
+        ctx.matting_image = apply_beauty(
+            ctx.origin_image, ctx.matting_image[:, :, 3], **beauty_params
         )
-        processed = True
-
-    # 如果进行了美颜处理，更新matting_image
-    if processed:
-        # 分离中间图像的BGR通道
-        b, g, r = cv2.split(middle_image)
-        # 从原始matting_image中获取alpha通道
-        _, _, _, alpha = cv2.split(ctx.matting_image)
-        # 合并处理后的BGR通道和原始alpha通道
-        ctx.matting_image = cv2.merge((b, g, r, alpha))
+        return
+
+    x1, y1, x2, y2 = region
+    if x2 <= x1 or y2 <= y1:
+        return
+    # 锐化是 3x3 邻域运算，区域向外多取一个像素，保证区域内的结果与整张图处理一致
+    height, width = ctx.origin_image.shape[:2]
+    pad = 1 if params.sharpen_strength != 0 else 0
+    px1, py1 = max(x1 - pad, 0), max(y1 - pad, 0)
+    px2, py2 = min(x2 + pad, width), min(y2 + pad, height)
+
+    processed = apply_beauty(
+        ctx.origin_image[py1:py2, px1:px2],
+        ctx.matting_image[py1:py2, px1:px2, 3],
+        **beauty_params,
+    )
+    # 仅裁剪时 matting_image 与输入图像是同一个数组，缓存或会话中的抠图结果为只读，
+    # 这两种情况先复制，避免修改输入或共享的数组
+    if ctx.matting_image is ctx.origin_image or not ctx.matting_image.flags.writeable:
+        ctx.matting_image = ctx.matting_image.copy()
+    # 区域外的像素保持原图，与 matting_image 的颜色通道一致，只需原地写回区域
+    ctx.matting_image[y1:y2, x1:x2] = processed[y1 - py1 : y2 - py1, x1 - px1 : x2 - px1]
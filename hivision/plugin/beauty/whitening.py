@@ -1,7 +1,44 @@
 import cv2
 import numpy as np
 import os
-import gradio as gr
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_LUT_PATH = os.path.join(base_dir, "lut/lut_origin.png")
+
+# LUT 精度：full 为 256³ 查找表（约 48MB，结果与原实现一致），
+# 64 / 33 为 64³ / 33³ 的紧凑查找表（约 3MB / 0.4MB），三线性插值
+LUT_MODES = ("full", "64", "33")
+WHITENING_LUT_MODE = os.getenv("HIVISION_WHITENING_LUT", "full")
+# LUT 缓存目录，多个进程通过内存映射共享同一份文件，设为空字符串时不使用缓存
+LUT_CACHE_DIR = os.getenv(
+    "HIVISION_LUT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "hivision")
+)
+# 按强度缓存的多次美白合成查找表个数，full 模式下每个约 48MB
+WHITENING_CACHE_SIZE = int(os.getenv("HIVISION_WHITENING_CACHE_SIZE", 2))
+# full 模式下同一强度使用到第几次时才合成查找表。合成约需 0.5 秒，每次查表比逐次美白节省约 40 毫秒，
+# 拖动滑块时强度几乎每次都不同，直接逐次美白更快
+WHITENING_COMPOSE_MIN_USES = int(os.getenv("HIVISION_WHITENING_COMPOSE_MIN_USES", 8))
+# 记录使用次数的强度个数上限
+_USE_COUNTS_SIZE = 256
+
+
+def identity_colors() -> np.ndarray:
+    """
+    包含全部 256³ 种颜色的 4096x4096x3 图像，第 (c0 << 16) | (c1 << 8) | c2 个像素为 (c0, c1, c2)。
+    逐像素的颜色映射作用于该图像后展平，即得到按同样方式索引的查找表
+    """
+    values = np.arange(256, dtype=np.uint8)
+    colors = np.empty((256, 256, 256, 3), dtype=np.uint8)
+    colors[..., 0] = values[:, np.newaxis, np.newaxis]
+    colors[..., 1] = values[np.newaxis, :, np.newaxis]
+    colors[..., 2] = values
+    return colors.reshape(4096, 4096, 3)
 
 
 class LutWhite:
@@ -9,9 +46,75 @@ class LutWhite:
     CUBE64_SIZE = 64
     CUBE256_SIZE = 256
     CUBE_SCALE = CUBE256_SIZE // CUBE64_SIZE
+    # 三线性插值时每次处理的行数，使临时数组保持在缓存友好的大小
+    CHUNK_ROWS = 128
+
+    def __init__(self, lut_image=None, lut_path=DEFAULT_LUT_PATH, mode=None, cache_dir=None):
+        """
+        查找表在首次使用时才生成
+        :param lut_image: 512x512 的 LUT 图像（8x8 个 64x64 的切片），为 None 时从 lut_path 读取
+        :param lut_path: LUT 图像路径
+        :param mode: LUT 精度，可选 full / 64 / 33，为 None 时使用 HIVISION_WHITENING_LUT
+        :param cache_dir: 缓存目录，为 None 时使用 HIVISION_LUT_CACHE_DIR
+        """
+        self.mode = str(mode or WHITENING_LUT_MODE)
+        if self.mode not in LUT_MODES:
+            raise ValueError(f"whitening LUT mode must be one of {LUT_MODES}")
+        self.lut_image = lut_image
+        self.lut_path = lut_path
+        self.cache_dir = LUT_CACHE_DIR if cache_dir is None else cache_dir
+        self._lut = None
+        self._table = None
+        self._lock = threading.Lock()
+
+    @property
+    def lut(self) -> np.ndarray:
+        """
+        full 模式下为 [256, 256, 256, 3] 的 uint8 查找表，
+        紧凑模式下为 [n, n, n, 3] 的 float32 格点表，均按 [b, g, r] 索引
+        """
+        if self._lut is None:
+            with self._lock:
+                if self._lut is None:
+                    self._lut = self._load_lut()
+        return self._lut
 
-    def __init__(self, lut_image):
-        self.lut = self._create_lut(lut_image)
+    def _load_lut(self):
+        lut_image = self.lut_image
+        if lut_image is None:
+            lut_image = cv2.imread(self.lut_path)
+            if lut_image is None:
+                raise FileNotFoundError(f"LUT image not found: {self.lut_path}")
+
+        if self.mode == "full":
+            build = lambda: self._create_lut(lut_image)
+        else:
+            build = lambda: self._create_compact_lut(lut_image, int(self.mode))
+
+        if not self.cache_dir:
+            return build()
+
+        key = hashlib.sha1(np.ascontiguousarray(lut_image).tobytes()).hexdigest()[:16]
+        cache_path = os.path.join(self.cache_dir, f"whitening_lut_{self.mode}_{key}.npy")
+        if os.path.exists(cache_path):
+            try:
+                return np.asarray(np.load(cache_path, mmap_mode="r"))
+            except (OSError, ValueError):
+                # 缓存文件损坏时重新生成
+                pass
+
+        lut = build()
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # 先写临时文件再原子替换，避免其他进程读到写了一半的文件
+            tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, lut)
+            os.replace(tmp_path, cache_path)
+            return np.asarray(np.load(cache_path, mmap_mode="r"))
+        except OSError as e:
+            print(f"Failed to write whitening LUT cache {cache_path}: {e}")
+            return lut
 
     def _create_lut(self, lut_image):
         reshape_lut = np.zeros(
@@ -28,14 +131,121 @@ class LutWhite:
             reshape_lut[i * self.CUBE_SCALE : (i + 1) * self.CUBE_SCALE] = cube256
         return reshape_lut
 
-    def apply(self, src):
-        b, g, r = src[:, :, 0], src[:, :, 1], src[:, :, 2]
-        return self.lut[b, g, r]
+    def _create_compact_lut(self, lut_image, size):
+        """
+        LUT 图像本身就是 64³ 的格点表：第 i 个切片对应 b，切片内的行、列对应 g、r，
+        格点 k 对应颜色值 k * 255 / 63。33³ 由 64³ 三线性重采样得到
+        """
+        rows = self.CUBE64_ROWS
+        n = self.CUBE64_SIZE
+        lattice = (
+            lut_image[: rows * n, : rows * n]
+            .reshape(rows, n, rows, n, 3)
+            .transpose(0, 2, 1, 3, 4)
+            .reshape(n, n, n, 3)
+            .astype(np.float32)
+        )
+        if size == n:
+            return lattice
+        nodes = np.linspace(0, 255, size, dtype=np.float32)
+        grid = np.stack(np.meshgrid(nodes, nodes, nodes, indexing="ij"), axis=-1)
+        return self._trilinear(lattice, grid).astype(np.float32)
+
+    @staticmethod
+    def _trilinear(lattice, points):
+        """
+        在格点表上对 [..., 3]（b, g, r，取值 0-255）的点做三线性插值，返回 float32
+        """
+        n = lattice.shape[0]
+        coords = points.astype(np.float32) * np.float32((n - 1) / 255.0)
+        index = np.minimum(coords.astype(np.int32), n - 2)
+        frac = coords - index
+        b0, g0, r0 = index[..., 0], index[..., 1], index[..., 2]
+        fb, fg, fr = frac[..., 0:1], frac[..., 1:2], frac[..., 2:3]
+
+        c00 = lattice[b0, g0, r0] * (1 - fr) + lattice[b0, g0, r0 + 1] * fr
+        c01 = lattice[b0, g0 + 1, r0] * (1 - fr) + lattice[b0, g0 + 1, r0 + 1] * fr
+        c10 = lattice[b0 + 1, g0, r0] * (1 - fr) + lattice[b0 + 1, g0, r0 + 1] * fr
+        c11 = lattice[b0 + 1, g0 + 1, r0] * (1 - fr) + lattice[b0 + 1, g0 + 1, r0 + 1] * fr
+        c0 = c00 * (1 - fg) + c01 * fg
+        c1 = c10 * (1 - fg) + c11 * fg
+        return c0 * (1 - fb) + c1 * fb
+
+    @property
+    def table(self):
+        """
+        apply 默认使用的查找表
+        """
+        if self._table is None:
+            self._table = self.prepare(self.lut)
+        return self._table
+
+    def prepare(self, lut):
+        """
+        把查找表转为 apply 使用的形式：full 模式原样返回，
+        紧凑模式把 [n, n, n, 3] 格点表按 b 排成二维切片图，供 cv2.remap 在 (g, r) 上做双线性插值
+        """
+        if self.mode == "full":
+            return lut
+        n = lut.shape[0]
+        cols = int(np.ceil(np.sqrt(n)))
+        rows = int(np.ceil(n / cols))
+        tiles = np.zeros((rows * cols, n, n, 3), dtype=np.float32)
+        tiles[:n] = lut
+        tiles = tiles.reshape(rows, cols, n, n, 3).transpose(0, 2, 1, 3, 4)
+        return tiles.reshape(rows * n, cols * n, 3), cols, n
+
+    def apply(self, src, table=None):
+        """
+        :param src: BGR 图像
+        :param table: prepare 返回的查找表，为 None 时使用 self.table
+        """
+        table = self.table if table is None else table
+        if self.mode == "full":
+            # 按展平后的下标 (b << 16) | (g << 8) | r 取值，比三个下标数组的高级索引快
+            index = src[:, :, 0].astype(np.int32) << 16
+            index |= src[:, :, 1].astype(np.int32) << 8
+            index |= src[:, :, 2]
+            return np.take(table.reshape(-1, 3), index, axis=0)
+
+        tiles, cols, n = table
+        # 输入为 uint8，每个通道的格点坐标只有 256 种，预先查表
+        coords = np.arange(256, dtype=np.float32) * np.float32((n - 1) / 255.0)
+        index_table = np.minimum(coords.astype(np.int32), n - 2)
+        frac_table = coords - index_table
+
+        dst = np.empty(src.shape[:2] + (3,), dtype=np.uint8)
+        for start in range(0, src.shape[0], self.CHUNK_ROWS):
+            block = src[start : start + self.CHUNK_ROWS]
+            b, g, r = block[:, :, 0], block[:, :, 1], block[:, :, 2]
+            b0 = index_table[b]
+            # 相邻切片在切片图中不连续，b 方向分别对 b0、b0+1 两个切片做双线性插值后线性混合
+            slices = []
+            for slice_index in (b0, b0 + 1):
+                map_x = (slice_index % cols) * n + coords[r]
+                map_y = (slice_index // cols) * n + coords[g]
+                slices.append(
+                    cv2.remap(tiles, map_x.astype(np.float32), map_y.astype(np.float32), cv2.INTER_LINEAR)
+                )
+            fb = frac_table[b][:, :, np.newaxis]
+            value = slices[0] + (slices[1] - slices[0]) * fb
+            np.clip(value + 0.5, 0, 255, out=value)
+            dst[start : start + self.CHUNK_ROWS] = value
+        return dst
 
 
 class MakeWhiter:
-    def __init__(self, lut_image):
-        self.lut_white = LutWhite(lut_image)
+    def __init__(self, lut_image=None, lut_path=DEFAULT_LUT_PATH, mode=None, cache_size=None):
+        """
+        :param cache_size: 缓存的多次美白合成查找表个数，为 None 时使用 HIVISION_WHITENING_CACHE_SIZE
+        """
+        self.lut_white = LutWhite(lut_image, lut_path=lut_path, mode=mode)
+        if cache_size is None:
+            cache_size = WHITENING_CACHE_SIZE
+        self.cache_size = cache_size
+        self.composed_table = lru_cache(maxsize=max(cache_size, 0))(self._compose)
+        self._use_counts: "OrderedDict[int, int]" = OrderedDict()
+        self._use_counts_lock = threading.Lock()
 
     def run(self, src: np.ndarray, strength: int) -> np.ndarray:
         strength = np.clip(strength / 10.0, 0, 1)
@@ -44,22 +254,73 @@ class MakeWhiter:
         img = self.lut_white.apply(src[:, :, :3])
         return cv2.addWeighted(src[:, :, :3], 1 - strength, img, strength, 0)
 
+    def run_passes(self, src: np.ndarray, strength: int) -> np.ndarray:
+        """
+        先做 strength // 10 次强度为 10 的美白，再做一次强度为 strength % 10 的美白，每次都直接查单次美白的查找表
+        """
+        for _ in range(strength // 10):
+            src = self.run(src, 10)
+        return self.run(src, strength % 10)
 
-base_dir = os.path.dirname(os.path.abspath(__file__))
-default_lut = cv2.imread(os.path.join(base_dir, "lut/lut_origin.png"))
-make_whiter = MakeWhiter(default_lut)
+    def run_iterated(self, src: np.ndarray, strength: int) -> np.ndarray:
+        """
+        与 run_passes 结果一致。full 模式下强度不小于 10（需要多次美白）且使用到 WHITENING_COMPOSE_MIN_USES 次后，
+        各次美白才合成为一张查找表（按强度缓存），整张图只查一次表；此前直接逐次美白。
+        紧凑模式的格点表很小，总是合成
+        """
+        if strength == 0:
+            return src
+        if self.lut_white.mode == "full" and (
+            strength < 10 or not self._use_composed(strength)
+        ):
+            return self.run_passes(src, strength)
+        return self.lut_white.apply(src[:, :, :3], self.composed_table(strength))
 
+    def _use_composed(self, strength) -> bool:
+        """
+        记录一次强度的使用，使用次数达到 WHITENING_COMPOSE_MIN_USES 且允许缓存时返回 True
+        """
+        if self.cache_size <= 0:
+            return False
+        with self._use_counts_lock:
+            count = self._use_counts.pop(strength, 0) + 1
+            self._use_counts[strength] = count
+            while len(self._use_counts) > _USE_COUNTS_SIZE:
+                self._use_counts.popitem(last=False)
+        return count >= WHITENING_COMPOSE_MIN_USES
 
-def make_whitening(image, strength):
-    image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+    def _compose(self, strength):
+        iteration = strength // 10
+        bias = strength % 10
 
-    iteration = strength // 10
-    bias = strength % 10
+        if self.lut_white.mode == "full":
+            # 每次美白都是逐像素的颜色映射，对全部 256³ 种颜色依次执行即可得到与逐次美白完全一致的查找表
+            colors = identity_colors()
+            for i in range(iteration):
+                colors = self.run(colors, 10)
+            colors = self.run(colors, bias)
+            return self.lut_white.prepare(colors.reshape(256, 256, 256, 3))
 
-    for i in range(iteration):
-        image = make_whiter.run(image, 10)
+        # 紧凑模式在格点上合成，中间结果不取整
+        lattice = self.lut_white.lut
+        nodes = np.linspace(0, 255, lattice.shape[0], dtype=np.float32)
+        colors = np.stack(np.meshgrid(nodes, nodes, nodes, indexing="ij"), axis=-1)
+        weights = [1.0] * int(iteration) + [np.clip(bias / 10.0, 0, 1)]
+        for weight in weights:
+            if weight > 0:
+                whitened = self.lut_white._trilinear(lattice, colors)
+                colors = colors * np.float32(1 - weight) + whitened * np.float32(weight)
+        return self.lut_white.prepare(colors.astype(np.float32))
 
-    image = make_whiter.run(image, bias)
+
+# 查找表在首次美白时才生成，仅导入本模块不占用内存
+make_whiter = MakeWhiter()
+
+
+def make_whitening(image, strength):
+    image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+
+    image = make_whiter.run_iterated(image, strength)
 
     return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
@@ -78,6 +339,8 @@ def make_whitening_png(image, strength):
 
 # 启动Gradio应用
 if __name__ == "__main__":
+    import gradio as gr
+
     demo = gr.Interface(
         fn=make_whitening,
         inputs=[
@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+r"""
+@DATE: 2026/10/18 21:10
+@File: responses.py
+@IDE: pycharm
+@Description:
+    API 响应格式协商：根据请求的 Accept 头返回 base64 JSON（默认）、
+    原始图像字节或 multipart/mixed 多图响应
+"""
+import uuid
+import weakref
+from contextlib import nullcontext
+from typing import Awaitable, Callable, List, Optional, Tuple, Union
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from hivision.utils import bytes_2_base64, available_image_formats
+
+RESPONSE_JSON = "json"
+RESPONSE_IMAGE = "image"
+RESPONSE_MULTIPART = "multipart"
+
+# Accept 中的媒体类型与响应格式的对应关系，未列出的类型忽略
+ACCEPT_FORMATS = {
+    "application/json": RESPONSE_JSON,
+    "*/*": RESPONSE_JSON,
+    "image/*": RESPONSE_IMAGE,
+    "image/png": RESPONSE_IMAGE,
+    "image/jpeg": RESPONSE_IMAGE,
+    "image/webp": RESPONSE_IMAGE,
+    "image/jxl": RESPONSE_IMAGE,
+    "multipart/mixed": RESPONSE_MULTIPART,
+    "multipart/*": RESPONSE_MULTIPART,
+}
+
+# Accept 中出现这些类型时始终返回 JSON。浏览器的默认 Accept 同时包含 text/html 与 image/webp 等类型，
+# 表单提交时仍应得到 JSON
+JSON_MEDIA_TYPES = ("application/json", "text/html")
+
+# 可以代替 PNG 输出的图像格式
+ACCEPT_IMAGE_FORMATS = {
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/jxl": "jxl",
+}
+
+# 流式输出时每次发送的字节数
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# 编码结果：图像字节，或指定 kb 时的 (图像字节, 编码信息)，编码信息见 resize_image_to_kb
+Encoded = Union[bytes, Tuple[bytes, dict]]
+# multipart 的一个部分：(名称, 编码结果或返回编码结果的协程函数)
+Part = Tuple[str, Union[Encoded, Callable[[], Awaitable[Encoded]]]]
+
+
+def _accept_items(accept: str):
+    """
+    解析 Accept 头，按 q 值从高到低、同 q 值按出现顺序返回媒体类型，q=0 的类型被排除
+    """
+    items = []
+    for index, item in enumerate(accept.split(",")):
+        media_type, *params = [value.strip() for value in item.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            items.append((-quality, index, media_type.lower()))
+    return [media_type for _, _, media_type in sorted(items)]
+
+
+def negotiate_format(accept: str) -> str:
+    """
+    只有 Accept 中明确列出图像或 multipart 类型、且没有 application/json 与 text/html 时，
+    才按 q 值从高到低选择第一个支持的媒体类型，其余情况均返回 json
+    :param accept: 请求的 Accept 头
+    :return: json / image / multipart
+    """
+    media_types = _accept_items(accept or "")
+    if any(media_type in JSON_MEDIA_TYPES for media_type in media_types):
+        return RESPONSE_JSON
+    for media_type in media_types:
+        if media_type in ACCEPT_FORMATS:
+            return ACCEPT_FORMATS[media_type]
+    return RESPONSE_JSON
+
+
+def negotiate_image_format(accept: str, response_format: str) -> str:
+    """
+    选择无损图像（原本为 PNG）的输出格式。JSON 响应始终为 PNG；
+    直接返回图像时，Accept 中排在 PNG 之前且服务端支持的 WebP / JPEG-XL 优先
+    :return: png / webp / jxl
+    """
+    if response_format == RESPONSE_JSON:
+        return "png"
+    formats = available_image_formats()
+    for media_type in _accept_items(accept or ""):
+        image_format = ACCEPT_IMAGE_FORMATS.get(media_type)
+        if image_format in formats:
+            return image_format
+    return "png"
+
+
+def split_encoded(encoded: Encoded) -> Tuple[bytes, Optional[dict]]:
+    """
+    :return: (图像字节, 编码信息)，未指定 kb 时编码信息为 None
+    """
+    if isinstance(encoded, tuple):
+        return encoded
+    return encoded, None
+
+
+def kb_info_json(info: dict) -> dict:
+    """
+    指定 kb 时的编码信息，fits 为 False 表示无法满足目标大小，图像超出了 kb
+    """
+    return {
+        "size_kb": round(info["size_kb"], 2),
+        "quality": info["quality"],
+        "scale": float(f"{info['scale']:.4g}"),
+        "attempts": info["attempts"],
+        "fits": info["fits"],
+    }
+
+
+def kb_info_headers(info: Optional[dict]) -> dict:
+    """
+    编码信息对应的响应头，用于直接返回图像与 multipart 的各部分
+    """
+    if info is None:
+        return {}
+    fields = kb_info_json(info)
+    return {
+        "X-KB-Size": str(fields["size_kb"]),
+        "X-KB-Quality": str(fields["quality"]),
+        "X-KB-Scale": str(fields["scale"]),
+        "X-KB-Attempts": str(fields["attempts"]),
+        "X-KB-Fits": "true" if fields["fits"] else "false",
+    }
+
+
+def image_media_type(data: bytes) -> str:
+    """
+    根据文件头判断图像类型
+    """
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data.startswith(b"\xff\x0a") or data[4:8] == b"JXL ":
+        return "image/jxl"
+    return "application/octet-stream"
+
+
+def _extension(media_type: str) -> str:
+    return {
+        "image/png": "png",
+        "image/jpeg": "jpg",
+        "image/webp": "webp",
+        "image/jxl": "jxl",
+    }.get(media_type, "bin")
+
+
+def image_response(encoded: Encoded, name: str = "image") -> Response:
+    """
+    直接返回图像字节，Content-Type 为图像的实际格式（指定 kb 时为 JPEG，否则为 PNG 或协商出的 WebP / JPEG-XL），
+    指定 kb 时编码信息放在 X-KB-* 响应头中
+    """
+    data, info = split_encoded(encoded)
+    media_type = image_media_type(data)
+    return Response(
+        content=data,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'inline; filename="{name}.{_extension(media_type)}"',
+            **kb_info_headers(info),
+        },
+    )
+
+
+def multipart_response(parts: List[Part], reservation=None) -> StreamingResponse:
+    """
+    以 multipart/mixed 流式返回多张图像。部分内容可以是协程函数，
+    在前面的部分发送之后才执行，例如先发送标准照，再编码高清照。
+    指定 kb 的部分带有 X-KB-* 头
+    :param reservation: 执行器预留的名额（见 BoundedExecutor.reserve），协程函数在其中执行，
+        响应头发出之后不会因为执行器繁忙而中断；响应结束或被丢弃时释放
+    """
+    boundary = uuid.uuid4().hex
+
+    async def body():
+        try:
+            for name, source in parts:
+                if isinstance(source, (bytes, tuple)):
+                    encoded = source
+                else:
+                    with reservation.use() if reservation else nullcontext():
+                        encoded = await source()
+                data, info = split_encoded(encoded)
+                media_type = image_media_type(data)
+                extra_headers = "".join(
+                    f"{key}: {value}\r\n" for key, value in kb_info_headers(info).items()
+                )
+                yield (
+                    f"--{boundary}\r\n"
+                    f"Content-Type: {media_type}\r\n"
+                    f'Content-Disposition: inline; name="{name}"; filename="{name}.{_extension(media_type)}"\r\n'
+                    f"Content-Length: {len(data)}\r\n{extra_headers}\r\n"
+                ).encode()
+                view = memoryview(data)
+                for start in range(0, len(view), STREAM_CHUNK_SIZE):
+                    yield bytes(view[start : start + STREAM_CHUNK_SIZE])
+                yield b"\r\n"
+            yield f"--{boundary}--\r\n".encode()
+        finally:
+            if reservation:
+                reservation.release()
+
+    content = body()
+    if reservation:
+        # 客户端在响应开始前断开时 body 不会执行，随生成器回收释放名额
+        weakref.finalize(content, reservation.release)
+    return StreamingResponse(
+        content, media_type=f"multipart/mixed; boundary={boundary}"
+    )
+
+
+def _reserve(executor, parts: List[Part]):
+    """
+    multipart 中有延迟编码的部分时，在响应开始之前向执行器预留名额
+    """
+    if executor is None or all(isinstance(source, (bytes, tuple)) for _, source in parts):
+        return None
+    return executor.reserve()
+
+
+def failure_response(response_format: str, content: dict):
+    """
+    处理失败时的响应：JSON 格式保持原样返回，协商为图像时以 422 返回同样的 JSON
+    """
+    if response_format == RESPONSE_JSON:
+        return content
+    return JSONResponse(status_code=422, content=content)
+
+
+async def image_result(response_format: str, encoded: Encoded, name: str = "image"):
+    """
+    单张图像接口的成功响应，指定 kb 时 JSON 中带有 kb_info
+    """
+    if response_format == RESPONSE_IMAGE:
+        return image_response(encoded, name)
+    if response_format == RESPONSE_MULTIPART:
+        return multipart_response([(name, encoded)])
+    data, info = split_encoded(encoded)
+    result_message = {"status": True, "image_base64": bytes_2_base64(data)}
+    if info is not None:
+        result_message["kb_info"] = kb_info_json(info)
+    return result_message
+
+
+async def idphoto_result(
+    response_format: str,
+    standard: bytes,
+    encode_hd: Callable[[], Awaitable[bytes]] = None,
+    variants: List[dict] = None,
+    executor=None,
+):
+    """
+    标准照与高清照接口的成功响应
+    :param standard: 标准照字节
+    :param encode_hd: 编码高清照的协程函数，不需要高清照时为 None。
+        协商为图像时只返回标准照，不会编码高清照；multipart 时在标准照发送之后才编码
+    :param variants: 额外尺寸，每项为 {"height", "width", "encode_standard", "encode_hd"}，
+        后两项为编码该尺寸标准照、高清照的协程函数，encode_hd 可以为 None。
+        multipart 时各部分名为 variant{序号}_standard、variant{序号}_hd
+    :param executor: 协程函数使用的 BoundedExecutor。multipart 时在返回响应之前预留一个名额，
+        名额不足时在此抛出 APIError，而不是在响应发送途中中断
+    """
+    variants = variants or []
+    if response_format == RESPONSE_IMAGE:
+        return image_response(standard, "standard")
+    if response_format == RESPONSE_MULTIPART:
+        parts = [("standard", standard)]
+        if encode_hd is not None:
+            parts.append(("hd", encode_hd))
+        for index, variant in enumerate(variants):
+            parts.append((f"variant{index}_standard", variant["encode_standard"]))
+            if variant["encode_hd"] is not None:
+                parts.append((f"variant{index}_hd", variant["encode_hd"]))
+        return multipart_response(parts, _reserve(executor, parts))
+    result_message = {
+        "status": True,
+        "image_base64_standard": bytes_2_base64(standard),
+    }
+    if encode_hd is not None:
+        result_message["image_base64_hd"] = bytes_2_base64(await encode_hd())
+    if variants:
+        result_message["variants"] = []
+        for variant in variants:
+            item = {
+                "height": variant["height"],
+                "width": variant["width"],
+                "image_base64_standard": bytes_2_base64(
+                    await variant["encode_standard"]()
+                ),
+            }
+            if variant["encode_hd"] is not None:
+                item["image_base64_hd"] = bytes_2_base64(await variant["encode_hd"]())
+            result_message["variants"].append(item)
+    return result_message
+
+
+async def outputs_result(
+    response_format: str,
+    outputs: List[Tuple[str, Callable[[], Awaitable[Encoded]]]],
+    executor=None,
+):
+    """
+    多张结果图像的成功响应，只编码实际返回的图像
+    :param outputs: [(名称, 编码该图像的协程函数)]，JSON 中的键为 image_base64_{名称}，
+        指定 kb 的图像另有 kb_info_{名称}。协商为图像时只返回第一张；multipart 时各部分按顺序编码并发送
+    :param executor: 协程函数使用的 BoundedExecutor，见 idphoto_result
+    """
+    if response_format == RESPONSE_IMAGE:
+        name, encode = outputs[0]
+        return image_response(await encode(), name)
+    if response_format == RESPONSE_MULTIPART:
+        return multipart_response(outputs, _reserve(executor, outputs))
+    result_message = {"status": True}
+    for name, encode in outputs:
+        data, info = split_encoded(await encode())
+        result_message[f"image_base64_{name}"] = bytes_2_base64(data)
+        if info is not None:
+            result_message[f"kb_info_{name}"] = kb_info_json(info)
+    return result_message
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+r"""
+@DATE: 2026/10/18 23:20
+@File: session_store.py
+@IDE: pycharm
+@Description:
+    编辑会话：上传一次图像后在服务端保留解码后的图像、抠图与人脸检测结果，
+    后续调整尺寸、背景色、水印、KB 大小时只需传会话 ID，不再上传、解码与推理
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
+import numpy as np
+from hivision.creator.context import ContextHandler
+from hivision.metrics import METRICS
+
+# 会话在最后一次访问后保留的秒数
+SESSION_TTL = float(os.getenv("HIVISION_SESSION_TTL", 600))
+# 同时保留的会话数上限，超出时淘汰最久未访问的会话，每个会话约占 30-60MB
+SESSION_MAX = int(os.getenv("HIVISION_SESSION_MAX", 16))
+
+
+class Session:
+    """
+    单个编辑会话。图像按接口间传递时客户端解码得到的格式保存，
+    可以直接作为各接口的输入
+    """
+
+    def __init__(
+        self,
+        image: np.ndarray,
+        matting_image: np.ndarray,
+        face: Optional[dict],
+        face_error: Optional[Exception],
+        detection_handler: ContextHandler,
+    ):
+        self.image = image
+        """
+        resize 到最大边长 2000 的 RGB 图像
+        """
+        # 抠图结果在同一会话的多次请求间共享，设为只读，需要修改的处理者自行复制
+        matting_image.setflags(write=False)
+        self.matting_image = matting_image
+        """
+        image 的抠图结果（RGBA）
+        """
+        self.face = face
+        """
+        image 的人脸检测结果，人脸数量不为 1 时为 None，异常保存在 face_error 中
+        """
+        self.face_error = face_error
+        self.detection_handler = detection_handler
+        """
+        人脸矫正后重新检测时使用的处理者
+        """
+        self.photos: Dict[str, np.ndarray] = {}
+        """
+        最近一次生成的透明证件照，键为 standard / hd，BGRA
+        """
+        self.backgrounds: Dict[str, np.ndarray] = {}
+        """
+        最近一次添加背景后的证件照，键为 standard / hd，BGR
+        """
+        self.expires_at = 0.0
+
+    def set_photos(self, standard: np.ndarray, hd: np.ndarray):
+        """
+        更新透明证件照，之前添加背景的结果随之失效
+        """
+        self.photos = {"standard": standard, "hd": hd}
+        self.backgrounds = {}
+
+
+class SessionStore:
+    """
+    带过期时间的会话表，每次访问会顺延过期时间，线程安全
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = SESSION_MAX):
+        self.ttl = ttl
+        self.max_sessions = max(1, max_sessions)
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, session: Session) -> str:
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._purge()
+            session.expires_at = time.monotonic() + self.ttl
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            self._update_gauge()
+        return session_id
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """
+        返回会话并顺延过期时间，不存在或已过期时返回 None
+        """
+        with self._lock:
+            self._purge()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.expires_at = time.monotonic() + self.ttl
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            deleted = self._sessions.pop(session_id, None) is not None
+            self._update_gauge()
+            return deleted
+
+    def __len__(self):
+        with self._lock:
+            self._purge()
+            return len(self._sessions)
+
+    def _purge(self):
+        # 按访问顺序排列，遇到第一个未过期的会话即可停止
+        now = time.monotonic()
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.expires_at > now:
+                break
+            del self._sessions[session_id]
+        self._update_gauge()
+
+    def _update_gauge(self):
+        METRICS.set_gauge("hivision_sessions", len(self._sessions))
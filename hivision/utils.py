@@ -5,7 +5,146 @@ import io
 import numpy as np
 import cv2
 import base64
+import math
+import os
+import struct
+import zlib
+from functools import lru_cache
 from hivision.plugin.watermark import Watermarker, WatermarkerStyles
+from hivision.metrics import METRICS
+
+# JPEG 压缩的最高质量
+JPEG_MAX_QUALITY = 95
+# JPEG 色度抽样：0 为 4:4:4，1 为 4:2:2，2 为 4:2:0
+JPEG_SUBSAMPLING = 2
+# 质量降到 1 仍超出目标大小时，最多缩小图像的次数
+JPEG_MAX_RESIZE_ROUNDS = 5
+
+
+# PNG 编码器：opencv 比 pillow 快约 15%，两者输出的像素一致
+PNG_ENCODER = os.getenv("HIVISION_PNG_ENCODER", "opencv")
+# zlib 压缩级别 0-9
+PNG_COMPRESSION = int(os.getenv("HIVISION_PNG_COMPRESSION", 6))
+# zlib 压缩策略：证件照大面积纯色或透明，rle 的体积与 default 接近，速度快数倍
+PNG_STRATEGY = os.getenv("HIVISION_PNG_STRATEGY", "rle")
+# WebP / JPEG-XL 的编码质量
+WEBP_QUALITY = int(os.getenv("HIVISION_WEBP_QUALITY", 95))
+JXL_QUALITY = int(os.getenv("HIVISION_JXL_QUALITY", 95))
+
+# zlib 策略取值，OpenCV 的 IMWRITE_PNG_STRATEGY_* 与 Pillow 的 compress_type 相同
+PNG_STRATEGIES = {
+    "default": zlib.Z_DEFAULT_STRATEGY,
+    "filtered": zlib.Z_FILTERED,
+    "huffman": zlib.Z_HUFFMAN_ONLY,
+    "rle": zlib.Z_RLE,
+    "fixed": zlib.Z_FIXED,
+}
+
+# PNG 签名 8 字节 + IHDR 块 25 字节，pHYs 块插入在其后
+_PNG_IHDR_END = 33
+
+
+def _png_phys_chunk(dpi: int) -> bytes:
+    pixels_per_meter = int(dpi / 0.0254 + 0.5)
+    data = b"pHYs" + struct.pack(">IIB", pixels_per_meter, pixels_per_meter, 1)
+    return struct.pack(">I", 9) + data + struct.pack(">I", zlib.crc32(data))
+
+
+def set_png_dpi(png_bytes: bytes, dpi: int) -> bytes:
+    """
+    在 PNG 的 IHDR 块之后插入 pHYs 块写入 DPI，无需重新编码
+    """
+    return png_bytes[:_PNG_IHDR_END] + _png_phys_chunk(dpi) + png_bytes[_PNG_IHDR_END:]
+
+
+def _to_bgr_order(image: np.ndarray) -> np.ndarray:
+    # 与 Image.fromarray 一致，输入数组按 RGB(A) 解释，OpenCV 编码前转换为 BGR(A)
+    if image.ndim == 3 and image.shape[2] == 3:
+        return cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    if image.ndim == 3 and image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_RGBA2BGRA)
+    return image
+
+
+def _encode_png_opencv(image, dpi, compression, strategy) -> bytes:
+    if image.ndim == 3 and image.shape[2] not in (3, 4):
+        return _encode_png_pillow(image, dpi, compression, strategy)
+    _, buffer = cv2.imencode(
+        ".png",
+        _to_bgr_order(image),
+        [cv2.IMWRITE_PNG_COMPRESSION, compression, cv2.IMWRITE_PNG_STRATEGY, strategy],
+    )
+    return set_png_dpi(buffer.tobytes(), dpi)
+
+
+def _encode_png_pillow(image, dpi, compression, strategy) -> bytes:
+    byte_stream = io.BytesIO()
+    Image.fromarray(image).save(
+        byte_stream,
+        format="PNG",
+        dpi=(dpi, dpi),
+        compress_level=compression,
+        compress_type=strategy,
+    )
+    return byte_stream.getvalue()
+
+
+PNG_ENCODERS = {
+    "opencv": _encode_png_opencv,
+    "pillow": _encode_png_pillow,
+}
+
+
+def encode_png(
+    image: np.ndarray, dpi: int = 300, encoder=None, compression=None, strategy=None
+) -> bytes:
+    """
+    把 RGB(A) 数组编码为带 DPI 信息的 PNG
+    :param encoder: opencv / pillow，默认为 HIVISION_PNG_ENCODER
+    :param compression: zlib 压缩级别 0-9，默认为 HIVISION_PNG_COMPRESSION
+    :param strategy: zlib 压缩策略，见 PNG_STRATEGIES，默认为 HIVISION_PNG_STRATEGY
+    """
+    encoder = encoder or PNG_ENCODER
+    strategy = strategy or PNG_STRATEGY
+    if encoder not in PNG_ENCODERS:
+        raise ValueError(f"PNG encoder must be one of {list(PNG_ENCODERS)}")
+    if strategy not in PNG_STRATEGIES:
+        raise ValueError(f"PNG strategy must be one of {list(PNG_STRATEGIES)}")
+    return PNG_ENCODERS[encoder](
+        image,
+        dpi,
+        PNG_COMPRESSION if compression is None else compression,
+        PNG_STRATEGIES[strategy],
+    )
+
+
+def available_image_formats():
+    """
+    当前 OpenCV 支持输出的格式，png 总是可用
+    """
+    formats = ["png"]
+    if cv2.haveImageWriter(".webp"):
+        formats.append("webp")
+    if cv2.haveImageWriter(".jxl"):
+        formats.append("jxl")
+    return formats
+
+
+def encode_image(image: np.ndarray, image_format: str = "png", dpi: int = 300) -> bytes:
+    """
+    按格式编码 RGB(A) 数组。WebP 与 JPEG-XL 保留透明通道，但不写入 DPI
+    :param image_format: png / webp / jxl
+    """
+    if image_format == "png":
+        return encode_png(image, dpi)
+    if image_format == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, WEBP_QUALITY]
+    elif image_format == "jxl" and "jxl" in available_image_formats():
+        params = [cv2.IMWRITE_JPEGXL_QUALITY, JXL_QUALITY]
+    else:
+        raise ValueError(f"image_format must be one of {available_image_formats()}")
+    _, buffer = cv2.imencode(f".{image_format}", _to_bgr_order(image), params)
+    return buffer.tobytes()
 
 
 def save_image_dpi_to_bytes(image: np.ndarray, output_image_path: str = None, dpi: int = 300):
@@ -16,13 +155,7 @@ def save_image_dpi_to_bytes(image: np.ndarray, output_image_path: str = None, dp
     :param output_image_path: Path to save the resized image. 保存调整大小后的图像的路径。
     :param dpi: int, 要设置的DPI值，默认为300
     """
-    image = Image.fromarray(image)
-    # 创建一个字节流对象
-    byte_stream = io.BytesIO()
-    # 将图像保存到字节流
-    image.save(byte_stream, format="PNG", dpi=(dpi, dpi))
-    # 获取字节流的内容
-    image_bytes = byte_stream.getvalue()
+    image_bytes = encode_png(image, dpi)
 
     # Save the image to the output path
     if output_image_path:
@@ -32,19 +165,7 @@ def save_image_dpi_to_bytes(image: np.ndarray, output_image_path: str = None, dp
     return image_bytes
 
 
-def resize_image_to_kb(input_image: np.ndarray, output_image_path: str = None, target_size_kb: int = 100, dpi: int = 300):
-    """
-    Resize an image to a target size in KB.
-    将图像调整大小至目标文件大小（KB）。
-
-    :param input_image_path: Path to the input image. 输入图像的路径。
-    :param output_image_path: Path to save the resized image. 保存调整大小后的图像的路径。
-    :param target_size_kb: Target size in KB. 目标文件大小（KB）。
-
-    Example:
-    resize_image_to_kb('input_image.jpg', 'output_image.jpg', 50)
-    """
-
+def _jpeg_image(input_image) -> Image.Image:
     if isinstance(input_image, np.ndarray):
         img = Image.fromarray(input_image)
     elif isinstance(input_image, Image.Image):
@@ -55,46 +176,138 @@ def resize_image_to_kb(input_image: np.ndarray, output_image_path: str = None, t
     # Convert image to RGB mode if it's not
     if img.mode != "RGB":
         img = img.convert("RGB")
+    return img
 
-    # Initial quality value
-    quality = 95
 
-    while True:
-        # Create a BytesIO object to hold the image data in memory
+def encode_jpeg_to_kb(
+    input_image,
+    target_size_kb: float,
+    dpi: int = None,
+    allow_resize: bool = False,
+):
+    """
+    在不超过目标大小的前提下，以尽可能高的质量编码 JPEG。
+    先尝试质量 95，超出时在 [1, 94] 内二分查找质量（最多再编码 7 次）；
+    质量为 1 仍超出且 allow_resize 为 True 时，按文件大小估算缩放比例缩小图像后重新查找。
+    色度抽样固定为 4:2:0（Pillow 默认值，已是压缩率最高的抽样方式）
+
+    :param input_image: 输入图像，NumPy 数组或 PIL 图像
+    :param target_size_kb: 目标文件大小（KB）
+    :param dpi: 写入 JPEG 的 DPI，为 None 时不写入
+    :param allow_resize: 质量降到 1 仍超出目标大小时是否缩小图像，默认保持原尺寸
+    :return: (JPEG 字节流, 编码信息)，编码信息包含 quality（质量）、scale（缩放比例）、
+        size_kb（编码后大小）、attempts（编码次数）、fits（是否满足目标大小）
+    """
+    img = _jpeg_image(input_image)
+    target_bytes = int(target_size_kb * 1024)
+    save_kwargs = dict(format="JPEG", subsampling=JPEG_SUBSAMPLING)
+    if dpi:
+        save_kwargs["dpi"] = (dpi, dpi)
+    attempts = 0
+
+    def encode(image, quality):
+        nonlocal attempts
+        attempts += 1
         img_byte_arr = io.BytesIO()
+        image.save(img_byte_arr, quality=quality, **save_kwargs)
+        return img_byte_arr.getvalue()
+
+    def search(image):
+        """
+        返回满足目标大小的最高质量及其编码结果，均不满足时返回 (None, 质量为 1 的编码结果)
+        """
+        data = encode(image, JPEG_MAX_QUALITY)
+        if len(data) <= target_bytes:
+            return JPEG_MAX_QUALITY, data
+        best_quality, best_data, smallest = None, None, data
+        low, high = 1, JPEG_MAX_QUALITY - 1
+        while low <= high:
+            quality = (low + high) // 2
+            data = encode(image, quality)
+            if len(data) <= target_bytes:
+                best_quality, best_data = quality, data
+                low = quality + 1
+            else:
+                smallest = data
+                high = quality - 1
+        if best_quality is None:
+            return None, smallest
+        return best_quality, best_data
+
+    scale = 1.0
+    image = img
+    quality, data = search(image)
+    for _ in range(JPEG_MAX_RESIZE_ROUNDS if allow_resize else 0):
+        if quality is not None:
+            break
+        # 文件大小约与像素数成正比，按面积比估算缩放比例并留出余量
+        scale *= min(0.9, math.sqrt(target_bytes / len(data)) * 0.95)
+        size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+        image = img.resize(size, Image.LANCZOS)
+        quality, data = search(image)
+
+    info = {
+        "quality": quality if quality is not None else 1,
+        "scale": scale,
+        "size_kb": len(data) / 1024,
+        "attempts": attempts,
+        "fits": quality is not None,
+    }
+    METRICS.observe("hivision_jpeg_encode_attempts", attempts)
+    return data, info
+
+
+def _pad_to_size(data: bytes, target_size_kb: float) -> bytes:
+    """
+    在 JPEG 结束标记之后补 0，使文件恰好为目标大小，超出时原样返回
+    """
+    padding_size = int(target_size_kb * 1024) - len(data)
+    if padding_size > 0:
+        return data + b"\x00" * padding_size
+    return data
+
+
+def resize_image_to_kb(
+    input_image: np.ndarray,
+    output_image_path: str = None,
+    target_size_kb: int = 100,
+    dpi: int = 300,
+    return_info: bool = False,
+    allow_resize: bool = False,
+):
+    """
+    Resize an image to a target size in KB.
+    将图像调整大小至目标文件大小（KB）。
+    以不超过目标大小的最高质量编码 JPEG，不足部分补 0；质量降到 1 仍超出时默认保持原尺寸，
+    返回超出目标大小的结果，此时编码信息中的 fits 为 False
 
-        # Save the image to the BytesIO object with the current quality
-        img.save(img_byte_arr, format="JPEG", quality=quality, dpi=(dpi, dpi))
-
-        # Get the size of the image in KB
-        img_size_kb = len(img_byte_arr.getvalue()) / 1024
-
-        # Check if the image size is within the target size
-        if img_size_kb <= target_size_kb or quality == 1:
-            # If the image is smaller than the target size, add padding
-            if img_size_kb < target_size_kb:
-                padding_size = int(
-                    (target_size_kb * 1024) - len(img_byte_arr.getvalue())
-                )
-                padding = b"\x00" * padding_size
-                img_byte_arr.write(padding)
+    :param input_image_path: Path to the input image. 输入图像的路径。
+    :param output_image_path: Path to save the resized image. 保存调整大小后的图像的路径。
+    :param target_size_kb: Target size in KB. 目标文件大小（KB）。
+    :param return_info: 为 True 时返回 (图像字节, 编码信息)，编码信息见 encode_jpeg_to_kb，
+        其中 size_kb 为补 0 之后的最终大小
+    :param allow_resize: 为 True 时，质量降到 1 仍超出目标大小则缩小图像，缩放比例见编码信息中的 scale
 
-            # Save the image to the output path
-            if output_image_path:
-                with open(output_image_path, "wb") as f:
-                    f.write(img_byte_arr.getvalue())
-            
-            return img_byte_arr.getvalue()
+    Example:
+    resize_image_to_kb('input_image.jpg', 'output_image.jpg', 50)
+    """
+    data, info = encode_jpeg_to_kb(
+        input_image, target_size_kb, dpi=dpi, allow_resize=allow_resize
+    )
+    data = _pad_to_size(data, target_size_kb)
+    info["size_kb"] = len(data) / 1024
 
-        # Reduce the quality if the image is still too large
-        quality -= 5
+    # Save the image to the output path
+    if output_image_path:
+        with open(output_image_path, "wb") as f:
+            f.write(data)
 
-        # Ensure quality does not go below 1
-        if quality < 1:
-            quality = 1
+    if return_info:
+        return data, info
+    return data
 
 
-def resize_image_to_kb_base64(input_image, target_size_kb, mode="exact"):
+def resize_image_to_kb_base64(input_image, target_size_kb, mode="exact", return_info=False):
     """
     Resize an image to a target size in KB and return it as a base64 encoded string.
     将图像调整大小至目标文件大小（KB）并返回base64编码的字符串。
@@ -102,69 +315,36 @@ def resize_image_to_kb_base64(input_image, target_size_kb, mode="exact"):
     :param input_image: Input image as a NumPy array or PIL Image. 输入图像，可以是NumPy数组或PIL图像。
     :param target_size_kb: Target size in KB. 目标文件大小（KB）。
     :param mode: Mode of resizing ('exact', 'max', 'min'). 模式：'exact'（精确大小）、'max'（不大于）、'min'（不小于）。
+    :param return_info: 为 True 时返回 (base64 字符串, 编码信息)，编码信息见 encode_jpeg_to_kb，
+        其中 size_kb 为补 0 之后的最终大小
 
     :return: Base64 encoded string of the resized image. 调整大小后的图像的base64编码字符串。
     """
-
-    if isinstance(input_image, np.ndarray):
-        img = Image.fromarray(input_image)
-    elif isinstance(input_image, Image.Image):
-        img = input_image
-    else:
-        raise ValueError("input_image must be a NumPy array or PIL Image.")
-
-    # Convert image to RGB mode if it's not
-    if img.mode != "RGB":
-        img = img.convert("RGB")
-
-    # Initial quality value
-    quality = 95
-
-    while True:
-        # Create a BytesIO object to hold the image data in memory
+    if mode == "min":
+        # 以最高质量编码，不足目标大小时补 0
         img_byte_arr = io.BytesIO()
-
-        # Save the image to the BytesIO object with the current quality
-        img.save(img_byte_arr, format="JPEG", quality=quality)
-
-        # Get the size of the image in KB
-        img_size_kb = len(img_byte_arr.getvalue()) / 1024
-
-        # Check based on the mode
+        _jpeg_image(input_image).save(
+            img_byte_arr, format="JPEG", quality=JPEG_MAX_QUALITY
+        )
+        data = _pad_to_size(img_byte_arr.getvalue(), target_size_kb)
+        info = {
+            "quality": JPEG_MAX_QUALITY,
+            "scale": 1.0,
+            "attempts": 1,
+            "fits": len(data) >= target_size_kb * 1024,
+        }
+    else:
+        # max 与 exact 的图像压缩相同，exact 还需要补 0 至目标大小
+        data, info = encode_jpeg_to_kb(input_image, target_size_kb, allow_resize=False)
         if mode == "exact":
-            # If the image size is equal to the target size, we can return it
-            if img_size_kb == target_size_kb:
-                break
-
-            # If the image is smaller than the target size, add padding
-            elif img_size_kb < target_size_kb:
-                padding_size = int(
-                    (target_size_kb * 1024) - len(img_byte_arr.getvalue())
-                )
-                padding = b"\x00" * padding_size
-                img_byte_arr.write(padding)
-                break
-
-        elif mode == "max":
-            # If the image size is within the target size, we can return it
-            if img_size_kb <= target_size_kb or quality == 1:
-                break
-
-        elif mode == "min":
-            # If the image size is greater than or equal to the target size, we can return it
-            if img_size_kb >= target_size_kb:
-                break
-
-        # Reduce the quality if the image is still too large
-        quality -= 5
-
-        # Ensure quality does not go below 1
-        if quality < 1:
-            quality = 1
+            data = _pad_to_size(data, target_size_kb)
+    info["size_kb"] = len(data) / 1024
 
     # Encode the image data to base64
-    img_base64 = base64.b64encode(img_byte_arr.getvalue()).decode("utf-8")
-    return "data:image/png;base64," + img_base64
+    img_base64 = "data:image/png;base64," + base64.b64encode(data).decode("utf-8")
+    if return_info:
+        return img_base64, info
+    return img_base64
 
 
 def numpy_2_base64(img: np.ndarray) -> str:
@@ -228,59 +408,108 @@ def hex_to_rgb(value):
     )
 
 
-def generate_gradient(start_color, width, height, mode="updown"):
-    # 定义背景颜色
-    end_color = (255, 255, 255)  # 白色
+# alpha 混合时每次处理的行数
+COMPOSITE_CHUNK_ROWS = 64
+
+
+# 中心渐变需要整张画布，只缓存少量尺寸（高清照尺寸下每张约 9MB）
+CENTER_GRADIENT_CACHE_SIZE = 4
+
+
+@lru_cache(maxsize=64)
+def gradient_ramp(start_color, length):
+    """
+    从 start_color 到白色的一维渐变，第 i 个颜色为 i / length 处的插值，按 (颜色, 长度) 缓存
+    :return: numpy.array(length, 3), uint8，只读
+    """
+    end_color = np.array((255, 255, 255), dtype=np.float64)  # 白色
+    start_color = np.array(start_color, dtype=np.float64)
+    i = np.arange(length, dtype=np.float64)[:, np.newaxis]
+    colors = (i / length) * end_color + ((length - i) / length) * start_color
+    colors = colors.astype(np.uint8)
+    colors.setflags(write=False)
+    return colors
+
+
+@lru_cache(maxsize=CENTER_GRADIENT_CACHE_SIZE)
+def _center_gradient(start_color, width, height):
+    # 半径为 end_axies - i 的同心圆依次由外向内填充第 i 种颜色，每个像素的颜色由包含它的最小的圆决定
+    end_axies = max(height, width)
+    colors = gradient_ramp(start_color, end_axies)
+    center_x, center_y = width // 2, height // 2
+    distance = np.hypot(
+        np.arange(height, dtype=np.float32)[:, np.newaxis] - center_y,
+        np.arange(width, dtype=np.float32)[np.newaxis, :] - center_x,
+    )
+    # 与 cv2.ellipse 的多边形近似相比，圆环边界上的像素可能相差一个色阶
+    radius = np.maximum(np.round(distance), 1).astype(np.int32)
+    gradient = colors[end_axies - radius]
+    gradient.setflags(write=False)
+    return gradient
 
-    # 创建一个空白图像
-    r_out = np.zeros((height, width), dtype=int)
-    g_out = np.zeros((height, width), dtype=int)
-    b_out = np.zeros((height, width), dtype=int)
 
+def gradient_background(start_color, width, height, mode="updown"):
+    """
+    生成从 start_color 到白色的渐变背景
+    :param start_color: tuple, 起始颜色，各通道按原顺序输出
+    :param width: int, 宽度
+    :param height: int, 高度
+    :param mode: updown 为上下渐变，只缓存一维渐变，返回广播视图，不占用整张画布的内存；
+        center 为从中心向外的径向渐变，缓存最近 CENTER_GRADIENT_CACHE_SIZE 个
+    :return: numpy.array(height, width, 3), uint8，只读
+    """
+    start_color = tuple(int(c) for c in start_color)
     if mode == "updown":
-        # 生成上下渐变色
-        for y in range(height):
-            r = int(
-                (y / height) * end_color[0] + ((height - y) / height) * start_color[0]
-            )
-            g = int(
-                (y / height) * end_color[1] + ((height - y) / height) * start_color[1]
-            )
-            b = int(
-                (y / height) * end_color[2] + ((height - y) / height) * start_color[2]
-            )
-            r_out[y, :] = r
-            g_out[y, :] = g
-            b_out[y, :] = b
+        # 第 y 行的颜色
+        colors = gradient_ramp(start_color, height)
+        return np.broadcast_to(colors[:, np.newaxis, :], (height, width, 3))
+    return _center_gradient(start_color, width, height)
 
-    else:
-        # 生成中心渐变色
-        img = np.zeros((height, width, 3))
-        # 定义椭圆中心和半径
-        center = (width // 2, height // 2)
-        end_axies = max(height, width)
-        # 定义渐变色
-        end_color = (255, 255, 255)
-        # 绘制椭圆
-        for y in range(end_axies):
-            axes = (end_axies - y, end_axies - y)
-            r = int(
-                (y / end_axies) * end_color[0]
-                + ((end_axies - y) / end_axies) * start_color[0]
-            )
-            g = int(
-                (y / end_axies) * end_color[1]
-                + ((end_axies - y) / end_axies) * start_color[1]
-            )
-            b = int(
-                (y / end_axies) * end_color[2]
-                + ((end_axies - y) / end_axies) * start_color[2]
-            )
-
-            cv2.ellipse(img, center, axes, 0, 0, 360, (b, g, r), -1)
-        b_out, g_out, r_out = cv2.split(np.uint64(img))
-
-    return r_out, g_out, b_out
+
+def generate_gradient(start_color, width, height, mode="updown"):
+    """
+    生成渐变背景，返回三个通道，各通道按 start_color 的顺序排列
+    """
+    gradient = gradient_background(start_color, width, height, mode=mode)
+    return gradient[:, :, 0], gradient[:, :, 1], gradient[:, :, 2]
+
+
+def alpha_composite(foreground, alpha, background):
+    """
+    定点数 alpha 混合：floor((fg * a + bg * (255 - a)) / 255)，全程使用 uint16，
+    按行分块并展平计算，临时数组保持在缓存友好的大小
+    :param foreground: numpy.array(h, w, 3), uint8
+    :param alpha: numpy.array(h, w), uint8
+    :param background: numpy.array(h, w, 3) 或纯色 (3,)，uint8
+    :return: numpy.array(h, w, 3), uint8
+    """
+    height, width = foreground.shape[:2]
+    background = np.asarray(background, dtype=np.uint8)
+    rows = COMPOSITE_CHUNK_ROWS
+    if background.ndim == 1:
+        # 纯色背景展开为一个分块大小，各分块复用
+        solid = np.tile(background.astype(np.uint16), rows * width)
+
+    output = np.empty((height, width, 3), dtype=np.uint8)
+    for start in range(0, height, rows):
+        stop = min(start + rows, height)
+        size = (stop - start) * width * 3
+        weight = np.repeat(alpha[start:stop].reshape(-1), 3).astype(np.uint16)
+        mixed = foreground[start:stop].astype(np.uint16).reshape(-1)
+        mixed *= weight
+        np.subtract(255, weight, out=weight)
+        if background.ndim == 1:
+            weight *= solid[:size]
+        else:
+            weight *= background[start:stop].reshape(-1)
+        mixed += weight
+        # x // 255 == (x + 1 + (x >> 8)) >> 8，对 0 <= x <= 255 * 255 成立
+        np.right_shift(mixed, 8, out=weight)
+        mixed += weight
+        mixed += 1
+        mixed >>= 8
+        output[start:stop] = mixed.reshape(stop - start, width, 3)
+    return output
 
 
 def add_background(input_image, bgr=(0, 0, 0), mode="pure_color"):
@@ -288,33 +517,25 @@ def add_background(input_image, bgr=(0, 0, 0), mode="pure_color"):
     本函数的功能为为透明图像加上背景。
     :param input_image: numpy.array(4 channels), 透明图像
     :param bgr: tuple, 合成纯色底时的 BGR 值
-    :param new_background: numpy.array(3 channels)，合成自定义图像底时的背景图
-    :return: output: 合成好的输出图像
+    :param mode: pure_color 为纯色，updown_gradient 为上下渐变，center_gradient 为中心渐变
+    :return: output: 合成好的输出图像，uint8
     """
     height, width = input_image.shape[0], input_image.shape[1]
-    try:
-        b, g, r, a = cv2.split(input_image)
-    except ValueError:
+    if input_image.ndim != 3 or input_image.shape[2] != 4:
         raise ValueError(
             "The input image must have 4 channels. 输入图像必须有4个通道，即透明图像。"
         )
 
-    a_cal = a / 255
+    bgr = tuple(int(c) for c in bgr)
     if mode == "pure_color":
         # 纯色填充
-        b2 = np.full([height, width], bgr[0], dtype=int)
-        g2 = np.full([height, width], bgr[1], dtype=int)
-        r2 = np.full([height, width], bgr[2], dtype=int)
+        background = np.array(bgr, dtype=np.uint8)
     elif mode == "updown_gradient":
-        b2, g2, r2 = generate_gradient(bgr, width, height, mode="updown")
+        background = gradient_background(bgr, width, height, mode="updown")
     else:
-        b2, g2, r2 = generate_gradient(bgr, width, height, mode="center")
+        background = gradient_background(bgr, width, height, mode="center")
 
-    output = cv2.merge(
-        ((b - b2) * a_cal + b2, (g - g2) * a_cal + g2, (r - r2) * a_cal + r2)
-    )
-
-    return output
+    return alpha_composite(input_image[:, :, :3], input_image[:, :, 3], background)
 
 def add_background_with_image(input_image: np.ndarray, background_image: np.ndarray) -> np.ndarray:
     """
@@ -324,9 +545,7 @@ def add_background_with_image(input_image: np.ndarray, background_image: np.ndar
     :return: output: 合成好的输出图像
     """
     height, width = input_image.shape[:2]
-    try:
-        b, g, r, a = cv2.split(input_image)
-    except ValueError:
+    if input_image.ndim != 3 or input_image.shape[2] != 4:
         raise ValueError(
             "The input image must have 4 channels. 输入图像必须有4个通道，即透明图像。"
         )
@@ -334,18 +553,8 @@ def add_background_with_image(input_image: np.ndarray, background_image: np.ndar
     # 确保背景图像与输入图像大小一致
     background_image = cv2.resize(background_image, (width, height), cv2.INTER_AREA)
     background_image = cv2.cvtColor(background_image, cv2.COLOR_BGR2RGB)
-    b2, g2, r2 = cv2.split(background_image)
-
-    a_cal = a / 255.0
-
-    # 修正混合公式
-    output = cv2.merge(
-        (b * a_cal + b2 * (1 - a_cal),
-         g * a_cal + g2 * (1 - a_cal),
-         r * a_cal + r2 * (1 - a_cal))
-    )
 
-    return output.astype(np.uint8)
+    return alpha_composite(input_image[:, :, :3], input_image[:, :, 3], background_image)
 
 def add_watermark(
     image, text, size=50, opacity=0.5, angle=45, color="#8B8B1B", space=75
@@ -1,7 +1,13 @@
 import os
 import cv2
+import csv
+import glob
+import json
+import time
 import argparse
 import numpy as np
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from hivision.error import FaceError
 from hivision.utils import hex_to_rgb, resize_image_to_kb, add_background, save_image_dpi_to_bytes
 from hivision import IDCreator
@@ -33,6 +39,8 @@ FACE_DETECT_MODEL = [
     "retinaface-resnet50",
 ]
 RENDER = [0, 1, 2]
+# 支持 --kb 的推理种类，其余种类始终输出 png
+KB_INFERENCE_TYPE = ["add_background", "generate_layout_photos"]
 
 parser = argparse.ArgumentParser(description="HivisionIDPhotos 证件照制作推理程序。")
 parser.add_argument(
@@ -42,8 +50,15 @@ parser.add_argument(
     choices=INFERENCE_TYPE,
     default="idphoto",
 )
-parser.add_argument("-i", "--input_image_dir", help="输入图像路径", required=True)
-parser.add_argument("-o", "--output_image_dir", help="保存图像路径", required=True)
+parser.add_argument(
+    "-i",
+    "--input_image_dir",
+    help="输入图像路径；传入目录、glob 通配符（需加引号）或 .txt 清单文件（每行一个路径）时进入批量模式",
+    required=True,
+)
+parser.add_argument(
+    "-o", "--output_image_dir", help="保存图像路径，批量模式下为输出目录", required=True
+)
 parser.add_argument("--height", help="证件照尺寸-高", default=413)
 parser.add_argument("--width", help="证件照尺寸-宽", default=295)
 parser.add_argument("-c", "--color", help="证件照背景色", default="638cce")
@@ -84,96 +99,360 @@ parser.add_argument(
     choices=FACE_DETECT_MODEL,
 )
 
-args = parser.parse_args()
+parser.add_argument(
+    "--workers",
+    type=int,
+    help="批量模式的工作进程数，每个进程只加载一次模型，默认为 CPU 核数",
+    default=os.cpu_count() or 1,
+)
+parser.add_argument(
+    "--report",
+    help="批量模式的逐图报告路径，支持 .csv 与 .json，默认为输出目录下的 report.csv",
+    default=None,
+)
+parser.add_argument(
+    "--overwrite",
+    action="store_true",
+    help="批量模式下忽略断点记录，重新处理所有图像",
+)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+CHECKPOINT_NAME = ".hivision_checkpoint.jsonl"
+REPORT_FIELDS = [
+    "input",
+    "output",
+    "status",
+    "error",
+    "read_time",
+    "process_time",
+    "total_time",
+]
 
-# ------------------- 选择抠图与人脸检测模型 -------------------
-creator = IDCreator()
-choose_handler(creator, args.matting_model, args.face_detect_model)
 
-root_dir = os.path.dirname(os.path.abspath(__file__))
-input_image = cv2.imread(args.input_image_dir, cv2.IMREAD_UNCHANGED)
+def warn_kb_not_met(output_path, kb, kb_info):
+    """
+    质量降到最低仍超出 --kb 时提示实际大小（图像保持原尺寸）
+    """
+    if not kb_info["fits"]:
+        print(
+            f"Warning: {output_path} is {kb_info['size_kb']:.1f}KB, "
+            f"larger than the target {kb}KB"
+        )
 
-# 如果模式是生成证件照
-if args.type == "idphoto":
-    # 将字符串转为元组
-    size = (int(args.height), int(args.width))
-    try:
+
+def process_image(creator, input_image, output_image_dir, args):
+    """
+    按 args.type 处理单张图像并保存结果
+    :param creator: 已选择好模型的 IDCreator
+    :param input_image: cv2.imread 读取的图像
+    :param output_image_dir: 保存图像路径
+    :param args: 命令行参数
+    """
+    # 如果模式是生成证件照
+    if args.type == "idphoto":
+        # 将字符串转为元组
+        size = (int(args.height), int(args.width))
         result = creator(input_image, size=size, face_alignment=args.face_align)
-    except FaceError:
-        print("人脸数量不等于 1，请上传单张人脸的图像。")
-    else:
         # 保存标准照
-        save_image_dpi_to_bytes(cv2.cvtColor(result.standard, cv2.COLOR_RGBA2BGRA), args.output_image_dir, dpi=args.dpi)
+        save_image_dpi_to_bytes(cv2.cvtColor(result.standard, cv2.COLOR_RGBA2BGRA), output_image_dir, dpi=args.dpi)
 
         # 保存高清照
-        file_name, file_extension = os.path.splitext(args.output_image_dir)
+        file_name, file_extension = os.path.splitext(output_image_dir)
         new_file_name = file_name + "_hd" + file_extension
         save_image_dpi_to_bytes(cv2.cvtColor(result.hd, cv2.COLOR_RGBA2BGRA), new_file_name, dpi=args.dpi)
 
-# 如果模式是人像抠图
-elif args.type == "human_matting":
-    result = creator(input_image, change_bg_only=True)
-    cv2.imwrite(args.output_image_dir, result.hd)
+    # 如果模式是人像抠图
+    elif args.type == "human_matting":
+        result = creator(input_image, change_bg_only=True)
+        cv2.imwrite(output_image_dir, result.hd)
+
+    # 如果模式是添加背景
+    elif args.type == "add_background":
+
+        render_choice = ["pure_color", "updown_gradient", "center_gradient"]
+
+        # 将字符串转为元组
+        color = hex_to_rgb(args.color)
+        # 将元祖的 0 和 2 号数字交换
+        color = (color[2], color[1], color[0])
+
+        result_image = add_background(
+            input_image, bgr=color, mode=render_choice[args.render]
+        )
+        result_image = result_image.astype(np.uint8)
+        result_image = cv2.cvtColor(result_image, cv2.COLOR_RGBA2BGRA)
+
+        if args.kb:
+            _, kb_info = resize_image_to_kb(
+                result_image, output_image_dir, int(args.kb), dpi=args.dpi, return_info=True
+            )
+            warn_kb_not_met(output_image_dir, args.kb, kb_info)
+        else:
+            save_image_dpi_to_bytes(cv2.cvtColor(result_image, cv2.COLOR_RGBA2BGRA), output_image_dir, dpi=args.dpi)
+
+    # 如果模式是生成排版照
+    elif args.type == "generate_layout_photos":
+
+        size = (int(args.height), int(args.width))
 
-# 如果模式是添加背景
-elif args.type == "add_background":
+        typography_arr, typography_rotate = generate_layout_array(
+            input_height=size[0], input_width=size[1]
+        )
+
+        result_layout_image = generate_layout_image(
+            input_image,
+            typography_arr,
+            typography_rotate,
+            height=size[0],
+            width=size[1],
+        )
 
-    render_choice = ["pure_color", "updown_gradient", "center_gradient"]
+        if args.kb:
+            result_layout_image = cv2.cvtColor(result_layout_image, cv2.COLOR_RGB2BGR)
+            _, kb_info = resize_image_to_kb(
+                result_layout_image, output_image_dir, int(args.kb), dpi=args.dpi, return_info=True
+            )
+            warn_kb_not_met(output_image_dir, args.kb, kb_info)
+        else:
+            save_image_dpi_to_bytes(cv2.cvtColor(result_layout_image, cv2.COLOR_RGBA2BGRA), output_image_dir, dpi=args.dpi)
 
-    # 将字符串转为元组
-    color = hex_to_rgb(args.color)
-    # 将元祖的 0 和 2 号数字交换
-    color = (color[2], color[1], color[0])
+    # 如果模式是证件照裁切
+    elif args.type == "idphoto_crop":
+        # 将字符串转为元组
+        size = (int(args.height), int(args.width))
+        result = creator(input_image, size=size, crop_only=True)
+        # 保存标准照
+        save_image_dpi_to_bytes(cv2.cvtColor(result.standard, cv2.COLOR_RGBA2BGRA), output_image_dir, dpi=args.dpi)
+
+        # 保存高清照
+        file_name, file_extension = os.path.splitext(output_image_dir)
+        new_file_name = file_name + "_hd" + file_extension
+        save_image_dpi_to_bytes(cv2.cvtColor(result.hd, cv2.COLOR_RGBA2BGRA), new_file_name, dpi=args.dpi)
 
-    result_image = add_background(
-        input_image, bgr=color, mode=render_choice[args.render]
+
+# ------------------- 批量模式 -------------------
+def is_batch_input(input_path):
+    return (
+        os.path.isdir(input_path)
+        or glob.has_magic(input_path)
+        or input_path.lower().endswith(".txt")
     )
-    result_image = result_image.astype(np.uint8)
-    result_image = cv2.cvtColor(result_image, cv2.COLOR_RGBA2BGRA)
-    
-    if args.kb:
-        resize_image_to_kb(result_image, args.output_image_dir, int(args.kb), dpi=args.dpi)
+
+
+def collect_inputs(input_path):
+    """
+    收集批量模式的输入图像，支持目录（递归）、glob 通配符与 .txt 清单文件
+    """
+    if os.path.isdir(input_path):
+        paths = glob.glob(os.path.join(input_path, "**", "*"), recursive=True)
+    elif input_path.lower().endswith(".txt"):
+        manifest_dir = os.path.dirname(os.path.abspath(input_path))
+        with open(input_path, "r", encoding="utf-8") as f:
+            paths = [
+                os.path.join(manifest_dir, line.strip())
+                for line in f
+                if line.strip() and not line.startswith("#")
+            ]
+        return paths
     else:
-        save_image_dpi_to_bytes(cv2.cvtColor(result_image, cv2.COLOR_RGBA2BGRA), args.output_image_dir, dpi=args.dpi)
+        paths = glob.glob(input_path, recursive=True)
+    return sorted(
+        path for path in paths if path.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def build_output_paths(input_paths, output_dir, kb=None, inference_type="idphoto"):
+    """
+    输出路径保留输入图像相对公共目录的子目录结构，避免同名文件互相覆盖。
+    设置 KB 值且推理种类支持 --kb（换底、排版照）时输出 jpg，否则输出 png，
+    抠图等结果保留透明通道
+    """
+    if not input_paths:
+        return []
+    root = os.path.commonpath(
+        [os.path.dirname(os.path.abspath(path)) for path in input_paths]
+    )
+    extension = ".jpg" if kb and inference_type in KB_INFERENCE_TYPE else ".png"
+    output_paths = []
+    for path in input_paths:
+        relative_path = os.path.relpath(os.path.abspath(path), root)
+        output_paths.append(
+            os.path.join(output_dir, os.path.splitext(relative_path)[0] + extension)
+        )
+    return output_paths
+
 
-# 如果模式是生成排版照
-elif args.type == "generate_layout_photos":
+def load_checkpoint(checkpoint_path):
+    """
+    读取断点记录，返回已成功处理的输入路径集合
+    """
+    finished = set()
+    if not os.path.exists(checkpoint_path):
+        return finished
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 中断时可能写入了不完整的最后一行
+                continue
+            if record.get("status") == "success":
+                finished.add(record["input"])
+    return finished
+
+
+_worker_creator = None
+_worker_args = None
+
+
+def init_worker(args):
+    """
+    工作进程初始化，每个进程只创建一次 IDCreator 并选择模型，模型会话在首次推理时加载后常驻
+    """
+    global _worker_creator, _worker_args
+    from hivision.creator.session_registry import SESSION_REGISTRY
+
+    # 多进程并行时限制每个进程内 onnxruntime 的线程数，避免线程数超过 CPU 核数
+    if not os.getenv("HIVISION_ORT_INTRA_OP_THREADS"):
+        SESSION_REGISTRY.sess_options.intra_op_num_threads = max(
+            1, (os.cpu_count() or 1) // max(1, args.workers)
+        )
+    _worker_args = args
+    _worker_creator = IDCreator()
+    choose_handler(_worker_creator, args.matting_model, args.face_detect_model)
+
+
+def run_worker(input_path, output_path):
+    """
+    在工作进程中处理一张图像，返回该图像的报告记录
+    """
+    record = dict(input=input_path, output=output_path, status="success", error="")
+    start_time = time.time()
+    try:
+        input_image = cv2.imread(input_path, cv2.IMREAD_UNCHANGED)
+        if input_image is None:
+            raise ValueError("无法读取图像")
+        read_end_time = time.time()
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        process_image(_worker_creator, input_image, output_path, _worker_args)
+        end_time = time.time()
+        record["read_time"] = round(read_end_time - start_time, 4)
+        record["process_time"] = round(end_time - read_end_time, 4)
+    except FaceError as e:
+        record["status"] = "face_error"
+        record["error"] = f"{e} (face_num={e.face_num})"
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = repr(e)
+    record["total_time"] = round(time.time() - start_time, 4)
+    return record
 
-    size = (int(args.height), int(args.width))
 
-    typography_arr, typography_rotate = generate_layout_array(
-        input_height=size[0], input_width=size[1]
+def write_json_report(report_path, checkpoint_path):
+    """
+    由断点记录重建 JSON 报告，包含之前各次运行的结果，同一输入保留最后一次的记录。
+    先写临时文件再替换，进程中断时不会留下空的或不完整的报告
+    """
+    records = {}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                records.pop(record["input"], None)
+                records[record["input"]] = record
+    tmp_path = f"{report_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(list(records.values()), f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, report_path)
+
+
+def run_batch(args):
+    """
+    批量模式：多进程并行处理，结果逐张写入输出目录、断点记录与报告
+    """
+    output_dir = args.output_image_dir
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint_path = os.path.join(output_dir, CHECKPOINT_NAME)
+    report_path = args.report or os.path.join(output_dir, "report.csv")
+
+    input_paths = collect_inputs(args.input_image_dir)
+    output_paths = build_output_paths(input_paths, output_dir, args.kb, args.type)
+    if args.overwrite and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    finished = load_checkpoint(checkpoint_path)
+    tasks = [
+        (input_path, output_path)
+        for input_path, output_path in zip(input_paths, output_paths)
+        if input_path not in finished
+    ]
+    print(
+        f"共 {len(input_paths)} 张图像，已完成 {len(input_paths) - len(tasks)} 张，"
+        f"本次处理 {len(tasks)} 张，工作进程数 {args.workers}"
     )
+    if not tasks:
+        return
+
+    is_csv_report = not report_path.lower().endswith(".json")
+    status_count = {}
+    start_time = time.time()
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint_file, open(
+        report_path, "a", newline="", encoding="utf-8"
+    ) if is_csv_report else nullcontext() as report_file:
+        csv_writer = None
+        if is_csv_report:
+            csv_writer = csv.DictWriter(report_file, fieldnames=REPORT_FIELDS)
+            if report_file.tell() == 0:
+                csv_writer.writeheader()
+
+        try:
+            with ProcessPoolExecutor(
+                max_workers=args.workers, initializer=init_worker, initargs=(args,)
+            ) as executor:
+                futures = [executor.submit(run_worker, *task) for task in tasks]
+                for index, future in enumerate(as_completed(futures), 1):
+                    record = future.result()
+                    status_count[record["status"]] = status_count.get(record["status"], 0) + 1
+                    # 逐张落盘，进程中断后重启可从断点继续
+                    checkpoint_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    checkpoint_file.flush()
+                    if csv_writer:
+                        csv_writer.writerow(record)
+                        report_file.flush()
+                    print(f"[{index}/{len(tasks)}] {record['status']} {record['input']}")
+        finally:
+            # JSON 报告无法追加，中断时也由断点记录重建，保留之前各次运行的结果
+            if not csv_writer:
+                checkpoint_file.flush()
+                write_json_report(report_path, checkpoint_path)
 
-    result_layout_image = generate_layout_image(
-        input_image,
-        typography_arr,
-        typography_rotate,
-        height=size[0],
-        width=size[1],
+    total_time = time.time() - start_time
+    print(
+        f"批量处理完成，耗时 {total_time:.1f}s，"
+        f"{len(tasks) / max(total_time, 1e-6):.2f} 张/秒，状态统计: {status_count}，报告: {report_path}"
     )
 
-    if args.kb:
-        result_layout_image = cv2.cvtColor(result_layout_image, cv2.COLOR_RGB2BGR)
-        result_layout_image = resize_image_to_kb(
-            result_layout_image, args.output_image_dir, int(args.kb), dpi=args.dpi
-        )
-    else:
-        save_image_dpi_to_bytes(cv2.cvtColor(result_layout_image, cv2.COLOR_RGBA2BGRA), args.output_image_dir, dpi=args.dpi)
 
-# 如果模式是证件照裁切
-elif args.type == "idphoto_crop":
-    # 将字符串转为元组
-    size = (int(args.height), int(args.width))
+def main():
+    args = parser.parse_args()
+
+    if is_batch_input(args.input_image_dir):
+        run_batch(args)
+        return
+
+    # ------------------- 选择抠图与人脸检测模型 -------------------
+    creator = IDCreator()
+    choose_handler(creator, args.matting_model, args.face_detect_model)
+
+    input_image = cv2.imread(args.input_image_dir, cv2.IMREAD_UNCHANGED)
+
     try:
-        result = creator(input_image, size=size, crop_only=True)
+        process_image(creator, input_image, args.output_image_dir, args)
     except FaceError:
         print("人脸数量不等于 1，请上传单张人脸的图像。")
-    else:
-        # 保存标准照
-        save_image_dpi_to_bytes(cv2.cvtColor(result.standard, cv2.COLOR_RGBA2BGRA), args.output_image_dir, dpi=args.dpi)
 
-        # 保存高清照
-        file_name, file_extension = os.path.splitext(args.output_image_dir)
-        new_file_name = file_name + "_hd" + file_extension
-        save_image_dpi_to_bytes(cv2.cvtColor(result.hd, cv2.COLOR_RGBA2BGRA), new_file_name, dpi=args.dpi)
\ No newline at end of file
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+r"""
+@DATE: 2026/10/18 17:10
+@File: benchmark_nms.py
+@IDE: pycharm
+@Description:
+    RetinaFace NMS 各实现的微基准测试，候选框模拟证件照场景：
+    少数几个人脸，每个人脸周围聚集大量高度重叠的候选框。
+    iou_matrix 为一次性计算 N×N IoU 矩阵的实现，仅作对照
+    python test/benchmark_nms.py
+"""
+import os
+import sys
+import timeit
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hivision.creator.retinaface.nms import cv2_nms, py_cpu_nms
+
+NMS_THRESHOLD = 0.2
+# (候选框数量, 人脸数量)
+CASES = [(50, 1), (200, 1), (1000, 1), (1000, 3), (2000, 2), (5000, 1)]
+
+
+def make_dets(num_candidates, num_faces, seed=0):
+    """
+    在 2000x1500 的图像上生成 num_faces 个人脸，候选框围绕人脸随机抖动
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform((300, 300), (1200, 1700), size=(num_faces, 2))
+    sizes = rng.uniform(200, 600, size=num_faces)
+    face_ids = rng.integers(0, num_faces, size=num_candidates)
+
+    cx = centers[face_ids, 0] + rng.normal(0, 0.05, num_candidates) * sizes[face_ids]
+    cy = centers[face_ids, 1] + rng.normal(0, 0.05, num_candidates) * sizes[face_ids]
+    size = sizes[face_ids] * rng.uniform(0.85, 1.15, num_candidates)
+    scores = rng.uniform(0.8, 1.0, num_candidates)
+    dets = np.stack(
+        (cx - size / 2, cy - size / 2, cx + size / 2, cy + size / 2, scores), axis=1
+    )
+    return dets.astype(np.float32)
+
+
+def iou_matrix_nms(dets, thresh):
+    """
+    一次性计算排序后候选框两两之间的 IoU 矩阵，再逐个保留
+    """
+    order = dets[:, 4].argsort()[::-1]
+    x1, y1, x2, y2 = (dets[order, i] for i in range(4))
+    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
+    w = np.maximum(0.0, np.minimum(x2[:, None], x2) - np.maximum(x1[:, None], x1) + 1)
+    h = np.maximum(0.0, np.minimum(y2[:, None], y2) - np.maximum(y1[:, None], y1) + 1)
+    inter = w * h
+    iou = inter / (areas[:, None] + areas - inter)
+
+    keep = []
+    remaining = np.ones(len(order), dtype=bool)
+    index = 0
+    while True:
+        keep.append(order[index])
+        remaining &= iou[index] <= thresh
+        remaining[: index + 1] = False
+        if not remaining.any():
+            break
+        index = int(np.argmax(remaining))
+    return keep
+
+
+def main():
+    print(
+        f"{'candidates':>10} {'faces':>6} {'numpy':>10} {'numpy(1)':>10} "
+        f"{'opencv':>10} {'iou_matrix':>11} {'opencv==numpy':>14}"
+    )
+    for num_candidates, num_faces in CASES:
+        dets = make_dets(num_candidates, num_faces)
+        expected = py_cpu_nms(dets, NMS_THRESHOLD)
+        assert list(py_cpu_nms(dets, NMS_THRESHOLD, single_face=True)) == list(expected[:2])
+        if num_candidates <= 2000:
+            assert list(iou_matrix_nms(dets, NMS_THRESHOLD)) == list(expected)
+
+        number = 20
+        functions = [
+            py_cpu_nms,
+            lambda d, t: py_cpu_nms(d, t, single_face=True),
+            cv2_nms,
+        ]
+        if num_candidates <= 2000:
+            functions.append(iou_matrix_nms)
+        timings = [
+            timeit.timeit(lambda: fn(dets, NMS_THRESHOLD), number=number) / number * 1000
+            for fn in functions
+        ]
+        same = sorted(cv2_nms(dets, NMS_THRESHOLD)) == sorted(expected)
+        columns = [f"{t:>8.3f}ms" for t in timings[:3]]
+        columns.append(f"{timings[3]:>9.3f}ms" if len(timings) > 3 else f"{'-':>11}")
+        print(
+            f"{num_candidates:>10} {num_faces:>6} " + " ".join(columns) + f" {str(same):>14}"
+        )
+    print("\nnumpy(1) 为证件照单人脸提前结束模式；iou_matrix 的内存与耗时随候选框数平方增长")
+
+
+if __name__ == "__main__":
+    main()
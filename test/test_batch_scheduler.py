@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+r"""
+@DATE: 2026/10/19 10:20
+@File: test_batch_scheduler.py
+@IDE: pycharm
+@Description:
+    微批调度器与有界执行器的排队计数测试：等待合并的请求计入 in_flight，
+    名额用尽时返回 429，结束后名额全部释放
+    python -m pytest test/test_batch_scheduler.py 或 python test/test_batch_scheduler.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hivision.batch_scheduler import MicroBatcher
+from hivision.error import APIError
+from hivision.executor import BoundedExecutor
+
+
+def slow_batch_fn(key, items):
+    time.sleep(0.05)
+    return [item * 2 for item in items]
+
+
+def test_waiting_requests_count_toward_capacity():
+    async def main():
+        executor = BoundedExecutor(max_workers=1, max_queue=2)
+        batcher = MicroBatcher(slow_batch_fn, max_batch_size=8, max_wait_ms=20, executor=executor)
+        tasks = [asyncio.ensure_future(batcher.submit("model", i)) for i in range(3)]
+        await asyncio.sleep(0)
+        assert executor.in_flight == 3
+        assert executor.queue_depth == 2
+
+        try:
+            await batcher.submit("model", 3)
+            raise AssertionError("超出容量的请求应被拒绝")
+        except APIError as e:
+            assert e.status_code == 429
+
+        assert await asyncio.gather(*tasks) == [0, 2, 4]
+        assert executor.in_flight == 0
+        executor.shutdown()
+
+    asyncio.run(main())
+
+
+def test_shutdown_rejects_with_503():
+    async def main():
+        executor = BoundedExecutor(max_workers=1, max_queue=1)
+        batcher = MicroBatcher(slow_batch_fn, executor=executor)
+        executor.shutdown()
+        try:
+            await batcher.submit("model", 1)
+            raise AssertionError("执行器关闭后应拒绝请求")
+        except APIError as e:
+            assert e.status_code == 503
+        assert executor.in_flight == 0
+
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    for test in (test_waiting_requests_count_toward_capacity, test_shutdown_rejects_with_503):
+        test()
+        print(f"{test.__name__} ok")
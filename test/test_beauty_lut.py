@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+r"""
+@DATE: 2026/10/19 10:40
+@File: test_beauty_lut.py
+@IDE: pycharm
+@Description:
+    美颜点运算直接计算与融合查找表的逐像素一致性测试，图像宽度覆盖非向量宽度整数倍的情况
+    python -m pytest test/test_beauty_lut.py 或 python test/test_beauty_lut.py
+"""
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hivision.plugin.beauty.beauty_lut as beauty_lut
+
+# (美白, 亮度, 对比度, 锐化, 饱和度)
+PARAMS = [(2, 0, 0, 0, 0), (0, 10, 20, 0, 0), (0, 0, 0, 0, 30), (3, -5, 10, 2, -20)]
+
+
+def apply_with_min_uses(min_uses, image, alpha, params):
+    original = beauty_lut.BEAUTY_LUT_MIN_USES
+    beauty_lut.BEAUTY_LUT_MIN_USES = min_uses
+    try:
+        return beauty_lut.apply_beauty(image, alpha, *params)
+    finally:
+        beauty_lut.BEAUTY_LUT_MIN_USES = original
+
+
+def test_direct_matches_lut():
+    rng = np.random.default_rng(0)
+    for height, width in ((97, 131), (413, 295)):
+        image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        alpha = rng.integers(0, 256, (height, width), dtype=np.uint8)
+        for params in PARAMS:
+            direct = apply_with_min_uses(10**9, image, alpha, params)
+            fused = apply_with_min_uses(1, image, alpha, params)
+            assert np.array_equal(direct, fused), params
+
+
+def test_lut_built_after_min_uses():
+    beauty_lut._use_counts.clear()
+    params = (1, 0, 0, 7)
+    uses = [beauty_lut.use_fused_lut(*params) for _ in range(beauty_lut.BEAUTY_LUT_MIN_USES)]
+    assert not any(uses[:-1]) and uses[-1]
+
+
+if __name__ == "__main__":
+    for test in (test_direct_matches_lut, test_lut_built_after_min_uses):
+        test()
+        print(f"{test.__name__} ok")
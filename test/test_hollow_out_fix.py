@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+r"""
+@DATE: 2026/10/19 00:10
+@File: test_hollow_out_fix.py
+@IDE: pycharm
+@Description:
+    hollow_out_fix 与原实现的逐像素一致性测试，覆盖空洞、多个连通域、细颈、
+    贴边与随机噪声等抠图结果
+    python -m pytest test/test_hollow_out_fix.py 或 python test/test_hollow_out_fix.py
+"""
+import os
+import sys
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hivision.creator.human_matting import hollow_out_fix
+
+
+def hollow_out_fix_reference(src: np.ndarray) -> np.ndarray:
+    """
+    原实现：拆分通道、四周补 0、5x5 腐蚀 3 次、按面积排序轮廓后整图泛洪填充
+    """
+    b, g, r, a = cv2.split(src)
+    src_bgr = cv2.merge((b, g, r))
+    add_area = np.zeros((10, a.shape[1]), np.uint8)
+    a = np.vstack((add_area, a, add_area))
+    add_area = np.zeros((a.shape[0], 10), np.uint8)
+    a = np.hstack((add_area, a, add_area))
+    _, a_threshold = cv2.threshold(a, 127, 255, 0)
+    a_erode = cv2.erode(
+        a_threshold,
+        kernel=cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5)),
+        iterations=3,
+    )
+    contours, hierarchy = cv2.findContours(
+        a_erode, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE
+    )
+    contours = [x for x in contours]
+    contours.sort(key=lambda c: cv2.contourArea(c), reverse=True)
+    a_contour = cv2.drawContours(np.zeros(a.shape, np.uint8), contours[0], -1, 255, 2)
+    h, w = a.shape[:2]
+    mask = np.zeros([h + 2, w + 2], np.uint8)
+    cv2.floodFill(a_contour, mask=mask, seedPoint=(0, 0), newVal=255)
+    a = cv2.add(a, 255 - a_contour)
+    return cv2.merge((src_bgr, a[10:-10, 10:-10]))
+
+
+def make_matte(height, width, seed=0, holes=3, blobs=2, blur=15):
+    """
+    模拟人像抠图结果：椭圆人像带若干空洞与细颈，另有几个小连通域，边缘羽化
+    """
+    rng = np.random.default_rng(seed)
+    alpha = np.zeros((height, width), np.uint8)
+    center = (width // 2, height // 2 + height // 8)
+    axes = (width // 3, height // 2 - height // 10)
+    cv2.ellipse(alpha, center, axes, 0, 0, 360, 255, -1)
+    cv2.circle(alpha, (width // 2, height // 4), max(width // 8, 3), 255, -1)
+    for _ in range(holes):
+        hole_center = (
+            int(rng.integers(width // 3, 2 * width // 3)),
+            int(rng.integers(height // 3, 2 * height // 3)),
+        )
+        cv2.circle(alpha, hole_center, int(rng.integers(3, max(width // 12, 4))), 0, -1)
+    # 从边缘切入的细缝，轮廓在此处收窄
+    cv2.line(alpha, (0, height // 2), (width // 3, height // 2), 0, 2)
+    for _ in range(blobs):
+        blob_center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        cv2.circle(alpha, blob_center, int(rng.integers(5, max(width // 15, 6))), 255, -1)
+    if blur:
+        alpha = cv2.GaussianBlur(alpha, (blur, blur), 0)
+    bgr = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return cv2.merge((bgr, alpha))
+
+
+def assert_same(src):
+    expected = hollow_out_fix_reference(src.copy())
+    actual = hollow_out_fix(src.copy())
+    assert actual.shape == expected.shape and actual.dtype == expected.dtype
+    assert np.array_equal(actual, expected), np.argwhere(actual != expected)[:10]
+
+
+def test_synthetic_mattes():
+    for seed in range(20):
+        for height, width in ((2000, 1500), (413, 295), (640, 480), (97, 131)):
+            assert_same(make_matte(height, width, seed=seed))
+
+
+def test_unblurred_and_touching_border():
+    for seed in range(10):
+        matte = make_matte(600, 450, seed=seed, blur=0)
+        assert_same(matte)
+        # 人像贴住图像的左、右、下边缘
+        matte[:, :, 3][300:, :] = 255
+        assert_same(matte)
+
+
+def test_random_noise():
+    rng = np.random.default_rng(1)
+    for seed in range(10):
+        matte = make_matte(300, 240, seed=seed, blur=0)
+        noise = rng.integers(0, 256, matte.shape[:2], dtype=np.uint8)
+        matte[:, :, 3] = cv2.GaussianBlur(cv2.max(matte[:, :, 3], noise), (5, 5), 0)
+        assert_same(matte)
+
+
+def test_in_place():
+    matte = make_matte(413, 295)
+    bgr = matte[:, :, :3].copy()
+    assert hollow_out_fix(matte) is matte
+    assert np.array_equal(matte[:, :, :3], bgr)
+
+
+def test_demo_images():
+    # 用阈值分割近似抠图结果，覆盖真实照片的不规则轮廓
+    image_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "demo", "images")
+    for name in sorted(os.listdir(image_dir)):
+        image = cv2.imread(os.path.join(image_dir, name))
+        if image is None:
+            continue
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        _, alpha = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        assert_same(cv2.merge((image, cv2.GaussianBlur(alpha, (9, 9), 0))))
+
+
+if __name__ == "__main__":
+    for test in (
+        test_synthetic_mattes,
+        test_unblurred_and_touching_border,
+        test_random_noise,
+        test_in_place,
+        test_demo_images,
+    ):
+        test()
+        print(f"{test.__name__} ok")
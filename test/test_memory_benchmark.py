@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+r"""
+@DATE: 2026/10/19 01:00
+@File: test_memory_benchmark.py
+@IDE: pycharm
+@Description:
+    IDCreator 单次调用的内存峰值基准，防止整图复制、通道拆分合并重新引入流水线。
+    抠图使用真实的 extract_human，只把模型推理替换为合成的 MODNet 输出；
+    人脸检测直接给出人脸框。峰值由 tracemalloc 统计（numpy 与 OpenCV 返回的数组），
+    以输入图像（resize 后 2000x1500x3）的字节数为单位，超出预算时测试失败
+    python -m pytest test/test_memory_benchmark.py 或 python test/test_memory_benchmark.py
+"""
+import os
+import sys
+import tracemalloc
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hivision.creator.human_matting as human_matting
+from hivision import IDCreator
+from hivision.creator.human_matting import extract_human, modnet_postprocess
+
+HEIGHT, WIDTH = 2000, 1500
+FRAME_BYTES = HEIGHT * WIDTH * 3
+
+# 场景名 -> (IDCreator 参数, 内存峰值预算（输入图像字节数的倍数）)
+CASES = {
+    "idphoto": (dict(), 3.25),
+    "idphoto_beauty_full": (
+        dict(whitening_strength=2, brightness_strength=5, sharpen_strength=5),
+        5.0,
+    ),
+    "idphoto_beauty_face": (
+        dict(whitening_strength=2, sharpen_strength=5, beauty_region="face"),
+        3.25,
+    ),
+    "idphoto_alignment": (dict(face_alignment=True), 7.0),
+    "idphoto_crop_first": (dict(crop_first=True), 2.5),
+    "change_bg_only": (dict(change_bg_only=True), 3.0),
+}
+
+
+def fake_modnet(input_image, checkpoint_path, ref_size=512):
+    """
+    代替 ONNX 推理，返回椭圆人像的 MODNet 输出并照常后处理
+    """
+    matte = np.zeros((ref_size, ref_size), np.float32)
+    cv2.ellipse(
+        matte, (ref_size // 2, ref_size * 5 // 8), (ref_size // 3, ref_size * 3 // 8),
+        0, 0, 360, 1.0, -1,
+    )
+    cv2.circle(matte, (ref_size // 2, ref_size // 4), ref_size // 8, 1.0, -1)
+    matte = cv2.GaussianBlur(matte, (9, 9), 0)
+    return modnet_postprocess(matte[None, None], input_image)
+
+
+def fake_detection(roll_angle):
+    def detect(ctx):
+        height, width = ctx.origin_image.shape[:2]
+        ctx.face["rectangle"] = (width * 0.38, height * 0.16, width * 0.24, height * 0.2)
+        ctx.face["roll_angle"] = roll_angle
+
+    return detect
+
+
+def make_image(seed=0):
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 256, (HEIGHT // 8, WIDTH // 8, 3), dtype=np.uint8)
+    return cv2.resize(image, (WIDTH, HEIGHT), interpolation=cv2.INTER_LINEAR)
+
+
+def measure(kwargs):
+    """
+    :return: IDCreator 调用期间新分配内存的峰值（字节），不含输入图像
+    """
+    original = human_matting.get_modnet_matting
+    human_matting.get_modnet_matting = fake_modnet
+    try:
+        creator = IDCreator()
+        image = make_image()
+        roll_angle = 10 if kwargs.get("face_alignment") else 0
+        call = lambda: creator(
+            image,
+            matting_handler=extract_human,
+            detection_handler=fake_detection(roll_angle),
+            **kwargs,
+        )
+        # 预热：查找表、渐变背景等缓存不计入单次请求
+        call()
+        tracemalloc.start()
+        try:
+            start, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            result = call()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del result
+    finally:
+        human_matting.get_modnet_matting = original
+    return peak - start
+
+
+def check(name):
+    kwargs, budget = CASES[name]
+    peak = measure(kwargs)
+    assert peak <= budget * FRAME_BYTES, (
+        f"{name}: peak {peak / FRAME_BYTES:.2f}x frame exceeds budget {budget}x"
+    )
+
+
+def test_idphoto():
+    check("idphoto")
+
+
+def test_idphoto_beauty_full():
+    check("idphoto_beauty_full")
+
+
+def test_idphoto_beauty_face():
+    check("idphoto_beauty_face")
+
+
+def test_idphoto_alignment():
+    check("idphoto_alignment")
+
+
+def test_idphoto_crop_first():
+    check("idphoto_crop_first")
+
+
+def test_change_bg_only():
+    check("change_bg_only")
+
+
+def main():
+    print(f"{'case':>22} {'peak':>10} {'frames':>7} {'budget':>7}")
+    for name, (kwargs, budget) in CASES.items():
+        peak = measure(kwargs)
+        print(
+            f"{name:>22} {peak / 2 ** 20:>8.1f}MB {peak / FRAME_BYTES:>6.2f}x {budget:>6.1f}x"
+        )
+    print(f"\n输入图像 {HEIGHT}x{WIDTH}x3 = {FRAME_BYTES / 2 ** 20:.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
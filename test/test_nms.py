@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+r"""
+@DATE: 2026/10/19 10:00
+@File: test_nms.py
+@IDE: pycharm
+@Description:
+    numpy 与 opencv 两种 NMS 后端在多人脸候选框上的人脸数量一致性测试，
+    覆盖得分最高的候选框全部聚集在同一人脸上的情况
+    python -m pytest test/test_nms.py 或 python test/test_nms.py
+"""
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hivision.creator.retinaface.nms import nms
+
+# 与 retinaface.inference 的 nms_threshold 一致
+NMS_THRESHOLD = 0.2
+
+
+def make_clustered_dets(num_faces, per_face=20, seed=0):
+    """
+    每个人脸周围聚集 per_face 个高度重叠的候选框，第一个人脸的候选框得分全部高于其他人脸
+    """
+    rng = np.random.default_rng(seed)
+    dets = []
+    for face in range(num_faces):
+        cx, cy, size = 300 + 500 * face, 600, 300
+        jitter = rng.normal(0, 0.03, (per_face, 2)) * size
+        x1, y1 = cx - size / 2 + jitter[:, 0], cy - size / 2 + jitter[:, 1]
+        scores = rng.uniform(0.9, 0.99, per_face) - 0.1 * face
+        dets.append(np.stack((x1, y1, x1 + size, y1 + size, scores), axis=1))
+    return np.concatenate(dets).astype(np.float32)
+
+
+def test_backends_agree_on_face_count():
+    for num_faces in (1, 2, 3):
+        for seed in range(5):
+            dets = make_clustered_dets(num_faces, seed=seed)
+            numpy_keep = nms(dets, NMS_THRESHOLD, backend="numpy")
+            opencv_keep = nms(dets, NMS_THRESHOLD, backend="opencv")
+            assert len(numpy_keep) == len(opencv_keep) == num_faces
+
+
+def test_single_face_keeps_second_face():
+    for num_faces in (1, 2, 3):
+        for seed in range(5):
+            dets = make_clustered_dets(num_faces, seed=seed)
+            expected = min(num_faces, 2)
+            for backend in ("numpy", "opencv"):
+                keep = nms(dets, NMS_THRESHOLD, backend=backend, single_face=True)
+                assert len(keep) == expected, (backend, num_faces, keep)
+
+
+if __name__ == "__main__":
+    for test in (test_backends_agree_on_face_count, test_single_face_keeps_second_face):
+        test()
+        print(f"{test.__name__} ok")
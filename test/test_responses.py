@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+r"""
+@DATE: 2026/10/19 11:20
+@File: test_responses.py
+@IDE: pycharm
+@Description:
+    响应格式协商与 multipart 流式响应的测试：浏览器默认 Accept 仍返回 JSON，
+    multipart 在响应开始之前预留执行器名额，发送途中不会因执行器繁忙而中断
+    python -m pytest test/test_responses.py 或 python test/test_responses.py
+"""
+import asyncio
+import gc
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hivision.error import APIError
+from hivision.executor import BoundedExecutor
+from hivision.responses import (
+    RESPONSE_IMAGE,
+    RESPONSE_JSON,
+    RESPONSE_MULTIPART,
+    idphoto_result,
+    negotiate_format,
+)
+
+CHROME_ACCEPT = (
+    "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,"
+    "image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7"
+)
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 16
+
+
+def test_negotiate_format():
+    cases = {
+        None: RESPONSE_JSON,
+        "": RESPONSE_JSON,
+        "*/*": RESPONSE_JSON,
+        CHROME_ACCEPT: RESPONSE_JSON,
+        "image/png": RESPONSE_IMAGE,
+        "image/*": RESPONSE_IMAGE,
+        "image/webp, image/png;q=0.9": RESPONSE_IMAGE,
+        "image/jpeg, application/json;q=0.5": RESPONSE_JSON,
+        "multipart/mixed": RESPONSE_MULTIPART,
+        "image/png;q=0.5, multipart/mixed": RESPONSE_MULTIPART,
+        "image/png;q=0": RESPONSE_JSON,
+    }
+    for accept, expected in cases.items():
+        assert negotiate_format(accept) == expected, accept
+
+
+async def read_body(response):
+    return b"".join([chunk async for chunk in response.body_iterator])
+
+
+def test_multipart_reserves_before_response():
+    async def main():
+        executor = BoundedExecutor(max_workers=1, max_queue=0)
+
+        async def encode_hd():
+            return await executor.run(lambda: PNG)
+
+        response = await idphoto_result(
+            RESPONSE_MULTIPART, PNG, encode_hd, executor=executor
+        )
+        # 名额已被预留，此时其他请求被拒绝，而响应中的延迟编码照常执行
+        assert executor.in_flight == 1
+        try:
+            await executor.run(lambda: None)
+            raise AssertionError("名额已满时应拒绝请求")
+        except APIError as e:
+            assert e.status_code == 429
+        body = await read_body(response)
+        assert body.count(b"image/png") == 2
+        assert executor.in_flight == 0
+
+        # 名额不足时在响应开始之前返回 429
+        with executor.slot():
+            try:
+                await idphoto_result(RESPONSE_MULTIPART, PNG, encode_hd, executor=executor)
+                raise AssertionError("名额已满时应拒绝请求")
+            except APIError as e:
+                assert e.status_code == 429
+        assert executor.in_flight == 0
+
+        # 响应未发送就被丢弃时释放名额
+        response = await idphoto_result(
+            RESPONSE_MULTIPART, PNG, encode_hd, executor=executor
+        )
+        assert executor.in_flight == 1
+        del response
+        gc.collect()
+        assert executor.in_flight == 0
+        executor.shutdown()
+
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    for test in (test_negotiate_format, test_multipart_reserves_before_response):
+        test()
+        print(f"{test.__name__} ok")
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+r"""
+@DATE: 2026/10/19 14:00
+@File: test_whitening.py
+@IDE: pycharm
+@Description:
+    美白直接逐次处理与合成查找表的逐像素一致性测试，以及合成查找表的触发条件
+    python -m pytest test/test_whitening.py 或 python test/test_whitening.py
+"""
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hivision.plugin.beauty.whitening as whitening
+from hivision.plugin.beauty.whitening import MakeWhiter
+
+
+def test_passes_match_composed_table():
+    whiter = whitening.make_whiter
+    image = np.random.default_rng(0).integers(0, 256, (97, 131, 3), dtype=np.uint8)
+    for strength in (3, 10, 12, 25, 30):
+        composed = whiter.lut_white.apply(image, whiter.composed_table(strength))
+        assert np.array_equal(whiter.run_passes(image, strength), composed), strength
+
+
+def test_compose_after_min_uses():
+    whiter = MakeWhiter(cache_size=1)
+    image = np.zeros((4, 4, 3), dtype=np.uint8)
+    for _ in range(whitening.WHITENING_COMPOSE_MIN_USES - 1):
+        whiter.run_iterated(image, 15)
+        # 单次美白的强度从不合成
+        whiter.run_iterated(image, 5)
+    assert whiter.composed_table.cache_info().currsize == 0
+    whiter.run_iterated(image, 15)
+    assert whiter.composed_table.cache_info().currsize == 1
+
+
+if __name__ == "__main__":
+    for test in (test_passes_match_composed_table, test_compose_after_min_uses):
+        test()
+        print(f"{test.__name__} ok")